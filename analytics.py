@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+
+import print_history
+
+UNKNOWN_VENDOR = "Unknown"
+
+
+class VersionedCache:
+  """
+  Keep query results until the print history usage version changes.
+
+  Reading the version is a single-row lookup, so a cache hit costs one small
+  query instead of an aggregation over the history.
+  """
+
+  def __init__(self, max_entries: int = 64):
+    self.max_entries = max_entries
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key, compute):
+    version = print_history.get_usage_version()
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[0] == version:
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    # Computed outside the lock; a concurrent write only leads to a recompute on the next call
+    value = compute()
+    with self._lock:
+      self._entries[key] = (version, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+    return value
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+
+
+_cache = VersionedCache()
+
+
+def clear_cache() -> None:
+  _cache.clear()
+
+
+def _spool_index(spools: list[dict]) -> dict:
+  return {spool["id"]: spool for spool in spools}
+
+
+def _spool_prices(spools: list[dict]) -> dict[int, float]:
+  return {spool["id"]: spool["cost_per_gram"] for spool in spools if spool.get("cost_per_gram")}
+
+
+def _vendor(spool: dict | None) -> str:
+  vendor = ((spool or {}).get("filament") or {}).get("vendor") or {}
+  return vendor.get("name") or UNKNOWN_VENDOR
+
+
+def _rounded(entry: dict) -> dict:
+  for field in ("grams_used", "cost", "unpriced_grams"):
+    entry[field] = round(entry[field], 2)
+  return entry
+
+
+def usage_per_spool(spools: list[dict]) -> list[dict]:
+  """Prints, grams and cost per spool, most used first. ``unpriced_grams`` is usage whose price is unknown."""
+  by_id = _spool_index(spools)
+  prices = _spool_prices(spools)
+  costs = _cache.get(("spool_cost", frozenset(prices.items())), lambda: print_history.get_spool_cost(prices))
+  result = []
+  for row in _cache.get("spool", print_history.get_usage_by_spool):
+    spool = by_id.get(row["spool_id"])
+    filament = (spool or {}).get("filament") or {}
+    cost = costs.get(row["spool_id"], {"cost": 0.0, "unpriced_grams": 0.0})
+    result.append(_rounded({
+      "spool_id": row["spool_id"],
+      "name": filament.get("name"),
+      "vendor": _vendor(spool),
+      "material": filament.get("material"),
+      "print_count": row["print_count"],
+      "grams_used": row["grams_used"],
+      "cost": cost["cost"],
+      "unpriced_grams": cost["unpriced_grams"],
+    }))
+  return sorted(result, key=lambda entry: entry["grams_used"], reverse=True)
+
+
+def usage_per_vendor(spools: list[dict]) -> list[dict]:
+  """Grams and cost per spool vendor, most used first. Usage without an assigned spool is not included."""
+  totals = {}
+  for spool in usage_per_spool(spools):
+    entry = totals.setdefault(
+      spool["vendor"], {"vendor": spool["vendor"], "spool_count": 0, "grams_used": 0.0, "cost": 0.0, "unpriced_grams": 0.0}
+    )
+    entry["spool_count"] += 1
+    for field in ("grams_used", "cost", "unpriced_grams"):
+      entry[field] += spool[field]
+  return sorted(map(_rounded, totals.values()), key=lambda entry: entry["grams_used"], reverse=True)
+
+
+def usage_per_material(spools: list[dict]) -> list[dict]:
+  """Filament entries, grams and cost per material, most used first."""
+  prices = _spool_prices(spools)
+  rows = _cache.get(("material", frozenset(prices.items())), lambda: print_history.get_material_cost(prices))
+  return [
+    _rounded({
+      "material": row["filament_type"],
+      "usage_count": row["usage_count"],
+      "grams_used": row["grams_used"],
+      "cost": row["cost"],
+      "unpriced_grams": row["unpriced_grams"],
+    })
+    for row in rows
+  ]
+
+
+def usage_per_day(spools: list[dict], start_day: str | None = None, end_day: str | None = None) -> list[dict]:
+  """Prints, grams and cost per day (YYYY-MM-DD), oldest first, optionally limited to a day range."""
+  prices = _spool_prices(spools)
+  rows = _cache.get(
+    ("day", start_day, end_day, frozenset(prices.items())),
+    lambda: print_history.get_daily_cost(prices, start_day, end_day),
+  )
+  return [_rounded(dict(row)) for row in rows]
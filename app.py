@@ -1,11 +1,13 @@
+import contextlib
 import json
 import math
 import os
+import threading
 import traceback
 import uuid
 from collections import Counter
 
-from flask import Flask, request, render_template, redirect, url_for
+from flask import Flask, Response, abort, get_template_attribute, jsonify, request, render_template, redirect, send_from_directory, stream_with_context, url_for
 
 from config import (
     BASE_URL,
@@ -14,7 +16,7 @@ from config import (
     EXTERNAL_SPOOL_AMS_ID,
     EXTERNAL_SPOOL_ID,
     PRINTER_NAME,
-    CLEAR_ASSIGNMENT_WHEN_EMPTY,
+    PRINT_HISTORY_ARCHIVE_DAYS,
 )
 from filament import generate_filament_brand_code, generate_filament_temperatures
 from frontend_utils import color_is_dark
@@ -23,8 +25,16 @@ import mqtt_bambulab
 import print_history as print_history_service
 import spoolman_client
 import spoolman_service
+import analytics
+import history_export
+import fragment_cache
+import live_updates
+import spool_index
 import test_data
-from spoolman_service import augmentTrayDataWithSpoolMan, trayUid
+import thumbnails
+from history_archive import HistoryArchiver
+from spoolman_service import trayUid
+from tray_views import TRAY_VIEWS, thaw
 
 _TEST_PATCH_CONTEXT = None
 if test_data.TEST_MODE_FLAG:
@@ -43,8 +53,44 @@ LAYER_TRACKING_STATUS_DISPLAY = {
 if not USE_TEST_DATA:
   mqtt_bambulab.init_mqtt()
 
+HISTORY_ARCHIVER = HistoryArchiver()
+if PRINT_HISTORY_ARCHIVE_DAYS > 0 and not USE_TEST_DATA and not READ_ONLY_MODE:
+  HISTORY_ARCHIVER.start()
+
+
+def backfill_filament_costs() -> int:
+  """
+  Price the live and archived filament usage recorded before costs were
+  stored. Entries of spools without a known price stay unpriced, so the next
+  start tries them again.
+  """
+  try:
+    spools = mqtt_bambulab.fetchSpools(cached=True)
+    prices = {spool["id"]: spool["cost_per_gram"] for spool in spools if spool.get("cost_per_gram")}
+    updated = print_history_service.backfill_filament_costs(prices)
+    if updated:
+      print(f"[print-history] Priced {updated} filament usage entries")
+    return updated
+  except Exception as exc:
+    print(f"[print-history] Pricing filament usage failed: {exc}")
+    return 0
+  finally:
+    print_history_service.close_connections()
+
+
+# Once per start, off the request path: loading the spool prices waits for SpoolMan
+if not USE_TEST_DATA and not READ_ONLY_MODE:
+  threading.Thread(target=backfill_filament_costs, name="cost-backfill", daemon=True).start()
+
 app = Flask(__name__)
 
+# Part of every API ETag: the in-memory version counters restart with the process
+API_ETAG_EPOCH = uuid.uuid4().hex[:8]
+API_PRINTS_MAX_LIMIT = 200
+SPOOL_PICKER_PAGE_SIZE = 50
+# Query arguments the spool pickers filter by; the other arguments belong to the page
+SPOOL_PICKER_FILTER_ARGS = ("material", "vendor", "q", "color", "offset")
+
 @app.context_processor
 def fronted_utilities():
   printer_model = mqtt_bambulab.getPrinterModel() or {}
@@ -60,6 +106,58 @@ def fronted_utilities():
     EXTERNAL_SPOOL_ID=EXTERNAL_SPOOL_ID,
     PRINTER_MODEL=printer_model,
     PRINTER_NAME=PRINTER_NAME,
+    print_thumbnail=print_thumbnail,
+    tray_fragment=tray_fragment,
+    humidity_fragment=humidity_fragment,
+    spool_list_fragment=spool_list_fragment,
+  )
+
+
+def _image_url(image_file):
+  if thumbnails.HASHED_NAME.match(image_file):
+    return url_for('thumbnail', filename=image_file)
+  return url_for('static', filename='prints/' + image_file)
+
+
+def print_thumbnail(image_file):
+  """URLs for a print image: the resized variants when available and the original."""
+  variants = thumbnails.thumbnail_variants(image_file)
+  if not variants:
+    return None
+  full = _image_url(variants["original"])
+  return {
+    "src": _image_url(variants["png"]) if "png" in variants else full,
+    "webp": _image_url(variants["webp"]) if "webp" in variants else None,
+    "full": full,
+  }
+
+
+def tray_fragment(trays, ams_id, tray_id, pick_tray=False, current_spool=None, tag_id=None):
+  """fragments/tray.html for a tray of a TraySnapshot, rendered again only when that tray changed."""
+  key = ('fragments/tray.html', str(ams_id), str(tray_id), pick_tray, (current_spool or {}).get("id"), tag_id)
+  return fragment_cache.FRAGMENT_CACHE.get(key, trays.revision(ams_id, tray_id), lambda: render_template(
+    'fragments/tray.html',
+    tray_data=trays.tray(ams_id, tray_id) or {},
+    ams_id=ams_id,
+    tray_id=tray_id,
+    pick_tray=pick_tray,
+    current_spool=current_spool,
+    tag_id=tag_id,
+  ))
+
+
+def humidity_fragment(trays, ams):
+  """The humidity and temperature of an AMS, rendered again only when its readings changed."""
+  key = ('fragments/ams_metrics.html', str(ams["id"]))
+  humidity_display = get_template_attribute('fragments/ams_metrics.html', 'humidity_display')
+  return fragment_cache.FRAGMENT_CACHE.get(key, trays.revision(ams["id"]), lambda: humidity_display(ams))
+
+
+def spool_list_fragment(picker, **options):
+  """fragments/list_spools.html for a spool picker page, rendered again when the inventory, the filters or the page options change."""
+  key = ('fragments/list_spools.html', picker["key"]) + tuple(sorted(options.items()))
+  return fragment_cache.FRAGMENT_CACHE.get(
+    key, spoolman_service.get_spools_version(), lambda: render_template('fragments/list_spools.html', picker=picker, **options)
   )
 
 
@@ -87,20 +185,6 @@ def build_ams_labels(ams_data):
   return labels
 
 
-def _augment_tray(spool_list, tray_data, ams_id, tray_id):
-  augmentTrayDataWithSpoolMan(spool_list, tray_data, ams_id, tray_id)
-  if tray_data.get("unmapped_bambu_tag"):
-    spoolman_service.clear_active_spool_for_tray(ams_id, tray_id)
-    augmentTrayDataWithSpoolMan(spool_list, tray_data, ams_id, tray_id)
-  empty_condition = (
-      CLEAR_ASSIGNMENT_WHEN_EMPTY
-      and not tray_data.get("spool_material")
-      and not tray_data.get("unmapped_bambu_tag")
-  )
-  if empty_condition:
-    spoolman_service.clear_active_spool_for_tray(ams_id, tray_id)
-    mqtt_bambulab.clear_ams_tray_assignment(ams_id, tray_id)
-
 @app.route("/issue")
 def issue():
   if not mqtt_bambulab.isMqttClientConnected():
@@ -111,25 +195,10 @@ def issue():
   if not all([ams_id, tray_id]):
     return render_template('error.html', exception="Missing AMS ID, or Tray ID.")
 
-  fix_ams = None
-  tray_data = None
-
   spool_list = mqtt_bambulab.fetchSpools()
-  last_ams_config = mqtt_bambulab.getLastAMSConfig()
-  if ams_id == EXTERNAL_SPOOL_AMS_ID:
-    fix_ams = last_ams_config.get("vt_tray", {})
-    tray_data = fix_ams
-  else:
-    for ams in last_ams_config.get("ams", []):
-      if str(ams["id"]) == str(ams_id):
-        fix_ams = ams
-        break
-
-  if fix_ams:
-    for tray in fix_ams.get("tray", []):
-      if str(tray["id"]) == str(tray_id):
-        tray_data = tray
-        break
+  trays = TRAY_VIEWS.current()
+  tray_data = trays.tray(ams_id, tray_id)
+  fix_ams = next((ams for ams in trays.ams if str(ams["id"]) == str(ams_id)), tray_data)
 
   active_spool = None
   for spool in spool_list:
@@ -137,9 +206,6 @@ def issue():
       active_spool = spool
       break
 
-  if tray_data:
-    _augment_tray(spool_list, tray_data, ams_id, tray_id)
-
   #TODO: Determine issue
   #New bambulab spool
   #Tray empty, but spoolman has record
@@ -168,33 +234,11 @@ def fill():
     setActiveSpool(ams_id, tray_id, spool_data)
     return redirect(url_for('home', success_message=f"Updated Spool ID {spool_id} to AMS {ams_id}, Tray {tray_id}."))
   else:
-    spools = mqtt_bambulab.fetchSpools()
-
-    materials = extract_materials(spools)
-    selected_materials = []
-
-    try:
-      last_ams_config = mqtt_bambulab.getLastAMSConfig()
-      default_material = None
-
-      if ams_id == EXTERNAL_SPOOL_AMS_ID:
-        default_material = last_ams_config.get("vt_tray", {}).get("tray_type")
-      else:
-        for ams in last_ams_config.get("ams", []):
-          if str(ams.get("id")) != str(ams_id):
-            continue
-
-          for tray in ams.get("tray", []):
-            if str(tray.get("id")) == str(tray_id):
-              default_material = tray.get("tray_type")
-              break
+    spools = mqtt_bambulab.fetchSpools(cached=True, max_age=spoolman_service.SPOOLS_MAX_AGE_SECONDS)
+    default_material = (TRAY_VIEWS.current().tray(ams_id, tray_id) or {}).get("tray_type")
+    picker = spool_picker(spools, [default_material])
 
-      if default_material and default_material in materials:
-        selected_materials.append(default_material)
-    except Exception:
-      pass
-
-    return render_template('fill.html', spools=spools, ams_id=ams_id, tray_id=tray_id, materials=materials, selected_materials=selected_materials)
+    return render_template('fill.html', picker=picker, ams_id=ams_id, tray_id=tray_id)
 
 @app.route("/assign_bambu_spool")
 def assign_bambu_spool():
@@ -228,39 +272,15 @@ def assign_bambu_spool():
 
     return redirect(url_for('home', success_message=f"Linked Bambu spool to SpoolMan spool {spool_id} on AMS {ams_id}, Tray {tray_id}."))
 
-  spools = mqtt_bambulab.fetchSpools()
-  materials = extract_materials(spools)
-  selected_materials = []
-
-  try:
-    last_ams_config = mqtt_bambulab.getLastAMSConfig()
-    default_material = None
-
-    if ams_id == EXTERNAL_SPOOL_AMS_ID:
-      default_material = last_ams_config.get("vt_tray", {}).get("tray_type")
-    else:
-      for ams in last_ams_config.get("ams", []):
-        if str(ams.get("id")) != str(ams_id):
-          continue
-
-        for tray in ams.get("tray", []):
-          if str(tray.get("id")) == str(tray_id):
-            default_material = tray.get("tray_type")
-            break
-
-    if default_material and default_material in materials:
-      selected_materials.append(default_material)
-  except Exception:
-    pass
+  spools = mqtt_bambulab.fetchSpools(cached=True, max_age=spoolman_service.SPOOLS_MAX_AGE_SECONDS)
+  default_material = (TRAY_VIEWS.current().tray(ams_id, tray_id) or {}).get("tray_type")
 
   return render_template(
     'assign_bambu_spool.html',
-    spools=spools,
+    picker=spool_picker(spools, [default_material]),
     ams_id=ams_id,
     tray_id=tray_id,
     bambu_tag=bambu_tag,
-    materials=materials,
-    selected_materials=selected_materials,
   )
 
 @app.route("/spool_info")
@@ -271,25 +291,13 @@ def spool_info():
   try:
     tag_id = request.args.get("tag_id")
     spool_id = request.args.get("spool_id")
-    last_ams_config = mqtt_bambulab.getLastAMSConfig()
-    ams_data = last_ams_config.get("ams", [])
-    vt_tray_data = last_ams_config.get("vt_tray", {})
-    spool_list = mqtt_bambulab.fetchSpools()
-
-    issue = False
-    #TODO: Fix issue when external spool info is reset via bambulab interface
-    _augment_tray(spool_list, vt_tray_data, EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID)
-    issue |= vt_tray_data.get("issue", False)
-
-    for ams in ams_data:
-      for tray in ams["tray"]:
-        _augment_tray(spool_list, tray, ams["id"], tray["id"])
-        issue |= tray.get("issue", False)
 
     if not tag_id and not spool_id:
       return render_template('error.html', exception="TAG ID or spool_id is required as a query parameter (e.g., ?tag_id=RFID123 or ?spool_id=1)")
 
     spools = mqtt_bambulab.fetchSpools()
+    trays = TRAY_VIEWS.current()
+    ams_data, vt_tray_data, issue = trays.ams, trays.vt_tray, trays.issue
     current_spool = None
 
     spool_id_int = None
@@ -323,7 +331,8 @@ def spool_info():
 
     if current_spool:
       ams_labels = build_ams_labels(ams_data)
-      return render_template('spool_info.html', tag_id=tag_id, current_spool=current_spool, ams_data=ams_data, vt_tray_data=vt_tray_data, issue=issue, ams_labels=ams_labels)
+      spool_usage = print_history_service.get_spool_usage(current_spool["id"])
+      return render_template('spool_info.html', tag_id=tag_id, current_spool=current_spool, trays=trays, ams_data=ams_data, vt_tray_data=vt_tray_data, issue=issue, ams_labels=ams_labels, spool_usage=spool_usage)
     else:
       return render_template('error.html', exception="Spool not found")
   except Exception as e:
@@ -417,34 +426,75 @@ def setActiveSpool(ams_id, tray_id, spool_data):
   print(ams_message)
   mqtt_bambulab.publish(mqtt_bambulab.getMqttClient(), ams_message)
 
+def _runout_forecast():
+  return [entry for entry in mqtt_bambulab.getRunoutForecast() if entry["runout_layer"] is not None]
+
+
+def _live_layout(ams_data, ams_labels):
+  """Identifies the set of cards on the home page; live updates reload the page when it changes."""
+  return json.dumps([[ams["id"], ams_labels.get(ams["id"]), [tray["id"] for tray in ams["tray"]]] for ams in ams_data])
+
+
+def _live_state():
+  """The home page fragments pushed by /events, keyed by their data-live-id."""
+  if not mqtt_bambulab.isMqttClientConnected():
+    return {"layout": "disconnected", "fragments": {}}
+
+  trays = TRAY_VIEWS.current()
+  fragments = {
+    "print-progress": render_template('fragments/print_progress.html', print_progress=mqtt_bambulab.getPrintProgress()),
+    "runout-forecast": render_template('fragments/runout_forecast.html', runout_forecast=_runout_forecast()),
+    f"tray-{EXTERNAL_SPOOL_AMS_ID}-{EXTERNAL_SPOOL_ID}": str(tray_fragment(trays, EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID)),
+  }
+  for ams in trays.ams:
+    fragments[f"humidity-{ams['id']}"] = str(humidity_fragment(trays, ams))
+    for tray in ams["tray"]:
+      fragments[f"tray-{ams['id']}-{tray['id']}"] = str(tray_fragment(trays, ams["id"], tray["id"]))
+
+  return {"layout": _live_layout(trays.ams, build_ams_labels(trays.ams)), "fragments": fragments}
+
+
 @app.route("/")
 def home():
   if not mqtt_bambulab.isMqttClientConnected():
     return render_template('error.html', exception="MQTT is disconnected. Is the printer online?")
 
   try:
-    last_ams_config = mqtt_bambulab.getLastAMSConfig()
-    ams_data = last_ams_config.get("ams", [])
-    vt_tray_data = last_ams_config.get("vt_tray", {})
-    spool_list = mqtt_bambulab.fetchSpools()
     success_message = request.args.get("success_message")
-    
-    issue = False
-    #TODO: Fix issue when external spool info is reset via bambulab interface
-    _augment_tray(spool_list, vt_tray_data, EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID)
-    issue |= vt_tray_data["issue"]
-
-    for ams in ams_data:
-      for tray in ams["tray"]:
-        _augment_tray(spool_list, tray, ams["id"], tray["id"])
-        issue |= tray["issue"]
-
+    trays = TRAY_VIEWS.current()
+    ams_data = trays.ams
     ams_labels = build_ams_labels(ams_data)
-    return render_template('index.html', success_message=success_message, ams_data=ams_data, vt_tray_data=vt_tray_data, issue=issue, ams_labels=ams_labels)
+    return render_template(
+      'index.html',
+      success_message=success_message,
+      trays=trays,
+      ams_data=ams_data,
+      vt_tray_data=trays.vt_tray,
+      issue=trays.issue,
+      ams_labels=ams_labels,
+      runout_forecast=_runout_forecast(),
+      print_progress=mqtt_bambulab.getPrintProgress(),
+      live_layout=_live_layout(ams_data, ams_labels),
+    )
   except Exception as e:
     traceback.print_exc()
     return render_template('error.html', exception=str(e))
 
+
+@app.route("/events")
+def live_events():
+  if not live_updates.LIVE_UPDATES.acquire_client():
+    # EventSource does not reconnect after a 204; the page still works with manual reloads
+    return Response(status=204)
+
+  response = Response(
+    stream_with_context(live_updates.LIVE_UPDATES.stream(_live_state)),
+    mimetype="text/event-stream",
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+  )
+  response.call_on_close(live_updates.LIVE_UPDATES.release_client)
+  return response
+
 def sort_spools(spools):
   def condition(item):
     # Ensure the item has an "extra" key and is a dictionary
@@ -458,26 +508,51 @@ def sort_spools(spools):
   return sorted(spools, key=lambda spool: bool(condition(spool)))
 
 
-def extract_materials(spools):
-  materials = set()
-
-  for spool in spools:
-    filament = None
-
-    if isinstance(spool, dict):
-      filament = spool.get("filament")
-    else:
-      filament = getattr(spool, "filament", None)
-
-    if isinstance(filament, dict):
-      material = filament.get("material")
-    else:
-      material = getattr(filament, "material", None)
-
-    if material:
-      materials.add(material)
-
-  return sorted(materials)
+def spool_picker(spools, default_materials=(), order=None):
+  """
+  The page of ``spools`` matching the filters in the query string, for
+  fragments/list_spools.html. Without a ``material`` argument the page's
+  ``default_materials`` are selected; ``order`` sorts the matches unless they
+  are sorted by color distance.
+  """
+  index = spool_index.current(spools)
+  if "material" in request.args:
+    selected_materials = [material for material in request.args.getlist("material") if material in index.materials]
+  else:
+    selected_materials = [material for material in default_materials if material in index.materials]
+  search_args = {
+    name: request.args.get(name, "").strip()
+    for name in ("q", "vendor", "color")
+    if request.args.get(name, "").strip()
+  }
+
+  matches = index.search(selected_materials, search_args.get("vendor"), search_args.get("q"), search_args.get("color"))
+  if order and not spool_index.hex_color(search_args.get("color")):
+    matches = order(matches)
+  offset = max(request.args.get("offset", 0, type=int), 0)
+  page = matches[offset:offset + SPOOL_PICKER_PAGE_SIZE]
+
+  # Everything else in the query string (tray, tag, print...) is carried along in the filter form and links
+  page_args = [(name, value) for name, value in request.args.items(multi=True) if name not in SPOOL_PICKER_FILTER_ARGS]
+  link_args = dict(page_args, **search_args)
+  more_url = None
+  if offset + len(page) < len(matches):
+    more_url = url_for(request.endpoint, **link_args, material=selected_materials or "", offset=offset + len(page))
+
+  return {
+    "key": (tuple(selected_materials), tuple(sorted(search_args.items())), tuple(page_args), offset),
+    "spools": page,
+    "total": len(matches),
+    "inventory": len(index.spools),
+    "offset": offset,
+    "materials": index.materials,
+    "selected_materials": selected_materials,
+    "vendors": index.vendors,
+    "search_args": search_args,
+    "page_args": page_args,
+    "all_materials_url": url_for(request.endpoint, **link_args, material=""),
+    "more_url": more_url,
+  }
 
 @app.route("/assign_tag")
 def assign_tag():
@@ -485,16 +560,9 @@ def assign_tag():
     return render_template('error.html', exception="MQTT is disconnected. Is the printer online?")
 
   try:
-    spools = sort_spools(mqtt_bambulab.fetchSpools())
+    spools = mqtt_bambulab.fetchSpools(cached=True, max_age=spoolman_service.SPOOLS_MAX_AGE_SECONDS)
 
-    materials = extract_materials(spools)
-    selected_materials = []
-    requested_material = request.args.get("material")
-
-    if requested_material and requested_material in materials:
-      selected_materials.append(requested_material)
-
-    return render_template('assign_tag.html', spools=spools, materials=materials, selected_materials=selected_materials)
+    return render_template('assign_tag.html', picker=spool_picker(spools, order=sort_spools))
   except Exception as e:
     traceback.print_exc()
     return render_template('error.html', exception=str(e))
@@ -512,6 +580,7 @@ def write_tag():
     spoolman_client.patchExtraTags(spool_id, {}, {
       "tag": json.dumps(myuuid),
     })
+    spoolman_service.expire_spools()
     return render_template('write_tag.html', myuuid=myuuid)
   except Exception as e:
     traceback.print_exc()
@@ -521,6 +590,160 @@ def write_tag():
 def health():
   return "OK", 200
 
+@app.route('/thumbnails/<filename>')
+def thumbnail(filename):
+  # Hashed names never change content, so browsers may cache them forever.
+  if not thumbnails.HASHED_NAME.match(filename):
+    abort(404)
+  response = send_from_directory(thumbnails.THUMBNAIL_DIR, filename, max_age=thumbnails.THUMBNAIL_MAX_AGE)
+  response.headers["Cache-Control"] = f"public, max-age={thumbnails.THUMBNAIL_MAX_AGE}, immutable"
+  return response
+
+@app.route('/api/runout_forecast', methods=['GET'])
+def runout_forecast():
+  return jsonify({"spools": mqtt_bambulab.getRunoutForecast()})
+
+@app.route('/api/analytics/daily', methods=['GET'])
+def analytics_daily():
+  start_day = request.args.get("from") or None
+  end_day = request.args.get("to") or None
+  return jsonify({"days": analytics.usage_per_day(mqtt_bambulab.fetchSpools(cached=True), start_day, end_day)})
+
+@app.route('/api/analytics/materials', methods=['GET'])
+def analytics_materials():
+  return jsonify({"materials": analytics.usage_per_material(mqtt_bambulab.fetchSpools(cached=True))})
+
+@app.route('/api/analytics/vendors', methods=['GET'])
+def analytics_vendors():
+  return jsonify({"vendors": analytics.usage_per_vendor(mqtt_bambulab.fetchSpools(cached=True))})
+
+@app.route('/api/analytics/spools', methods=['GET'])
+def analytics_spools():
+  return jsonify({"spools": analytics.usage_per_spool(mqtt_bambulab.fetchSpools(cached=True))})
+
+
+def _versioned_json(name, version, build):
+  """
+  JSON response with a strong ETag for ``version``; ``build`` only runs when the
+  client does not already hold that version, otherwise the answer is a 304.
+  """
+  etag = f"{name}-{API_ETAG_EPOCH}-{version}"
+  if request.if_none_match.contains(etag):
+    response = Response(status=304)
+  else:
+    response = jsonify(build())
+  response.set_etag(etag)
+  # Clients may keep the body but have to revalidate before using it
+  response.headers["Cache-Control"] = "no-cache"
+  return response
+
+
+def _api_trays():
+  snapshot = TRAY_VIEWS.current()
+  trays = [dict(thaw(snapshot.vt_tray), ams_id=EXTERNAL_SPOOL_AMS_ID, tray_id=EXTERNAL_SPOOL_ID)]
+  for ams in snapshot.ams:
+    trays.extend(dict(thaw(tray), ams_id=ams["id"], tray_id=tray["id"]) for tray in ams["tray"])
+  return {"issue": snapshot.issue, "trays": trays}
+
+
+def _api_printer():
+  ams_data = TRAY_VIEWS.current().ams
+  ams_labels = build_ams_labels(ams_data)
+  return {
+    "name": PRINTER_NAME,
+    "model": mqtt_bambulab.getPrinterModel(),
+    "connected": mqtt_bambulab.isMqttClientConnected(),
+    "progress": mqtt_bambulab.getPrintProgress(),
+    "ams": [
+      {
+        "id": ams["id"],
+        "label": ams_labels.get(ams["id"]),
+        "humidity": ams.get("humidity"),
+        "humidity_raw": ams.get("humidity_raw"),
+        "temp": ams.get("temp"),
+      }
+      for ams in ams_data
+    ],
+    "runout_forecast": _runout_forecast(),
+  }
+
+
+def _api_prints(limit, before, after, filters):
+  history_page = print_history_service.get_prints_page(limit, before=before, after=after, filters=filters)
+  prints = history_page["prints"]
+  layer_tracking_map = print_history_service.get_layer_tracking_for_prints([print["id"] for print in prints])
+  for print in prints:
+    print["filament_usage"] = json.loads(print.pop("filament_info"))
+    print["layer_tracking"] = layer_tracking_map.get(print["id"])
+  return history_page
+
+
+@app.route('/api/trays', methods=['GET'])
+def api_trays():
+  # Tray data only changes with the MQTT reports and the spool list, which both bump the live version.
+  # Refresh a stale spool list first, so edits made in SpoolMan itself change the version too.
+  mqtt_bambulab.fetchSpools(cached=True, max_age=spoolman_service.SPOOLS_MAX_AGE_SECONDS)
+  return _versioned_json("trays", live_updates.LIVE_UPDATES.version, _api_trays)
+
+@app.route('/api/printer', methods=['GET'])
+def api_printer():
+  mqtt_bambulab.fetchSpools(cached=True, max_age=spoolman_service.SPOOLS_MAX_AGE_SECONDS)
+  return _versioned_json("printer", live_updates.LIVE_UPDATES.version, _api_printer)
+
+@app.route('/api/spools', methods=['GET'])
+def api_spools():
+  spools = mqtt_bambulab.fetchSpools(cached=True, max_age=spoolman_service.SPOOLS_MAX_AGE_SECONDS)
+  return _versioned_json("spools", spoolman_service.get_spools_version(), lambda: {"spools": spools})
+
+@app.route('/api/prints', methods=['GET'])
+def api_prints():
+  try:
+    limit = min(max(int(request.args.get("limit", 50)), 1), API_PRINTS_MAX_LIMIT)
+  except ValueError:
+    abort(400)
+  before = request.args.get("before")
+  after = request.args.get("after")
+  filters = _history_filters(request.args)
+  return _versioned_json(
+    "prints", print_history_service.get_history_version(), lambda: _api_prints(limit, before, after, filters)
+  )
+
+@app.route("/print_history/export")
+def print_history_export():
+  export_format = request.args.get("format", "jsonl")
+  if export_format not in history_export.EXPORT_FORMATS:
+    abort(400)
+
+  if export_format == "csv":
+    table = request.args.get("table", "prints")
+    if table not in print_history_service.HISTORY_TABLES:
+      abort(400)
+    body, mimetype, filename = history_export.export_csv(table), "text/csv", f"print_history_{table}.csv"
+  else:
+    body, mimetype, filename = history_export.export_jsonl(), "application/x-ndjson", "print_history.jsonl"
+
+  # Streamed row batch by row batch, so memory use does not depend on the history size
+  response = Response(stream_with_context(body), mimetype=mimetype)
+  response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+  return response
+
+def _history_filters(search_args):
+  """print_history search filters from the q/material/color/spool/status/from/to request arguments."""
+  try:
+    spool_id = int(search_args.get("spool"))
+  except (TypeError, ValueError):
+    spool_id = None
+
+  return {
+    "query": search_args.get("q") or None,
+    "material": search_args.get("material") or None,
+    "color": search_args.get("color") or None,
+    "spool_id": spool_id,
+    "status": search_args.get("status") or None,
+    "date_from": search_args.get("from") or None,
+    "date_to": search_args.get("to") or None,
+  }
+
 @app.route("/print_history")
 def print_history():
   spoolman_settings = spoolman_service.getSettings()
@@ -542,7 +765,19 @@ def print_history():
   except ValueError:
     page = 1
   per_page = 50
-  offset = max((page - 1) * per_page, 0)
+  before = request.args.get("before")
+  after = request.args.get("after")
+
+  # Search parameters, carried along in the pagination links
+  search_args = {
+    name: request.args.get(name, "").strip()
+    for name in ("q", "material", "color", "spool", "status", "from", "to", "archive")
+    if request.args.get(name, "").strip()
+  }
+  filters = _history_filters(search_args)
+  if not before and not after:
+    # Without a cursor the newest page is shown; the page number is only a label.
+    page = 1
 
   ams_slot = request.args.get("ams_slot")
   print_id = request.args.get("print_id")
@@ -555,20 +790,29 @@ def print_history():
   if READ_ONLY_MODE and all([ams_slot, print_id, spool_id]):
     return render_template('error.html', exception="Live read-only mode: updating print-to-spool assignments is disabled.")
 
+  # The cached list is enough here: costs are stored with the history, spools are only shown
+  spools_by_id = {spool["id"]: spool for spool in mqtt_bambulab.fetchSpools(cached=True)}
+
   if all([ams_slot, print_id, spool_id]):
     filament = print_history_service.get_filament_for_slot(print_id, ams_slot)
-    print_history_service.update_filament_spool(print_id, ams_slot, spool_id)
+    cost_per_gram = spools_by_id.get(int(spool_id), {}).get("cost_per_gram")
+    print_history_service.update_filament_spool(print_id, ams_slot, spool_id, cost_per_gram)
 
     if(filament["spool_id"] != int(spool_id) and (not old_spool_id or (old_spool_id and filament["spool_id"] == int(old_spool_id)))):
       if old_spool_id and int(old_spool_id) != -1:
         spoolman_client.consumeSpool(old_spool_id, filament["grams_used"] * -1)
 
       spoolman_client.consumeSpool(spool_id, filament["grams_used"])
+      spoolman_service.expire_spools()
 
-  prints, total_prints = print_history_service.get_prints_with_filament(limit=per_page, offset=offset)
-  layer_tracking_map = print_history_service.get_layer_tracking_for_prints([print["id"] for print in prints])
-
-  spool_list = mqtt_bambulab.fetchSpools()
+  # Archived prints are only searched on request
+  history_source = print_history_service.reading_archive() if search_args.get("archive") else contextlib.nullcontext()
+  with history_source:
+    history_page = print_history_service.get_prints_page(per_page, before=before, after=after, filters=filters)
+    facets = print_history_service.get_print_facets(filters)
+    prints = history_page["prints"]
+    total_prints = history_page["total_count"]
+    layer_tracking_map = print_history_service.get_layer_tracking_for_prints([print["id"] for print in prints])
 
   for print in prints:
     tracking_row = layer_tracking_map.get(print["id"])
@@ -612,18 +856,14 @@ def print_history():
     print["display_filament_total"] = tracking_total if tracking_total is not None else filament_usage_sum
 
     print["filament_usage"] = filament_usage_data
-    print["total_cost"] = 0
-
-    for filament in print["filament_usage"]:
-      if filament["spool_id"]:
-        for spool in spool_list:
-          if spool['id'] == filament["spool_id"]:
-            filament["spool"] =  spool
-            filament["cost"] = filament['grams_used'] * filament['spool']['cost_per_gram']
-            print["total_cost"] += filament["cost"]
-            break
-  
+    for filament in filament_usage_data:
+      filament["spool"] = spools_by_id.get(filament["spool_id"]) if filament["spool_id"] else None
+    print["total_cost"] = sum(filament.get("cost") or 0 for filament in filament_usage_data)
+
   total_pages = max(1, math.ceil(total_prints / per_page))
+  if history_page["prev_cursor"] is None:
+    page = 1
+  page = min(page, total_pages)
 
   return render_template(
     'print_history.html',
@@ -632,6 +872,11 @@ def print_history():
     page=page,
     total_pages=total_pages,
     per_page=per_page,
+    next_cursor=history_page["next_cursor"],
+    prev_cursor=history_page["prev_cursor"],
+    total_prints=total_prints,
+    search_args=search_args,
+    facets=facets,
   )
 
 @app.route("/print_select_spool")
@@ -650,30 +895,18 @@ def print_select_spool():
     if not all([ams_slot, print_id]):
       return render_template('error.html', exception="Missing spool ID or print ID.")
 
-    spools = mqtt_bambulab.fetchSpools()
-
-    materials = extract_materials(spools)
-    selected_materials = []
+    spools = mqtt_bambulab.fetchSpools(cached=True, max_age=spoolman_service.SPOOLS_MAX_AGE_SECONDS)
 
     filament = print_history_service.get_filament_for_slot(print_id, ams_slot)
-
-    try:
-      filament_material = filament["filament_type"] if filament else None
-
-      if filament_material and filament_material in materials:
-        selected_materials.append(filament_material)
-    except Exception:
-      pass
+    default_materials = [filament["filament_type"]] if filament else []
 
     return render_template(
       'print_select_spool.html',
-      spools=spools,
+      picker=spool_picker(spools, default_materials),
       ams_slot=ams_slot,
       print_id=print_id,
       old_spool_id=old_spool_id,
       change_spool=change_spool,
-      materials=materials,
-      selected_materials=selected_materials,
     )
   except Exception as e:
     traceback.print_exc()
@@ -34,3 +34,11 @@ SPOOL_SORTING = os.getenv(
 )
 DISABLE_MISMATCH_WARNING = _env_to_bool("DISABLE_MISMATCH_WARNING", False)
 CLEAR_ASSIGNMENT_WHEN_EMPTY = _env_to_bool("CLEAR_ASSIGNMENT_WHEN_EMPTY", False)
+MODEL_CACHE_MAX_MB = int(os.getenv("MODEL_CACHE_MAX_MB", "512"))  # Disk budget for downloaded 3MF models
+LAYER_TRACKING_FLUSH_SECONDS = float(os.getenv("LAYER_TRACKING_FLUSH_SECONDS", "30"))  # How often layer progress is written to print history
+PREFETCH_PRINTER_MODELS = _env_to_bool("PREFETCH_PRINTER_MODELS", False)  # Watch the printer /cache directory and download new models ahead of time
+PREFETCH_INTERVAL_SECONDS = float(os.getenv("PREFETCH_INTERVAL_SECONDS", "15"))
+PRINT_HISTORY_ARCHIVE_DAYS = int(os.getenv("PRINT_HISTORY_ARCHIVE_DAYS", "0"))  # Move prints older than this to the archive database; 0 disables archiving
+PRINT_HISTORY_ARCHIVE_INTERVAL_HOURS = float(os.getenv("PRINT_HISTORY_ARCHIVE_INTERVAL_HOURS", "24"))
+LIVE_UPDATES_MAX_CLIENTS = int(os.getenv("LIVE_UPDATES_MAX_CLIENTS", "8"))  # Open dashboards receiving live tray and print updates; each holds a server thread
+FRAGMENT_CACHE_MAX_MB = float(os.getenv("FRAGMENT_CACHE_MAX_MB", "8"))  # Memory budget for rendered tray and spool list HTML
@@ -1,7 +1,9 @@
 import pytest
 
+import print_history
 import test_data
 import socket
+from typing import NamedTuple
 
 
 @pytest.fixture
@@ -22,6 +24,58 @@ def unused_tcp_port_factory():
     return factory
 
 
+@pytest.fixture
+def history_db(request, tmp_path, monkeypatch):
+    """
+    A fresh print history database in ``tmp_path``, closed after the test.
+
+    Configure it with ``@pytest.mark.history_db(...)``: ``archive=True`` keeps the
+    archive database in ``tmp_path`` too, and ``unpatched`` names the
+    ``print_history`` functions to query for real while the seeded test-data
+    patches are active. Yields ``tmp_path``.
+    """
+    marker = request.node.get_closest_marker("history_db")
+    options = marker.kwargs if marker else {}
+    monkeypatch.setitem(print_history.db_config, "db_path", str(tmp_path / "history.db"))
+    if options.get("archive"):
+        monkeypatch.setitem(print_history.db_config, "archive_path", str(tmp_path / "archive.db"))
+    for name in options.get("unpatched", ()):
+        monkeypatch.setattr(print_history, name, test_data.unpatched(f"print_history.{name}"))
+    print_history.create_database()
+    yield tmp_path
+    print_history.close_connections()
+
+
+class RecordedFilament(NamedTuple):
+    filament_type: str
+    grams_used: float
+    spool_id: int | None = None
+    color: str = "#FFFFFF"
+
+
+def record_print(print_date, *filaments, file_name="model.3mf", image_file=None, status=None):
+    """
+    Record a print through ``record_print_start`` and return its id.
+
+    Each filament is a :class:`RecordedFilament` tuple and goes to the AMS slot
+    of its position; without filaments one 10g PLA slot is used.
+    """
+    filaments = [RecordedFilament(*filament) for filament in filaments or (("PLA", 10.0),)]
+    print_id, _ = print_history.record_print_start(
+        {"file_name": file_name, "print_type": "cloud", "print_date": print_date, "image_file": image_file},
+        [
+            {"filament_type": filament.filament_type, "color": filament.color, "grams_used": filament.grams_used, "ams_slot": slot}
+            for slot, filament in enumerate(filaments)
+        ],
+    )
+    for slot, filament in enumerate(filaments):
+        if filament.spool_id is not None:
+            print_history.update_filament_spool(print_id, slot, filament.spool_id)
+    if status is not None:
+        print_history.update_layer_tracking(print_id, status=status)
+    return print_id
+
+
 def pytest_addoption(parser):
     group = parser.getgroup("openspoolman")
     group.addoption(
@@ -1,18 +1,19 @@
 import json
 import math
 import os
-import tempfile
-import xml.etree.ElementTree as ET
+import shutil
+import time
 import zipfile
+from bisect import bisect_right
+from itertools import accumulate
 from datetime import datetime, timedelta
 from pathlib import Path
-from urllib.parse import urlparse
 
-from config import EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID, TRACK_LAYER_USAGE
+from config import EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID, TRACK_LAYER_USAGE, LAYER_TRACKING_FLUSH_SECONDS
 from spoolman_client import consumeSpool
 from spoolman_service import fetchSpools, getAMSFromTray, trayUid
-from tools_3mf import download3mfFromCloud, download3mfFromFTP, download3mfFromLocalFilesystem
-from print_history import update_filament_spool, update_filament_grams_used, get_all_filament_usage_for_print, update_layer_tracking
+from tools_3mf import fetch_model, resolve_gcode_path, scan_3mf_gcode, scan_gcode
+from print_history import get_all_filament_usage_for_print, update_layer_tracking, flush_layer_tracking
 
 
 CHECKPOINT_DIR = Path(__file__).resolve().parent / "data" / "checkpoint"
@@ -58,7 +59,13 @@ def _save_checkpoint_metadata(metadata: dict) -> None:
 
 def save_checkpoint(*, model_path: str, current_layer: int, task_id, subtask_id, ams_mapping, gcode_file_name: str) -> None:
   dest = _checkpoint_dir() / "model.3mf"
-  dest.write_bytes(Path(model_path).read_bytes())
+  if Path(model_path).resolve() != dest.resolve():
+    dest.unlink(missing_ok=True)
+    try:
+      # The model usually lives in the model cache; a hard link avoids copying it.
+      os.link(model_path, dest)
+    except OSError:
+      shutil.copyfile(model_path, dest)
 
   existing = _get_checkpoint_metadata()
   existing["task_id"] = task_id
@@ -80,9 +87,16 @@ def clear_checkpoint() -> None:
       pass
 
 
-def update_checkpoint_layer(layer: int) -> None:
+def update_checkpoint_layer(layer: int, grams_used: dict | None = None) -> None:
+  """
+  Record the last spent layer and, with ``grams_used``, the cumulative grams
+  already charged to Spoolman per AMS slot. Print history is only flushed
+  periodically, so after a restart this is the authoritative consumed amount.
+  """
   metadata = _get_checkpoint_metadata()
   metadata["current_layer"] = layer
+  if grams_used is not None:
+    metadata["grams_used"] = {str(ams_slot): grams for ams_slot, grams in grams_used.items()}
   _save_checkpoint_metadata(metadata)
 
 
@@ -109,101 +123,26 @@ def recover_model(task_id, subtask_id):
   if current_layer is None or gcode_file_name is None:
     return None
 
-  return str(model_path), gcode_file_name, current_layer, ams_mapping
-
-
-class GCodeOperation:
-  def __init__(self, raw_line: str):
-    self.operation = None
-    self.params = {}
-    self.comment = None
-    self._parse(raw_line)
-
-  def _parse(self, raw_line: str) -> None:
-    parts = list(map(lambda x: x.strip(), raw_line.split(";")))
-    if len(parts) > 1:
-      self.comment = parts[1].strip()
-
-    parts = parts[0].split()
-    self.operation = parts[0]
-    for part in parts[1:]:
-      key = part[0]
-      value = part[1:]
-      self.params[key] = value
-
+  grams_used = metadata.get("grams_used")
+  if grams_used is not None:
+    grams_used = {int(ams_slot): grams for ams_slot, grams in grams_used.items()}
 
-def _parse_gcode(gcode: str) -> list[GCodeOperation]:
-  operations = []
-  for line in gcode.split("\n"):
-    line = line.strip()
-    if not line or line.startswith(";"):
-      continue
-    operations.append(GCodeOperation(line))
-  return operations
+  return str(model_path), gcode_file_name, current_layer, ams_mapping, grams_used
 
 
 def evaluate_gcode(gcode: str) -> dict:
   """
   Evaluate the gcode and return the filament usage (in mm) per layer.
   """
-  operations = _parse_gcode(gcode)
-  print(f"[filament-tracker] Parsed {len(operations)} gcode operations")
-
-  current_layer = 0
-  current_extrusion = {}
-  active_filament = None
-  layer_filaments = {}
-
-  for operation in operations:
-    if operation.operation == "M73":
-      next_layer = operation.params.get("L")
-      if next_layer is not None:
-        print(f"[filament-tracker] Layer change: {current_layer} -> {next_layer}")
-        if current_extrusion:
-          layer_filaments[current_layer] = current_extrusion.copy()
-          current_extrusion = {}
-        current_layer = int(next_layer)
-
-    if operation.operation == "M620":
-      filament = operation.params.get("S")
-      if filament is not None:
-        if filament == "255":
-          print("[filament-tracker] Full unload (S255)")
-          active_filament = None
-          continue
-        print(f"[filament-tracker] Filament change: {active_filament} -> {filament[:-1]}")
-        active_filament = int(filament[:-1])
-
-    if operation.operation in ("G0", "G1", "G2", "G3"):
-      extrusion = operation.params.get("E")
-      if extrusion is None:
-        continue
-      if active_filament is None:
-        continue
-      extrusion_amount = float(extrusion)
-      current_extruded = current_extrusion.get(active_filament, 0)
-      current_extrusion[active_filament] = current_extruded + extrusion_amount
-
-  if current_extrusion:
-    layer_filaments[current_layer] = current_extrusion.copy()
+  layer_filaments = scan_gcode(gcode.split("\n"))["layer_usage"]
+  print(f"[filament-tracker] Evaluated gcode: {len(layer_filaments)} layers with extrusion")
   return layer_filaments
 
 
 def extract_gcode_from_3mf(path: str, gcode_path: str | None) -> str | None:
   with zipfile.ZipFile(path, "r") as z:
+    gcode_path = resolve_gcode_path(z, gcode_path)
     if gcode_path is None:
-      config_path = "Metadata/model_settings.config"
-      if config_path not in z.namelist():
-        return None
-      root = ET.parse(z.open(config_path)).getroot()
-      plate = root[0]
-      for item in plate:
-        if item.attrib.get("key") == "gcode_file":
-          gcode_path = item.attrib.get("value")
-          break
-      if gcode_path is None:
-        return None
-    if gcode_path not in z.namelist():
       return None
     with z.open(gcode_path) as g_file:
       return g_file.read().decode("utf-8")
@@ -212,6 +151,7 @@ def extract_gcode_from_3mf(path: str, gcode_path: str | None) -> str | None:
 class FilamentUsageTracker:
   def __init__(self):
     self.active_model = None
+    self._model_total_layers = None
     self.ams_mapping = None
     self.spent_layers = set()
     self.using_ams = False
@@ -229,10 +169,18 @@ class FilamentUsageTracker:
     self._layer_tracking_start_time = None
     self._pending_usage_mm = {}
     self._mc_remaining_time_minutes = None
+    self._last_spent_layer = -1
+    self._runout_models = {}
+    self._runout_forecast = {}
+    self._history_filament_updates = {}
+    self._history_layer_fields = {}
+    self._history_last_flush = None
 
   def set_print_metadata(self, metadata: dict | None) -> None:
     metadata = metadata or {}
     incoming_id = metadata.get("print_id")
+    if incoming_id != self.print_id:
+      self._flush_history(force=True)
     if (
         self.print_id
         and incoming_id
@@ -324,6 +272,7 @@ class FilamentUsageTracker:
       task_id,
       subtask_id,
   ) -> None:
+    self._flush_history(force=True)
     self._reset_layer_tracking_state()
     clear_checkpoint()
     self.spent_layers = set()
@@ -346,13 +295,15 @@ class FilamentUsageTracker:
       self._layer_tracking_start_time = datetime.now()
       self._bind_initial_spools()
       self._maybe_update_predicted_total()
+      self._update_runout_forecast()
       if self.print_id:
         initial_fields = {"status": LAYER_TRACKING_STATUS_RUNNING}
         if self._layer_tracking_total_layers is not None:
           initial_fields["total_layers"] = self._layer_tracking_total_layers
-        update_layer_tracking(self.print_id, **initial_fields)
+        self._stage_layer_tracking(**initial_fields)
         self._layer_tracking_status = LAYER_TRACKING_STATUS_RUNNING
         self._update_layer_tracking_progress()
+        self._flush_history(force=True)
 
     save_checkpoint(
       model_path=model_path,
@@ -363,11 +314,6 @@ class FilamentUsageTracker:
       gcode_file_name=gcode_file_name,
     )
 
-    try:
-      os.remove(model_path)
-    except OSError:
-      pass
-
     self._handle_layer_change(0)
 
   def start_local_print_from_metadata(self, metadata: dict | None) -> None:
@@ -414,6 +360,7 @@ class FilamentUsageTracker:
     self._bind_initial_spools()
     self._flush_all_pending_usage()
     self._maybe_update_predicted_total()
+    self._update_runout_forecast()
     self._update_layer_tracking_progress()
 
   def _retrieve_model(self, model_url: str | None) -> str | None:
@@ -421,19 +368,9 @@ class FilamentUsageTracker:
       print("[filament-tracker] No model URL provided")
       return None
 
-    uri = urlparse(model_url)
     try:
-      with tempfile.NamedTemporaryFile(suffix=".3mf", delete=False) as model_file:
-        if uri.scheme in ("https", "http"):
-          print(f"[filament-tracker] Downloading model via HTTP(S): {model_url}")
-          download3mfFromCloud(model_url, model_file)
-        elif uri.scheme == "local":
-          print(f"[filament-tracker] Loading model from local path: {uri.path}")
-          download3mfFromLocalFilesystem(uri.path, model_file)
-        else:
-          print(f"[filament-tracker] Downloading model via FTP: {model_url}")
-          download3mfFromFTP(model_url.replace("ftp://", "").replace(".gcode", ""), model_file)
-        return model_file.name
+      print(f"[filament-tracker] Fetching model: {model_url}")
+      return fetch_model(model_url)
     except Exception as exc:
       print(f"Failed to fetch model: {exc}")
       return None
@@ -454,7 +391,7 @@ class FilamentUsageTracker:
     else:
       self._spend_filament_for_layer(layer)
 
-    update_checkpoint_layer(layer)
+    update_checkpoint_layer(layer, self.cumulative_grams_used)
 
   def _handle_print_end(self) -> None:
     if self.active_model is None:
@@ -467,6 +404,7 @@ class FilamentUsageTracker:
     self._flush_all_pending_usage()
     self._maybe_update_predicted_total()
     self._update_layer_tracking_progress()
+    self._flush_history(force=True)
     if self.print_id:
       self._set_layer_tracking_status(
           LAYER_TRACKING_STATUS_COMPLETED,
@@ -491,6 +429,7 @@ class FilamentUsageTracker:
     self._flush_all_pending_usage()
     self._maybe_update_predicted_total()
     self._update_layer_tracking_progress()
+    self._flush_history(force=True)
     if self.print_id:
       self._set_layer_tracking_status(
           status,
@@ -522,12 +461,15 @@ class FilamentUsageTracker:
       return
 
     print(f"[filament-tracker] Spending filament for layer {layer}")
+    self._last_spent_layer = max(self._last_spent_layer, int(layer))
     if not TRACK_LAYER_USAGE:
       print("[filament-tracker] Layer usage tracking disabled, skipping filament spend")
+      self._update_runout_forecast()
       self._update_layer_tracking_progress()
       return
     layer_usage = self.active_model.get(int(layer))
     if layer_usage is None:
+      self._update_runout_forecast()
       return
 
     for filament, usage_mm in layer_usage.items():
@@ -535,6 +477,7 @@ class FilamentUsageTracker:
 
     self._flush_all_pending_usage()
     self._maybe_update_predicted_total()
+    self._update_runout_forecast()
     self._update_layer_tracking_progress()
 
   def _apply_usage_for_filament(self, filament: int, usage_mm: float) -> bool:
@@ -585,9 +528,9 @@ class FilamentUsageTracker:
 
     consumeSpool(spool_id, use_length=usage_rounded)
 
-    if self.print_id:
-      update_filament_spool(self.print_id, filament_key, spool_id)
-      update_filament_grams_used(self.print_id, filament_key, grams_rounded)
+    self._stage_filament_update(
+      filament_key, spool_id=spool_id, grams_used=grams_rounded, cost_per_gram=spool_data.get("cost_per_gram")
+    )
 
     self._filament_spool_id_map[filament] = spool_id
     self._spool_data_cache[spool_id] = spool_data
@@ -609,6 +552,46 @@ class FilamentUsageTracker:
     self._layer_tracking_start_time = None
     self._pending_usage_mm = {}
     self._mc_remaining_time_minutes = None
+    self._last_spent_layer = -1
+    self._runout_models = {}
+    self._runout_forecast = {}
+    self._history_filament_updates = {}
+    self._history_layer_fields = {}
+    self._history_last_flush = None
+
+  def _stage_filament_update(self, ams_slot: int, **values) -> None:
+    if not self.print_id:
+      return
+    self._history_filament_updates.setdefault(ams_slot, {}).update(values)
+
+  def _stage_layer_tracking(self, **fields) -> None:
+    if not self.print_id:
+      return
+    self._history_layer_fields.update(fields)
+
+  def _flush_history(self, force: bool = False) -> None:
+    """
+    Write buffered print-history updates in one transaction.
+
+    Progress is kept in memory between flushes; unless ``force`` is set a flush
+    only happens once LAYER_TRACKING_FLUSH_SECONDS have passed since the last one.
+    """
+    if not self.print_id:
+      return
+    if not self._history_filament_updates and not self._history_layer_fields:
+      return
+    now = time.monotonic()
+    if (
+        not force
+        and self._history_last_flush is not None
+        and now - self._history_last_flush < LAYER_TRACKING_FLUSH_SECONDS
+    ):
+      return
+
+    flush_layer_tracking(self.print_id, self._history_filament_updates, self._history_layer_fields)
+    self._history_filament_updates = {}
+    self._history_layer_fields = {}
+    self._history_last_flush = now
 
   def _is_abort_state(self, state: str | None) -> bool:
     if not state:
@@ -618,6 +601,9 @@ class FilamentUsageTracker:
   def _infer_total_layers(self) -> int | None:
     if not self.active_model:
       return None
+    if self._model_total_layers:
+      return self._model_total_layers
+    # Without M73 layer markers, the last layer that extrudes is the best guess.
     try:
       return max(self.active_model.keys()) + 1
     except Exception:
@@ -692,8 +678,7 @@ class FilamentUsageTracker:
       total_grams += self._mm_to_grams(total_mm, diameter_mm, density)
 
     self._layer_tracking_predicted_total = total_grams
-    if self.print_id:
-      update_layer_tracking(self.print_id, filament_grams_total=round(total_grams, 2))
+    self._stage_layer_tracking(filament_grams_total=round(total_grams, 2))
 
   def _bind_initial_spools(self) -> None:
     if not self.print_id:
@@ -704,14 +689,105 @@ class FilamentUsageTracker:
       if spool_id is None:
         continue
 
-      update_filament_spool(self.print_id, filament_index + 1, spool_id)
       self._filament_spool_id_map[filament_index] = spool_id
 
-      if spool_id not in self._spool_data_cache:
+      spool_data = self._spool_data_cache.get(spool_id)
+      if spool_data is None:
         spool_data = self._get_spool_data(spool_id)
         if spool_data is not None:
           self._spool_data_cache[spool_id] = spool_data
 
+      self._stage_filament_update(
+        filament_index + 1, spool_id=spool_id, cost_per_gram=(spool_data or {}).get("cost_per_gram")
+      )
+
+  def get_runout_forecast(self) -> list[dict]:
+    """
+    Return the run-out forecast for every spool mapped to the current print,
+    soonest run-out first. Empty when no print is being tracked.
+    """
+    forecast = self._runout_forecast
+    return sorted(
+        (dict(entry) for entry in forecast.values()),
+        key=lambda entry: (entry["runout_layer"] is None, entry["runout_layer"] or 0, entry["spool_id"]),
+    )
+
+  def _build_runout_model(self, spool_id: int, filaments: list[int]) -> dict | None:
+    """
+    Precompute cumulative grams per layer for the filaments printed from ``spool_id``.
+
+    The Spoolman remaining weight is taken as a baseline together with the model
+    usage already spent at that point, so later updates are a bisect per layer.
+    """
+    spool_data = self._spool_data_cache.get(spool_id)
+    if spool_data is None or spool_data.get("remaining_weight") is None:
+      return None
+
+    filament_data = spool_data.get("filament", {})
+    grams_per_mm = self._mm_to_grams(
+        1.0, filament_data.get("diameter", 1.75), filament_data.get("density", 1.24)
+    )
+    per_layer = {}
+    for layer, layer_usage in self.active_model.items():
+      usage_mm = sum(layer_usage.get(filament, 0.0) for filament in filaments)
+      if usage_mm > 0:
+        per_layer[layer] = usage_mm * grams_per_mm
+
+    layers = sorted(per_layer)
+    prefix = list(accumulate(per_layer[layer] for layer in layers))
+    mapping_value = self._resolve_tray_mapping(filaments[0])
+    model = {
+        "filaments": filaments,
+        "tray_uid": self._tray_uid_from_mapping(mapping_value) if mapping_value is not None else None,
+        "layers": layers,
+        "prefix": prefix,
+        "remaining": float(spool_data["remaining_weight"]),
+    }
+    model["baseline"] = self._grams_through_layer(model, self._last_spent_layer)
+    return model
+
+  def _grams_through_layer(self, model: dict, layer: int) -> float:
+    index = bisect_right(model["layers"], layer)
+    return model["prefix"][index - 1] if index else 0.0
+
+  def _update_runout_forecast(self) -> None:
+    if not self.active_model:
+      return
+
+    spools = {}
+    for filament, spool_id in self._filament_spool_id_map.items():
+      spools.setdefault(spool_id, []).append(filament)
+
+    forecast = {}
+    for spool_id, filaments in spools.items():
+      filaments = sorted(filaments)
+      model = self._runout_models.get(spool_id)
+      if model is None or model["filaments"] != filaments:
+        model = self._build_runout_model(spool_id, filaments)
+        if model is None:
+          continue
+        self._runout_models[spool_id] = model
+
+      prefix = model["prefix"]
+      spent = self._grams_through_layer(model, self._last_spent_layer) - model["baseline"]
+      remaining_at_end = model["remaining"] - ((prefix[-1] if prefix else 0.0) - model["baseline"])
+      # First layer whose cumulative usage exceeds what the spool had at the baseline.
+      runout_index = bisect_right(prefix, model["remaining"] + model["baseline"])
+      forecast[spool_id] = {
+          "spool_id": spool_id,
+          "tray_uid": model["tray_uid"],
+          "filaments": [filament + 1 for filament in filaments],
+          "remaining_grams": round(model["remaining"] - spent, 2),
+          "remaining_at_end_grams": round(remaining_at_end, 2),
+          "runout_layer": model["layers"][runout_index] if runout_index < len(prefix) else None,
+          "current_layer": max(self._last_spent_layer, 0),
+          "total_layers": self._layer_tracking_total_layers,
+      }
+
+    for spool_id in set(self._runout_models) - set(spools):
+      del self._runout_models[spool_id]
+    self._runout_forecast = forecast
+
   def _update_layer_tracking_progress(self) -> None:
     if not self.print_id:
       return
@@ -737,7 +813,8 @@ class FilamentUsageTracker:
     if predicted_end:
       payload["predicted_end_time"] = predicted_end
 
-    update_layer_tracking(self.print_id, **payload)
+    self._stage_layer_tracking(**payload)
+    self._flush_history()
 
   def _set_layer_tracking_status(
       self,
@@ -753,9 +830,12 @@ class FilamentUsageTracker:
     payload = {"status": status}
     if extra_fields:
       payload.update(extra_fields)
-    update_layer_tracking(print_id, **payload)
     if target_print_id is None:
+      self._stage_layer_tracking(**payload)
+      self._flush_history(force=True)
       self._layer_tracking_status = status
+    else:
+      update_layer_tracking(print_id, **payload)
 
   def _tray_uid_from_mapping(self, mapping_value: int) -> str | None:
     if mapping_value == EXTERNAL_SPOOL_ID:
@@ -795,11 +875,14 @@ class FilamentUsageTracker:
     return None
 
   def _load_model(self, model_path: str, gcode_file: str | None) -> None:
-    gcode = extract_gcode_from_3mf(model_path, gcode_file)
-    if gcode is None:
+    # Shares the memoized scan getMetaDataFrom3mf already ran on the same cached file.
+    gcode_scan = scan_3mf_gcode(model_path, gcode_file)
+    if gcode_scan is None:
       print("Failed to extract gcode from model")
+      self._model_total_layers = None
       return
-    self.active_model = evaluate_gcode(gcode)
+    self.active_model = gcode_scan["layer_usage"]
+    self._model_total_layers = gcode_scan.get("total_layers") or None
 
   def _attempt_print_resume(self, task_id, subtask_id) -> None:
     result = recover_model(task_id, subtask_id)
@@ -807,9 +890,10 @@ class FilamentUsageTracker:
       print("[filament-tracker] No checkpoint to recover")
       return
     print(f"[filament-tracker] Recovering from checkpoint task={task_id} subtask={subtask_id}")
-    model_path, gcode_file_name, current_layer, ams_mapping = result
+    model_path, gcode_file_name, current_layer, ams_mapping, checkpoint_grams = result
     self._load_model(model_path, gcode_file_name)
     self.spent_layers = set(range(current_layer + 1))
+    self._last_spent_layer = current_layer
     self.ams_mapping = ams_mapping
     self.current_layer = current_layer
     self.using_ams = ams_mapping is not None
@@ -821,3 +905,13 @@ class FilamentUsageTracker:
       for ams_slot, grams_used in existing_usage.items():
         self.cumulative_grams_used[ams_slot] = grams_used
         print(f"[filament-tracker] Resumed cumulative usage for filament {ams_slot}: {grams_used}g")
+
+    # The checkpoint is written with every Spoolman charge while the database
+    # may lag behind by up to LAYER_TRACKING_FLUSH_SECONDS, so it wins.
+    for ams_slot, grams_used in (checkpoint_grams or {}).items():
+      if grams_used > self.cumulative_grams_used.get(ams_slot, 0.0):
+        self.cumulative_grams_used[ams_slot] = grams_used
+        self._stage_filament_update(ams_slot, grams_used=round(grams_used, 2))
+        print(f"[filament-tracker] Restored unflushed usage for filament {ams_slot}: {grams_used}g")
+    self._update_layer_tracking_progress()
+    self._flush_history(force=True)
@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+from config import FRAGMENT_CACHE_MAX_MB
+
+
+class FragmentCache:
+  """
+  Rendered HTML keyed by ``(template, inputs...)`` and the version of those inputs.
+
+  Every key holds a single version, so rendering a newer one replaces the old
+  HTML instead of piling up. Least recently used fragments are dropped once the
+  cached HTML exceeds ``max_chars``.
+  """
+
+  def __init__(self, max_chars: int = int(FRAGMENT_CACHE_MAX_MB * 1024 * 1024)):
+    self.max_chars = max_chars
+    self._entries = OrderedDict()
+    self._size = 0
+    self._lock = threading.Lock()
+
+  def get(self, key: tuple, version, render) -> Markup:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[0] == version:
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    # Rendered outside the lock; concurrent misses for one key render it twice at worst
+    html = Markup(render())
+    with self._lock:
+      self._discard(key)
+      if len(html) <= self.max_chars:
+        self._entries[key] = (version, html)
+        self._size += len(html)
+        while self._size > self.max_chars:
+          _, (_, evicted) = self._entries.popitem(last=False)
+          self._size -= len(evicted)
+    return html
+
+  def invalidate(self, template: str | None = None) -> None:
+    """Drop the fragments rendered from ``template``, or every fragment."""
+    with self._lock:
+      for key in [key for key in self._entries if template is None or key[0] == template]:
+        self._discard(key)
+
+  def _discard(self, key) -> None:
+    entry = self._entries.pop(key, None)
+    if entry is not None:
+      self._size -= len(entry[1])
+
+  @property
+  def size(self) -> int:
+    return self._size
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+
+FRAGMENT_CACHE = FragmentCache()
+
+
+def invalidate(template: str | None = None) -> None:
+  FRAGMENT_CACHE.invalidate(template)
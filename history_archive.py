@@ -0,0 +1,58 @@
+import threading
+
+import print_history
+import thumbnails
+from config import PRINT_HISTORY_ARCHIVE_DAYS, PRINT_HISTORY_ARCHIVE_INTERVAL_HOURS
+
+
+class HistoryArchiver:
+  """
+  Periodically move old prints to the archive database, compact the live
+  database and delete thumbnails that neither database references any more.
+  """
+
+  def __init__(
+    self,
+    older_than_days: int = PRINT_HISTORY_ARCHIVE_DAYS,
+    interval: float = PRINT_HISTORY_ARCHIVE_INTERVAL_HOURS * 3600,
+    thumbnail_dir=None,
+  ):
+    self.older_than_days = older_than_days
+    self.interval = interval
+    self.thumbnail_dir = thumbnail_dir
+    self._stop = threading.Event()
+    self._thread = None
+
+  def run_once(self) -> dict:
+    """Archive, compact and prune once and return what was done."""
+    archived = print_history.archive_prints(self.older_than_days)
+    released_pages = print_history.compact_database()
+
+    referenced = print_history.get_referenced_image_files()
+    removed_thumbnails = thumbnails.prune_thumbnails(referenced, self.thumbnail_dir)
+
+    stats = {"archived": archived, "released_pages": released_pages, "removed_thumbnails": removed_thumbnails}
+    print(
+      f"[history-archive] Archived {archived} prints, released {released_pages} pages, "
+      f"removed {removed_thumbnails} thumbnails"
+    )
+    return stats
+
+  def _run(self) -> None:
+    while not self._stop.is_set():
+      try:
+        self.run_once()
+      except Exception as exc:
+        print(f"[history-archive] Archiving print history failed: {exc}")
+      finally:
+        print_history.close_connections()
+      self._stop.wait(self.interval)
+
+  def start(self) -> None:
+    if self._thread is not None:
+      return
+    self._thread = threading.Thread(target=self._run, name="history-archive", daemon=True)
+    self._thread.start()
+
+  def stop(self) -> None:
+    self._stop.set()
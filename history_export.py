@@ -0,0 +1,55 @@
+import csv
+import io
+import itertools
+import json
+from typing import Iterable, Iterator
+
+import print_history
+
+EXPORT_FORMATS = ("jsonl", "csv")
+CSV_CHUNK_CHARS = 64 * 1024
+
+
+def export_jsonl(tables: Iterable[str] = print_history.HISTORY_TABLES) -> Iterator[str]:
+  """Yield the print history as JSON lines of ``{"table": ..., "row": {...}}``, prints first."""
+  for table in tables:
+    for row in print_history.iter_table_rows(table):
+      yield json.dumps({"table": table, "row": row}) + "\n"
+
+
+def export_csv(table: str) -> Iterator[str]:
+  """Yield one print history table as CSV, header first, in chunks of roughly CSV_CHUNK_CHARS."""
+  buffer = io.StringIO()
+  writer = csv.DictWriter(buffer, fieldnames=print_history.table_columns(table))
+  writer.writeheader()
+  for row in print_history.iter_table_rows(table):
+    writer.writerow(row)
+    if buffer.tell() >= CSV_CHUNK_CHARS:
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+  yield buffer.getvalue()
+
+
+def import_jsonl(lines: Iterable[str]) -> dict[str, dict]:
+  """
+  Import JSON lines written by :func:`export_jsonl` and return the imported
+  and skipped counts per table.
+  """
+  records = (json.loads(line) for line in lines if line.strip())
+  results = {}
+  for table, group in itertools.groupby(records, key=lambda record: record["table"]):
+    counts = print_history.import_table_rows(table, (record["row"] for record in group))
+    totals = results.setdefault(table, {"imported": 0, "skipped": 0})
+    totals["imported"] += counts["imported"]
+    totals["skipped"] += counts["skipped"]
+  return results
+
+
+def import_csv(table: str, lines: Iterable[str]) -> dict:
+  """Import a CSV written by :func:`export_csv`; empty cells are stored as NULL."""
+  rows = (
+    {column: value if value != "" else None for column, value in row.items()}
+    for row in csv.DictReader(lines)
+  )
+  return print_history.import_table_rows(table, rows)
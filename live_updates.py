@@ -0,0 +1,93 @@
+import json
+import threading
+
+from config import LIVE_UPDATES_MAX_CLIENTS
+
+KEEPALIVE_SECONDS = 15
+RETRY_MS = 5000
+
+
+class LiveUpdates:
+  """
+  Version counter for the dashboard state plus the fragments rendered for it.
+
+  MQTT and inventory changes bump the version; every open event stream waits
+  on the same condition and the fragments for a version are rendered once and
+  shared, so idle dashboards cost a keepalive comment every few seconds.
+  """
+
+  def __init__(self, max_clients: int = LIVE_UPDATES_MAX_CLIENTS):
+    self.max_clients = max_clients
+    self._version = 0
+    self._changed = threading.Condition()
+    self._render_lock = threading.Lock()
+    self._snapshot = (None, None)
+    self._clients = 0
+    self._clients_lock = threading.Lock()
+
+  @property
+  def version(self) -> int:
+    with self._changed:
+      return self._version
+
+  def notify(self) -> None:
+    with self._changed:
+      self._version += 1
+      self._changed.notify_all()
+
+  def wait(self, since: int, timeout: float) -> int:
+    """Block until the version differs from ``since`` or the timeout passes; return the current version."""
+    with self._changed:
+      self._changed.wait_for(lambda: self._version != since, timeout)
+      return self._version
+
+  def snapshot(self, render):
+    """Return ``(version, fragments)``, calling ``render`` at most once per version."""
+    with self._render_lock:
+      version = self.version
+      if self._snapshot[0] != version:
+        # A change that lands while rendering bumps the version again, so it is picked up on the next wait
+        self._snapshot = (version, render())
+      return self._snapshot
+
+  def acquire_client(self) -> bool:
+    with self._clients_lock:
+      if self._clients >= self.max_clients:
+        return False
+      self._clients += 1
+      return True
+
+  def release_client(self) -> None:
+    with self._clients_lock:
+      self._clients -= 1
+
+  def stream(self, render, keepalive: float = KEEPALIVE_SECONDS):
+    """
+    Server-sent events for one client: an ``update`` event with the fragments
+    that changed since the previous event, or a comment when nothing changed.
+
+    ``render`` returns ``{"layout": str, "fragments": {live_id: html}}``. The
+    first event carries every fragment because the page may be older than the
+    stream.
+    """
+    yield f"retry: {RETRY_MS}\n\n"
+    sent = None
+    version = None
+    while True:
+      if version is not None and self.wait(version, keepalive) == version:
+        yield ": keepalive\n\n"
+        continue
+
+      version, state = self.snapshot(render)
+      changed = {key: html for key, html in state["fragments"].items() if (sent or {}).get(key) != html}
+      if changed or sent is None:
+        payload = json.dumps({"layout": state["layout"], "fragments": changed})
+        yield f"id: {version}\nevent: update\ndata: {payload}\n\n"
+        sent = state["fragments"]
+
+
+LIVE_UPDATES = LiveUpdates()
+
+
+def notify() -> None:
+  LIVE_UPDATES.notify()
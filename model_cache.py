@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+class ModelCache:
+  """
+  Bounded on-disk cache for downloaded 3MF models.
+
+  Files are stored by the SHA-256 of their content, so the same model fetched
+  through different sources (or printed twice) only occupies disk space once.
+  An index maps each source key (e.g. the model URL) to the content hash.
+  """
+
+  def __init__(self, directory: Path, max_bytes: int):
+    self.directory = Path(directory)
+    self.max_bytes = max_bytes
+    self._lock = threading.Lock()
+    self._key_locks = {}
+    self._index = None
+
+  def _index_path(self) -> Path:
+    return self.directory / "index.json"
+
+  def _load_index(self) -> dict:
+    if self._index is None:
+      try:
+        self._index = json.loads(self._index_path().read_text())
+      except Exception:
+        self._index = {}
+    return self._index
+
+  def _save_index(self) -> None:
+    self.directory.mkdir(parents=True, exist_ok=True)
+    tmp_path = self._index_path().with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(self._index))
+    os.replace(tmp_path, self._index_path())
+
+  def _blob_path(self, digest: str) -> Path:
+    return self.directory / f"{digest}.3mf"
+
+  def _key_lock(self, key: str) -> threading.Lock:
+    with self._lock:
+      return self._key_locks.setdefault(key, threading.Lock())
+
+  def lookup(self, key: str, validator: str | None = None) -> str | None:
+    """
+    Return the cached file for ``key`` without fetching, or None.
+
+    When ``validator`` is given, an entry stored with a different validator
+    (e.g. the remote file's size and date) counts as stale.
+    """
+    with self._lock:
+      entry = self._load_index().get(key)
+      if not entry:
+        return None
+      if validator is not None and entry.get("validator") != validator:
+        return None
+      path = self._blob_path(entry["sha256"])
+      if not path.exists():
+        self._index.pop(key, None)
+        self._save_index()
+        return None
+      entry["used"] = time.time()
+      self._save_index()
+      return str(path)
+
+  def get(self, key: str, fetch, refresh: bool = False, validator: str | None = None) -> str:
+    """
+    Return a path to the cached model for ``key``, calling ``fetch(file)`` to
+    download it when missing, stale for ``validator``, or when ``refresh`` is set.
+    """
+    with self._key_lock(key):
+      if not refresh:
+        cached = self.lookup(key, validator)
+        if cached is not None:
+          print(f"[model-cache] Hit for {key}")
+          return cached
+
+      self.directory.mkdir(parents=True, exist_ok=True)
+      with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".part", delete=False) as part_file:
+        part_path = Path(part_file.name)
+        try:
+          fetch(part_file)
+        except BaseException:
+          part_file.close()
+          part_path.unlink(missing_ok=True)
+          raise
+
+      digest = self._hash_file(part_path)
+      blob_path = self._blob_path(digest)
+      if blob_path.exists():
+        part_path.unlink(missing_ok=True)
+      else:
+        os.replace(part_path, blob_path)
+
+      with self._lock:
+        self._load_index()[key] = {
+          "sha256": digest,
+          "size": blob_path.stat().st_size,
+          "used": time.time(),
+          "validator": validator,
+        }
+        self._evict(keep=digest)
+        self._save_index()
+
+      print(f"[model-cache] Stored {key} as {blob_path.name}")
+      return str(blob_path)
+
+  def _hash_file(self, path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+      for chunk in iter(lambda: f.read(1024 * 1024), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+  def _evict(self, keep: str) -> None:
+    """Drop least recently used blobs until the cache fits ``max_bytes``."""
+    blobs = {}
+    for key, entry in self._index.items():
+      blob = blobs.setdefault(entry["sha256"], {"size": entry.get("size", 0), "used": 0, "keys": []})
+      blob["used"] = max(blob["used"], entry.get("used", 0))
+      blob["keys"].append(key)
+
+    total = sum(blob["size"] for blob in blobs.values())
+    for digest, blob in sorted(blobs.items(), key=lambda item: item[1]["used"]):
+      if total <= self.max_bytes:
+        break
+      if digest == keep:
+        continue
+      self._blob_path(digest).unlink(missing_ok=True)
+      for key in blob["keys"]:
+        self._index.pop(key, None)
+      total -= blob["size"]
@@ -0,0 +1,79 @@
+import threading
+
+import printer_ftp
+import tools_3mf
+from config import PREFETCH_INTERVAL_SECONDS
+
+
+class ModelPrefetcher:
+  """
+  Watch the printer's /cache directory and warm the model cache with new uploads.
+
+  Files present when the watcher starts are left alone. A new or replaced .3mf
+  is downloaded and its G-code scanned once two consecutive polls report the
+  same size and date, so uploads still in progress are not fetched half-written.
+  """
+
+  def __init__(self, session=None, interval: float = PREFETCH_INTERVAL_SECONDS, directory: str = "/cache/"):
+    self._session = session
+    self.interval = interval
+    self.directory = directory
+    self._known = None
+    self._pending = {}
+    self._stop = threading.Event()
+    self._thread = None
+
+  def _list(self) -> list[dict]:
+    session = self._session or printer_ftp.get_session()
+    return [entry for entry in session.list(self.directory) if entry["name"].lower().endswith(".3mf")]
+
+  def poll_once(self) -> list[str]:
+    """List the directory once and prefetch files that settled since the last poll."""
+    entries = self._list()
+    listed = {entry["name"]: tools_3mf.ftp_validator(entry) for entry in entries}
+
+    if self._known is None:
+      self._known = listed
+      return []
+
+    fetched = []
+    for entry in entries:
+      name = entry["name"]
+      validator = listed[name]
+      if self._known.get(name) == validator:
+        continue
+      if self._pending.get(name) != validator:
+        self._pending[name] = validator
+        continue
+
+      print(f"[model-prefetch] New model {name}, downloading ahead of print start")
+      try:
+        model_path = tools_3mf.fetch_model(name, listing_entry=entry)
+        tools_3mf.scan_3mf_gcode(model_path)
+      except Exception as exc:
+        print(f"[model-prefetch] Failed to prefetch {name}: {exc}")
+        continue
+      self._pending.pop(name, None)
+      self._known[name] = validator
+      fetched.append(name)
+
+    self._known = {name: validator for name, validator in self._known.items() if name in listed}
+    self._pending = {name: validator for name, validator in self._pending.items() if name in listed}
+    return fetched
+
+  def _run(self) -> None:
+    while not self._stop.is_set():
+      try:
+        self.poll_once()
+      except Exception as exc:
+        print(f"[model-prefetch] Polling printer cache failed: {exc}")
+      self._stop.wait(self.interval)
+
+  def start(self) -> None:
+    if self._thread is not None:
+      return
+    self._thread = threading.Thread(target=self._run, name="model-prefetch", daemon=True)
+    self._thread.start()
+
+  def stop(self) -> None:
+    self._stop.set()
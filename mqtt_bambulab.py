@@ -16,6 +16,7 @@ from config import (
     EXTERNAL_SPOOL_ID,
     TRACK_LAYER_USAGE,
     CLEAR_ASSIGNMENT_WHEN_EMPTY,
+    PREFETCH_PRINTER_MODELS,
 )
 from messages import GET_VERSION, PUSH_ALL, AMS_FILAMENT_SETTING
 from spoolman_service import spendFilaments, setActiveTray, fetchSpools, clear_active_spool_for_tray
@@ -24,8 +25,11 @@ import time
 import copy
 from collections.abc import Mapping
 from logger import append_to_rotating_file
-from print_history import insert_print, insert_filament_usage
+from print_history import record_print_start
 from filament_usage_tracker import FilamentUsageTracker
+from model_prefetch import ModelPrefetcher
+import fragment_cache
+import live_updates
 MQTT_CLIENT = {}  # Global variable storing MQTT Client
 MQTT_CLIENT_CONNECTED = False
 MQTT_KEEPALIVE = 60
@@ -35,7 +39,13 @@ PRINTER_STATE = {}
 PRINTER_STATE_LAST = {}
 
 PENDING_PRINT_METADATA = {}
+
+# Last reported values of the fields shown live on the home page
+LIVE_STATE = {}
+TRAY_VERSION = 0  # Bumped after reported AMS or external tray data changed
+PRINT_PROGRESS_FIELDS = ("gcode_state", "subtask_name", "mc_percent", "mc_remaining_time", "layer_num", "total_layer_num")
 FILAMENT_TRACKER = FilamentUsageTracker()
+MODEL_PREFETCHER = ModelPrefetcher()
 LOG_FILE = "/home/app/logs/mqtt.log"
 
 def getPrinterModel():
@@ -164,6 +174,22 @@ def _parse_grams(value):
   except (TypeError, ValueError):
     return None
 
+def _filament_usage_rows(filaments):
+  rows = []
+  for id, filament in filaments.items():
+    parsed_grams = _parse_grams(filament.get("used_g"))
+    grams_used = parsed_grams if parsed_grams is not None else 0.0
+    if TRACK_LAYER_USAGE:
+      grams_used = 0.0
+    rows.append({
+      "filament_type": filament["type"],
+      "color": filament["color"],
+      "grams_used": grams_used,
+      "ams_slot": id,
+      "estimated_grams": parsed_grams,
+    })
+  return rows
+
 def map_filament(tray_tar):
   global PENDING_PRINT_METADATA
   # Prüfen, ob ein Filamentwechsel aktiv ist (stg_cur == 4)
@@ -230,29 +256,21 @@ def processMessage(data):
       if TRACK_LAYER_USAGE:
         FILAMENT_TRACKER.set_print_metadata(PENDING_PRINT_METADATA)
 
-      print_id = insert_print(PRINTER_STATE["print"]["subtask_name"], "cloud", PENDING_PRINT_METADATA["image"])
-
       if "use_ams" in PRINTER_STATE["print"] and PRINTER_STATE["print"]["use_ams"]:
         PENDING_PRINT_METADATA["ams_mapping"] = PRINTER_STATE["print"]["ams_mapping"]
       else:
         PENDING_PRINT_METADATA["ams_mapping"] = [EXTERNAL_SPOOL_ID]
 
+      print_id, _ = record_print_start(
+          {
+            "file_name": PRINTER_STATE["print"]["subtask_name"],
+            "print_type": "cloud",
+            "image_file": PENDING_PRINT_METADATA["image"],
+          },
+          _filament_usage_rows(PENDING_PRINT_METADATA["filaments"]),
+      )
       PENDING_PRINT_METADATA["print_id"] = print_id
       PENDING_PRINT_METADATA["complete"] = True
-
-      for id, filament in PENDING_PRINT_METADATA["filaments"].items():
-        parsed_grams = _parse_grams(filament.get("used_g"))
-        grams_used = parsed_grams if parsed_grams is not None else 0.0
-        if TRACK_LAYER_USAGE:
-          grams_used = 0.0
-        insert_filament_usage(
-            print_id,
-            filament["type"],
-            filament["color"],
-            grams_used,
-            id,
-            estimated_grams=parsed_grams,
-        )
   
     #if ("gcode_state" in data["print"] and data["print"]["gcode_state"] == "RUNNING") and ("print_type" in data["print"] and data["print"]["print_type"] != "local") \
     #  and ("tray_tar" in data["print"] and data["print"]["tray_tar"] != "255") and ("stg_cur" in data["print"] and data["print"]["stg_cur"] == 0 and PRINT_CURRENT_STAGE != 0):
@@ -277,7 +295,14 @@ def processMessage(data):
           PENDING_PRINT_METADATA["subtask_id"] = PRINTER_STATE["print"].get("subtask_id")
 
           if not PENDING_PRINT_METADATA.get("tracking_started"):
-            print_id = insert_print(PENDING_PRINT_METADATA["file"], PRINTER_STATE["print"]["print_type"], PENDING_PRINT_METADATA["image"])
+            print_id, _ = record_print_start(
+                {
+                  "file_name": PENDING_PRINT_METADATA["file"],
+                  "print_type": PRINTER_STATE["print"]["print_type"],
+                  "image_file": PENDING_PRINT_METADATA["image"],
+                },
+                _filament_usage_rows(PENDING_PRINT_METADATA["filaments"]),
+            )
 
             PENDING_PRINT_METADATA["ams_mapping"] = []
             PENDING_PRINT_METADATA["filamentChanges"] = []
@@ -286,20 +311,6 @@ def processMessage(data):
             PENDING_PRINT_METADATA["print_id"] = print_id
             FILAMENT_TRACKER.start_local_print_from_metadata(PENDING_PRINT_METADATA)
 
-            for id, filament in PENDING_PRINT_METADATA["filaments"].items():
-              parsed_grams = _parse_grams(filament.get("used_g"))
-              grams_used = parsed_grams if parsed_grams is not None else 0.0
-              if TRACK_LAYER_USAGE:
-                grams_used = 0.0
-              insert_filament_usage(
-                  print_id,
-                  filament["type"],
-                  filament["color"],
-                  grams_used,
-                  id,
-                  estimated_grams=parsed_grams,
-              )
-
             PENDING_PRINT_METADATA["tracking_started"] = True
 
         #TODO 
@@ -395,15 +406,31 @@ def clear_ams_tray_assignment(ams_id, tray_id):
 
   publish(MQTT_CLIENT, ams_message)
 
+def _changed_live_fields(report):
+  values = {key: report[key] for key in ("vt_tray",) + PRINT_PROGRESS_FIELDS if key in report}
+  if isinstance(report.get("ams"), dict) and "ams" in report["ams"]:
+    values["ams"] = report["ams"]["ams"]
+
+  changed = set()
+  for key, value in values.items():
+    if LIVE_STATE.get(key) != value:
+      # Copied because the tray dicts are annotated in place further down
+      LIVE_STATE[key] = copy.deepcopy(value)
+      changed.add(key)
+  return changed
+
 # Inspired by https://github.com/Donkie/Spoolman/issues/217#issuecomment-2303022970
 def on_message(client, userdata, msg):
-  global LAST_AMS_CONFIG, PRINTER_STATE, PRINTER_STATE_LAST, PENDING_PRINT_METADATA, PRINTER_MODEL
+  global LAST_AMS_CONFIG, PRINTER_STATE, PRINTER_STATE_LAST, PENDING_PRINT_METADATA, PRINTER_MODEL, TRAY_VERSION
   
   try:
     data = json.loads(msg.payload.decode())
+    live_fields = _changed_live_fields(data["print"]) if "print" in data else set()
+    live_changed = bool(live_fields)
 
     info = data.get("info")
     if info and info.get("command") == "get_version":
+      live_changed = True
       modules = info.get("module", [])
       detected = identify_ams_models_from_modules(modules)
       models_by_id = identify_ams_models_by_id(modules)
@@ -413,6 +440,9 @@ def on_message(client, userdata, msg):
         "detected_models": detected,
         "models_by_id": models_by_id,
       }
+      # The AMS models show up in the tray and AMS fragments, whose revisions only follow the tray data
+      fragment_cache.invalidate("fragments/tray.html")
+      fragment_cache.invalidate("fragments/ams_metrics.html")
 
     if "print" in data:
       append_to_rotating_file("/home/app/logs/mqtt.log", msg.payload.decode())
@@ -429,7 +459,13 @@ def on_message(client, userdata, msg):
 
     # Save ams spool data
     if "print" in data and "ams" in data["print"] and "ams" in data["print"]["ams"]:
-      LAST_AMS_CONFIG["ams"] = data["print"]["ams"]["ams"]
+      # Published as a copy, so the annotations below stay on this message
+      LAST_AMS_CONFIG["ams"] = copy.deepcopy(data["print"]["ams"]["ams"])
+
+    if live_fields & {"ams", "vt_tray"}:
+      TRAY_VERSION += 1
+
+    if "print" in data and "ams" in data["print"] and "ams" in data["print"]["ams"]:
       for ams in data["print"]["ams"]["ams"]:
         print(f"AMS [{num2letter(ams['id'])}] (hum: {ams['humidity']}, temp: {ams['temp']}ºC)")
         for tray in ams["tray"]:
@@ -472,6 +508,9 @@ def on_message(client, userdata, msg):
                 f"    - [{num2letter(ams['id'])}{tray['id']}]")
             print("      - No Spool!")
 
+    if live_changed:
+      live_updates.notify()
+
   except Exception:
     traceback.print_exc()
 
@@ -479,6 +518,7 @@ def on_connect(client, userdata, flags, rc):
   global MQTT_CLIENT_CONNECTED
   MQTT_CLIENT_CONNECTED = True
   print("Connected with result code " + str(rc))
+  live_updates.notify()
   client.subscribe(f"device/{PRINTER_ID}/report")
   publish(client, GET_VERSION)
   publish(client, PUSH_ALL)
@@ -487,6 +527,7 @@ def on_disconnect(client, userdata, rc):
   global MQTT_CLIENT_CONNECTED
   MQTT_CLIENT_CONNECTED = False
   print("Disconnected with result code " + str(rc))
+  live_updates.notify()
   
 def async_subscribe():
   global MQTT_CLIENT
@@ -522,6 +563,8 @@ def init_mqtt(daemon: bool = False):
   # Start the asynchronous processing in a separate thread
   thread = Thread(target=async_subscribe, daemon=daemon)
   thread.start()
+  if PREFETCH_PRINTER_MODELS:
+    MODEL_PREFETCHER.start()
 
 def getLastAMSConfig():
   global LAST_AMS_CONFIG
@@ -542,3 +585,12 @@ def isMqttClientConnected():
   global MQTT_CLIENT_CONNECTED
 
   return MQTT_CLIENT_CONNECTED
+
+def getTrayVersion():
+  return TRAY_VERSION
+
+def getPrintProgress():
+  return {key: LIVE_STATE.get(key) for key in PRINT_PROGRESS_FIELDS}
+
+def getRunoutForecast():
+  return FILAMENT_TRACKER.get_runout_forecast()
@@ -1,7 +1,16 @@
+import atexit
+import functools
+import json
 import os
+import queue
+import re
 import sqlite3
-from datetime import datetime
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Iterable, Iterator
 
 DEFAULT_DB_NAME = "3d_printer_logs.db"
 DB_ENV_VAR = "OPENSPOOLMAN_PRINT_HISTORY_DB"
@@ -19,24 +28,265 @@ def _default_db_path() -> Path:
 
 db_config = {"db_path": str(_default_db_path())}  # Configuration for database location
 
+BUSY_TIMEOUT_MS = 5000
 
-def _ensure_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> None:
-    cursor.execute(f"PRAGMA table_info({table})")
-    columns = {row[1] for row in cursor.fetchall()}
-    if column not in columns:
-        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+# Applied to every new connection. WAL lets the web threads read while the MQTT
+# thread writes; synchronous=NORMAL is durable across application crashes in
+# WAL mode and only fsyncs at checkpoints. auto_vacuum only takes effect on a
+# new, empty database, so it has to come before the journal mode switch.
+CONNECTION_PRAGMAS = (
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8192",  # 8 MiB page cache
+    "PRAGMA mmap_size=67108864",  # 64 MiB
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+)
+AUTO_VACUUM_INCREMENTAL = 2
 
+_local = threading.local()
 
-def create_database() -> None:
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    # isolation_level=None disables the implicit BEGIN of the sqlite3 module;
+    # writes are grouped explicitly with transaction().
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _current_db_path() -> str:
+    return getattr(_local, "db_path", None) or db_config["db_path"]
+
+
+def archive_db_path() -> str:
+    """Path of the archive database, ``<name>_archive.db`` next to the live one unless configured."""
+    configured = db_config.get("archive_path")
+    if configured:
+        return configured
+    db_path = Path(db_config["db_path"])
+    return str(db_path.with_name(f"{db_path.stem}_archive{db_path.suffix}"))
+
+
+@contextmanager
+def reading_archive():
     """
-    Ensure the SQLite schema exists (used for both fresh and upgrading databases).
+    Point the calling thread's history queries at the archive database.
+
+    Writes keep going to the live database through the writer thread.
     """
-    db_path = Path(db_config["db_path"])
-    db_path.parent.mkdir(parents=True, exist_ok=True)
+    previous = getattr(_local, "db_path", None)
+    _local.db_path = archive_db_path()
+    try:
+        create_database()
+        yield
+    finally:
+        _local.db_path = previous
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
 
+def get_connection() -> sqlite3.Connection:
+    """
+    Return the calling thread's connection to the configured database, or to
+    the archive inside :func:`reading_archive`.
+
+    Each thread keeps one connection per database path, opened on first use and
+    reused afterwards. Connections inherited through fork() are discarded.
+    """
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        _local.pid = pid
+        _local.connections = {}
+
+    db_path = _current_db_path()
+    conn = _local.connections.get(db_path)
+    if conn is None:
+        conn = _open_connection(db_path)
+        _local.connections[db_path] = conn
+    return conn
+
+
+def close_connections() -> None:
+    """Close the calling thread's connections."""
+    if getattr(_local, "pid", None) == os.getpid():
+        for conn in _local.connections.values():
+            conn.close()
+    _local.pid = os.getpid()
+    _local.connections = {}
+
+
+@contextmanager
+def transaction():
+    """
+    Run the enclosed statements in one write transaction and yield a cursor.
+
+    Commits on success and rolls back if the block raises. BEGIN IMMEDIATE takes
+    the write lock up front so concurrent writers wait on the busy timeout
+    instead of failing mid-transaction. Nested uses join the outer transaction.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn.cursor()
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+WRITER_BATCH_SIZE = 64
+
+
+class HistoryWriter:
+    """
+    Single thread that performs every print history write.
+
+    Commands queued while a transaction is running are committed together in
+    the next one, each inside its own savepoint so a failing command is rolled
+    back alone. Callers get a Future that resolves once the command's
+    transaction has committed. The MQTT thread and the web threads therefore
+    never compete for the SQLite write lock.
+    """
+
+    def __init__(self, batch_size: int = WRITER_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.batches = 0
+        self.commands = 0
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="print-history-writer", daemon=True)
+            self._thread.start()
+
+    def runs_inline(self) -> bool:
+        # The writer itself, and callers already inside a transaction, write directly
+        # instead of queueing behind a lock they hold.
+        return threading.current_thread() is self._thread or get_connection().in_transaction
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        """Queue ``func(*args, **kwargs)`` and return a Future for its result."""
+        future = Future()
+        if self.runs_inline():
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as exc:
+                future.set_exception(exc)
+            return future
+
+        self._ensure_started()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def call(self, func, *args, **kwargs):
+        """Run ``func`` on the writer and wait until its transaction has committed."""
+        if self.runs_inline():
+            return func(*args, **kwargs)
+        return self.submit(func, *args, **kwargs).result()
+
+    def flush(self) -> None:
+        """Wait until every command queued so far has been committed."""
+        if self._thread is not None and not self.runs_inline():
+            self.submit(lambda: None).result()
+
+    def stop(self) -> None:
+        """Commit the queued commands and stop the thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        thread.join(timeout=10)
+
+    def _run(self) -> None:
+        while True:
+            command = self._queue.get()
+            if command is None:
+                return
+            batch = [command]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    command = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if command is None:
+                    stop = True
+                    break
+                batch.append(command)
+
+            self._execute(batch)
+            if stop:
+                return
+
+    def _execute(self, batch: list) -> None:
+        batch = [command for command in batch if command[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        results = []
+        try:
+            with transaction():
+                conn = get_connection()
+                for _, func, args, kwargs in batch:
+                    conn.execute("SAVEPOINT history_command")
+                    try:
+                        results.append((True, func(*args, **kwargs)))
+                    except Exception as exc:
+                        conn.execute("ROLLBACK TO history_command")
+                        results.append((False, exc))
+                    conn.execute("RELEASE history_command")
+        except Exception as exc:
+            print(f"[print-history] Write transaction failed: {exc}")
+            for future, *_ in batch:
+                future.set_exception(exc)
+            return
+
+        self.batches += 1
+        self.commands += len(batch)
+        for (future, *_), (ok, value) in zip(batch, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+_writer = HistoryWriter()
+atexit.register(_writer.stop)
+
+
+def get_writer() -> HistoryWriter:
+    return _writer
+
+
+def _serialized_write(func):
+    """Run the decorated write on the writer thread and return its committed result."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return _writer.call(func, *args, **kwargs)
+
+    return wrapper
+
+
+def _add_missing_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> None:
+    cursor.execute(f"PRAGMA table_info({table})")
+    columns = {row[1] for row in cursor.fetchall()}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _migrate_base_schema(cursor: sqlite3.Cursor) -> None:
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS prints (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -76,31 +326,337 @@ def create_database() -> None:
         )
     ''')
 
-    _ensure_column(
-        cursor,
-        "filament_usage",
-        "estimated_grams",
-        "REAL",
-    )
+    # Databases created before schema versioning may lack later columns
+    _add_missing_column(cursor, "filament_usage", "estimated_grams", "REAL")
+    _add_missing_column(cursor, "print_layer_tracking", "predicted_end_time", "TEXT")
+    _add_missing_column(cursor, "print_layer_tracking", "actual_end_time", "TEXT")
 
-    # Ensure column definitions exist for older databases
-    _ensure_column(
-        cursor,
-        "print_layer_tracking",
-        "predicted_end_time",
-        "TEXT",
-    )
-    _ensure_column(
-        cursor,
-        "print_layer_tracking",
-        "actual_end_time",
-        "TEXT",
-    )
 
-    conn.commit()
-    conn.close()
+def _migrate_query_indexes(cursor: sqlite3.Cursor) -> None:
+    # Slot lookups/updates and the per-print filament subquery filter on (print_id, ams_slot)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_filament_usage_print_slot
+        ON filament_usage (print_id, ams_slot)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_filament_usage_spool
+        ON filament_usage (spool_id)
+    ''')
+    # The history page sorts by date; id breaks ties between prints started in the same second
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_prints_date
+        ON prints (print_date, id)
+    ''')
+
+
+def _migrate_print_count(cursor: sqlite3.Cursor) -> None:
+    # Row counts kept current by triggers, so pagination does not need COUNT(*)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_counts (
+            name TEXT PRIMARY KEY,
+            row_count INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO table_counts (name, row_count)
+        SELECT 'prints', COUNT(*) FROM prints
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS prints_count_insert AFTER INSERT ON prints
+        BEGIN
+            UPDATE table_counts SET row_count = row_count + 1 WHERE name = 'prints';
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS prints_count_delete AFTER DELETE ON prints
+        BEGIN
+            UPDATE table_counts SET row_count = row_count - 1 WHERE name = 'prints';
+        END
+    ''')
+
+
+# Rollup maintenance shared by the filament_usage triggers. {row} is NEW or OLD;
+# {spool_changed} limits the per-spool print count to rows whose spool changed.
+_ROLLUP_ADD = '''
+    INSERT OR IGNORE INTO spool_usage_rollup (spool_id) SELECT {row}.spool_id WHERE {row}.spool_id IS NOT NULL;
+    UPDATE spool_usage_rollup
+    SET grams_used = grams_used + {row}.grams_used,
+        print_count = print_count + ({spool_changed} AND NOT EXISTS (
+            SELECT 1 FROM filament_usage
+            WHERE print_id = {row}.print_id AND spool_id = {row}.spool_id AND id != {row}.id
+        ))
+    WHERE spool_id = {row}.spool_id;
+
+    INSERT OR IGNORE INTO material_usage_rollup (filament_type) VALUES ({row}.filament_type);
+    UPDATE material_usage_rollup
+    SET grams_used = grams_used + {row}.grams_used, usage_count = usage_count + 1
+    WHERE filament_type = {row}.filament_type;
+
+    UPDATE daily_usage_rollup
+    SET grams_used = grams_used + {row}.grams_used
+    WHERE day = (SELECT substr(print_date, 1, 10) FROM prints WHERE id = {row}.print_id);
+'''
 
+_ROLLUP_SUBTRACT = '''
+    UPDATE spool_usage_rollup
+    SET grams_used = grams_used - {row}.grams_used,
+        print_count = print_count - ({spool_changed} AND NOT EXISTS (
+            SELECT 1 FROM filament_usage WHERE print_id = {row}.print_id AND spool_id = {row}.spool_id
+        ))
+    WHERE spool_id = {row}.spool_id;
 
+    UPDATE material_usage_rollup
+    SET grams_used = grams_used - {row}.grams_used, usage_count = usage_count - 1
+    WHERE filament_type = {row}.filament_type;
+
+    UPDATE daily_usage_rollup
+    SET grams_used = grams_used - {row}.grams_used
+    WHERE day = (SELECT substr(print_date, 1, 10) FROM prints WHERE id = {row}.print_id);
+'''
+
+
+def _rebuild_usage_rollups(cursor: sqlite3.Cursor) -> None:
+    cursor.execute("DELETE FROM spool_usage_rollup")
+    cursor.execute("DELETE FROM material_usage_rollup")
+    cursor.execute("DELETE FROM daily_usage_rollup")
+    cursor.execute('''
+        INSERT INTO spool_usage_rollup (spool_id, print_count, grams_used)
+        SELECT spool_id, COUNT(DISTINCT print_id), TOTAL(grams_used)
+        FROM filament_usage
+        WHERE spool_id IS NOT NULL
+        GROUP BY spool_id
+    ''')
+    cursor.execute('''
+        INSERT INTO material_usage_rollup (filament_type, usage_count, grams_used)
+        SELECT filament_type, COUNT(*), TOTAL(grams_used)
+        FROM filament_usage
+        GROUP BY filament_type
+    ''')
+    cursor.execute('''
+        INSERT INTO daily_usage_rollup (day, print_count, grams_used)
+        SELECT substr(p.print_date, 1, 10), COUNT(*),
+               TOTAL((SELECT TOTAL(f.grams_used) FROM filament_usage f WHERE f.print_id = p.id))
+        FROM prints p
+        GROUP BY substr(p.print_date, 1, 10)
+    ''')
+
+
+def _migrate_usage_rollups(cursor: sqlite3.Cursor) -> None:
+    # Aggregates per spool, material and day, kept current by triggers in the
+    # same transaction as the filament_usage write that changes them
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS spool_usage_rollup (
+            spool_id INTEGER PRIMARY KEY,
+            print_count INTEGER NOT NULL DEFAULT 0,
+            grams_used REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS material_usage_rollup (
+            filament_type TEXT PRIMARY KEY,
+            usage_count INTEGER NOT NULL DEFAULT 0,
+            grams_used REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_usage_rollup (
+            day TEXT PRIMARY KEY,
+            print_count INTEGER NOT NULL DEFAULT 0,
+            grams_used REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS prints_daily_insert AFTER INSERT ON prints
+        BEGIN
+            INSERT OR IGNORE INTO daily_usage_rollup (day) VALUES (substr(NEW.print_date, 1, 10));
+            UPDATE daily_usage_rollup SET print_count = print_count + 1 WHERE day = substr(NEW.print_date, 1, 10);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS prints_daily_delete AFTER DELETE ON prints
+        BEGIN
+            UPDATE daily_usage_rollup
+            SET print_count = print_count - 1,
+                grams_used = grams_used - (SELECT TOTAL(grams_used) FROM filament_usage WHERE print_id = OLD.id)
+            WHERE day = substr(OLD.print_date, 1, 10);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS filament_usage_rollup_insert AFTER INSERT ON filament_usage
+        BEGIN
+            {_ROLLUP_ADD.format(row="NEW", spool_changed="1")}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS filament_usage_rollup_delete AFTER DELETE ON filament_usage
+        BEGIN
+            {_ROLLUP_SUBTRACT.format(row="OLD", spool_changed="1")}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS filament_usage_rollup_update
+        AFTER UPDATE OF spool_id, grams_used, filament_type ON filament_usage
+        BEGIN
+            {_ROLLUP_SUBTRACT.format(row="OLD", spool_changed="OLD.spool_id IS NOT NEW.spool_id")}
+            {_ROLLUP_ADD.format(row="NEW", spool_changed="OLD.spool_id IS NOT NEW.spool_id")}
+        END
+    ''')
+
+    _rebuild_usage_rollups(cursor)
+
+
+def _migrate_search(cursor: sqlite3.Cursor) -> None:
+    # Filter indexes for the history search
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_filament_usage_material
+        ON filament_usage (filament_type, color)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_layer_tracking_status
+        ON print_layer_tracking (status)
+    ''')
+
+    # Full-text index over file names; search falls back to LIKE when SQLite lacks FTS5
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS prints_fts
+            USING fts5(file_name, content='prints', content_rowid='id')
+        ''')
+    except sqlite3.OperationalError as exc:
+        print(f"[print-history] FTS5 unavailable ({exc}), file name search uses LIKE")
+        return
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS prints_fts_insert AFTER INSERT ON prints
+        BEGIN
+            INSERT INTO prints_fts (rowid, file_name) VALUES (NEW.id, NEW.file_name);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS prints_fts_delete AFTER DELETE ON prints
+        BEGIN
+            INSERT INTO prints_fts (prints_fts, rowid, file_name) VALUES ('delete', OLD.id, OLD.file_name);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS prints_fts_update AFTER UPDATE OF file_name ON prints
+        BEGIN
+            INSERT INTO prints_fts (prints_fts, rowid, file_name) VALUES ('delete', OLD.id, OLD.file_name);
+            INSERT INTO prints_fts (rowid, file_name) VALUES (NEW.id, NEW.file_name);
+        END
+    ''')
+    cursor.execute("INSERT INTO prints_fts (prints_fts) VALUES ('rebuild')")
+
+
+def _migrate_analytics(cursor: sqlite3.Cursor) -> None:
+    # Counters bumped by every change that affects recorded usage, so callers can
+    # cache aggregates and recompute them only when the counter moves
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS state_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO state_versions (name) VALUES ('usage')")
+
+    # Covers the per-material cost aggregation without reading the table
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_filament_usage_material_spool
+        ON filament_usage (filament_type, spool_id, grams_used)
+    ''')
+
+    bump = "BEGIN UPDATE state_versions SET version = version + 1 WHERE name = 'usage'; END"
+    for trigger, event in (
+        ("filament_usage_version_insert", "AFTER INSERT ON filament_usage"),
+        ("filament_usage_version_delete", "AFTER DELETE ON filament_usage"),
+        ("filament_usage_version_update", "AFTER UPDATE ON filament_usage"),
+        ("prints_version_insert", "AFTER INSERT ON prints"),
+        ("prints_version_delete", "AFTER DELETE ON prints"),
+        ("prints_version_update", "AFTER UPDATE OF print_date ON prints"),
+    ):
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger} {event} {bump}")
+
+
+def _migrate_filament_cost(cursor: sqlite3.Cursor) -> None:
+    # Cost is stored when grams are billed or a spool is assigned, so rendering the
+    # history needs no SpoolMan prices. Rows recorded before this have a spool but
+    # no price until backfill_filament_costs() fills them in.
+    _add_missing_column(cursor, "filament_usage", "cost_per_gram", "REAL")
+    _add_missing_column(cursor, "filament_usage", "cost", "REAL")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_filament_usage_missing_cost
+        ON filament_usage (id) WHERE spool_id IS NOT NULL AND cost_per_gram IS NULL
+    ''')
+
+
+def _migrate_history_version(cursor: sqlite3.Cursor) -> None:
+    # Unlike 'usage', this counter also moves for thumbnails, names and layer
+    # progress, so anything serving the prints themselves can be versioned by it
+    cursor.execute("INSERT OR IGNORE INTO state_versions (name) VALUES ('history')")
+    bump = "BEGIN UPDATE state_versions SET version = version + 1 WHERE name = 'history'; END"
+    for table in ("prints", "filament_usage", "print_layer_tracking"):
+        for event in ("INSERT", "DELETE", "UPDATE"):
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_history_{event.lower()} AFTER {event} ON {table} {bump}"
+            )
+
+
+# Schema migrations, applied in order. The position in this list (1-based) is
+# the schema version stored in PRAGMA user_version; only append new entries.
+MIGRATIONS = (
+    _migrate_base_schema,
+    _migrate_query_indexes,
+    _migrate_print_count,
+    _migrate_usage_rollups,
+    _migrate_search,
+    _migrate_analytics,
+    _migrate_filament_cost,
+    _migrate_history_version,
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version() -> int:
+    return get_connection().execute("PRAGMA user_version").fetchone()[0]
+
+
+def create_database() -> None:
+    """
+    Create the SQLite schema or upgrade an existing database to SCHEMA_VERSION.
+
+    Each pending migration runs in its own transaction together with the
+    user_version bump, so an interrupted upgrade resumes where it stopped.
+    """
+    db_path = Path(_current_db_path())
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    _enable_incremental_vacuum()
+    if get_schema_version() >= SCHEMA_VERSION:
+        return
+
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        with transaction() as cursor:
+            # Re-read inside the write lock in case another process migrated concurrently
+            if cursor.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {version}")
+            print(f"[print-history] Migrated database to schema version {version}")
+
+
+def _enable_incremental_vacuum() -> None:
+    # Databases created before incremental auto-vacuum need one full VACUUM.
+    # It holds the write lock for the whole rebuild, so it runs here at startup,
+    # before the MQTT thread and the usage tracker write to the history.
+    conn = get_connection()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        print("[print-history] Enabled incremental vacuum")
+
+
+@_serialized_write
 def insert_print(file_name: str, print_type: str, image_file: str = None, print_date: str = None) -> int:
     """
     Inserts a new print job into the database and returns the print ID.
@@ -109,17 +665,14 @@ def insert_print(file_name: str, print_type: str, image_file: str = None, print_
     if print_date is None:
         print_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    conn = sqlite3.connect(db_config["db_path"])
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO prints (print_date, file_name, print_type, image_file)
-        VALUES (?, ?, ?, ?)
-    ''', (print_date, file_name, print_type, image_file))
-    print_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return print_id
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO prints (print_date, file_name, print_type, image_file)
+            VALUES (?, ?, ?, ?)
+        ''', (print_date, file_name, print_type, image_file))
+        return cursor.lastrowid
 
+@_serialized_write
 def insert_filament_usage(
     print_id: int,
     filament_type: str,
@@ -127,78 +680,155 @@ def insert_filament_usage(
     grams_used: float,
     ams_slot: int,
     estimated_grams: float | None = None,
-) -> None:
+) -> int:
     """
-    Inserts a new filament usage entry for a specific print job.
+    Inserts a new filament usage entry for a specific print job and returns its ID.
     """
-    conn = sqlite3.connect(db_config["db_path"])
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO filament_usage (print_id, filament_type, color, grams_used, ams_slot, estimated_grams)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (print_id, filament_type, color, grams_used, ams_slot, estimated_grams))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO filament_usage (print_id, filament_type, color, grams_used, ams_slot, estimated_grams)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (print_id, filament_type, color, grams_used, ams_slot, estimated_grams))
+        return cursor.lastrowid
 
-def update_filament_spool(print_id: int, filament_id: int, spool_id: int) -> None:
+@_serialized_write
+def record_print_start(print_job: dict, filaments: list[dict]) -> tuple[int, list[int]]:
     """
-    Updates the spool_id for a given filament usage entry, ensuring it belongs to the specified print job.
+    Inserts a print job together with its filament usage entries in a single transaction.
+
+    ``print_job`` holds the insert_print arguments and each entry of ``filaments``
+    the insert_filament_usage arguments except ``print_id``. Either everything is
+    stored or, if any insert fails, nothing is. Returns the print ID and the
+    filament usage IDs in the order of ``filaments``.
     """
-    conn = sqlite3.connect(db_config["db_path"])
-    cursor = conn.cursor()
-    cursor.execute('''
+    with transaction():
+        print_id = insert_print(**print_job)
+        filament_ids = [insert_filament_usage(print_id, **filament) for filament in filaments]
+    return print_id, filament_ids
+
+FILAMENT_USAGE_UPDATE_COLUMNS = ("spool_id", "grams_used", "cost_per_gram")
+
+
+def _update_filament_usage(cursor: sqlite3.Cursor, print_id: int, ams_slot: int, values: dict) -> None:
+    """
+    Writes ``spool_id``, ``grams_used`` and/or ``cost_per_gram`` to a print's
+    filament usage entry and recomputes its stored cost from the new values.
+    """
+    values = {column: value for column, value in values.items() if column in FILAMENT_USAGE_UPDATE_COLUMNS}
+    if not values:
+        return
+
+    # SET expressions see the old row, so the cost uses the new values where given
+    grams = ":grams_used" if "grams_used" in values else "grams_used"
+    price = ":cost_per_gram" if "cost_per_gram" in values else "cost_per_gram"
+    assignments = ", ".join(f"{column} = :{column}" for column in values)
+    cursor.execute(f'''
         UPDATE filament_usage
-        SET spool_id = ?
-        WHERE ams_slot = ? AND print_id = ?
-    ''', (spool_id, filament_id, print_id))
-    conn.commit()
-    conn.close()
+        SET {assignments}, cost = {grams} * {price}
+        WHERE ams_slot = :ams_slot AND print_id = :print_id
+    ''', {**values, "ams_slot": ams_slot, "print_id": print_id})
 
+@_serialized_write
+def update_filament_spool(print_id: int, filament_id: int, spool_id: int, cost_per_gram: float | None = None) -> None:
+    """
+    Updates the spool_id for a given filament usage entry, ensuring it belongs to the specified print job.
+    ``cost_per_gram`` is the new spool's price; the entry's cost is recomputed from it.
+    """
+    with transaction() as cursor:
+        _update_filament_usage(cursor, print_id, filament_id, {"spool_id": spool_id, "cost_per_gram": cost_per_gram})
+
+@_serialized_write
 def update_filament_grams_used(print_id: int, filament_id: int, grams_used: float) -> None:
     """
     Updates the grams_used for a given filament usage entry, ensuring it belongs to the specified print job.
     """
-    conn = sqlite3.connect(db_config["db_path"])
-    cursor = conn.cursor()
+    with transaction() as cursor:
+        _update_filament_usage(cursor, print_id, filament_id, {"grams_used": grams_used})
+
+def has_filament_costs_missing() -> bool:
+    """
+    Returns True if any filament usage entry of the current database has a
+    spool but no stored price.
+    """
+    row = get_connection().execute(
+        "SELECT EXISTS (SELECT 1 FROM filament_usage WHERE spool_id IS NOT NULL AND cost_per_gram IS NULL)"
+    ).fetchone()
+    return bool(row[0])
+
+def _price_missing_costs(cursor: sqlite3.Cursor, spool_prices: dict[int, float]) -> int:
+    _load_spool_prices(cursor.connection, spool_prices)
     cursor.execute('''
         UPDATE filament_usage
-        SET grams_used = ?
-        WHERE ams_slot = ? AND print_id = ?
-    ''', (grams_used, filament_id, print_id))
-    conn.commit()
-    conn.close()
+        SET cost_per_gram = (SELECT sp.cost_per_gram FROM temp.spool_prices sp WHERE sp.spool_id = filament_usage.spool_id)
+        WHERE spool_id IN (SELECT spool_id FROM temp.spool_prices) AND cost_per_gram IS NULL
+    ''')
+    updated = cursor.rowcount
+    cursor.execute('''
+        UPDATE filament_usage
+        SET cost = grams_used * cost_per_gram
+        WHERE cost IS NULL AND cost_per_gram IS NOT NULL
+    ''')
+    return updated
 
+@_serialized_write
+def _backfill_live_filament_costs(spool_prices: dict[int, float]) -> int:
+    with transaction() as cursor:
+        return _price_missing_costs(cursor, spool_prices)
 
-def get_prints_with_filament(limit: int | None = None, offset: int | None = None):
+def backfill_filament_costs(spool_prices: dict[int, float]) -> int:
     """
-    Retrieves print jobs along with their associated filament usage, grouped by print job.
+    Stores the price and cost of filament usage entries, live and archived,
+    that have a spool but no price yet and returns how many were updated.
 
-    A total count is returned to support pagination.
+    ``spool_prices`` maps spool IDs to their cost per gram. Entries of spools
+    missing from it keep a NULL price, so their cost stays unknown until a
+    later run finds a price for the spool.
     """
-    conn = sqlite3.connect(db_config["db_path"])
-    conn.row_factory = sqlite3.Row  # Enable column name access
+    updated = _backfill_live_filament_costs(spool_prices)
+    # Writes to the archive do not go through the writer thread, like archive_prints()
+    with reading_archive():
+        if has_filament_costs_missing():
+            with transaction() as cursor:
+                updated += _price_missing_costs(cursor, spool_prices)
+    return updated
 
-    count_cursor = conn.cursor()
-    count_cursor.execute("SELECT COUNT(*) FROM prints")
-    total_count = count_cursor.fetchone()[0]
 
-    cursor = conn.cursor()
-    query = '''
-        SELECT p.id AS id, p.print_date AS print_date, p.file_name AS file_name,
-               p.print_type AS print_type, p.image_file AS image_file,
-       (
-           SELECT json_group_array(json_object(
-               'spool_id', f.spool_id,
-                'filament_type', f.filament_type,
-                'color', f.color,
-                'grams_used', f.grams_used,
-                'estimated_grams', f.estimated_grams,
-                'ams_slot', f.ams_slot
-            )) FROM filament_usage f WHERE f.print_id = p.id
-        ) AS filament_info
-        FROM prints p
-        ORDER BY p.print_date DESC
-    '''
+_PRINTS_WITH_FILAMENT_QUERY = '''
+    SELECT p.id AS id, p.print_date AS print_date, p.file_name AS file_name,
+           p.print_type AS print_type, p.image_file AS image_file,
+   (
+       SELECT json_group_array(json_object(
+           'spool_id', f.spool_id,
+            'filament_type', f.filament_type,
+            'color', f.color,
+            'grams_used', f.grams_used,
+            'estimated_grams', f.estimated_grams,
+            'ams_slot', f.ams_slot,
+            'cost_per_gram', f.cost_per_gram,
+            'cost', f.cost
+        )) FROM filament_usage f WHERE f.print_id = p.id
+    ) AS filament_info
+    FROM prints p
+'''
+
+
+def count_prints() -> int:
+    """
+    Returns the number of prints from the trigger-maintained counter.
+    """
+    row = get_connection().execute("SELECT row_count FROM table_counts WHERE name = 'prints'").fetchone()
+    return row[0] if row else 0
+
+def get_prints_with_filament(limit: int | None = None, offset: int | None = None):
+    """
+    Retrieves print jobs along with their associated filament usage, grouped by print job.
+
+    A total count is returned to support pagination. Prefer get_prints_page for
+    paging through the history; OFFSET has to walk past every skipped row.
+    """
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row  # Enable column name access
+    query = _PRINTS_WITH_FILAMENT_QUERY + " ORDER BY p.print_date DESC, p.id DESC"
     params: list[int] = []
     if limit is not None:
         query += " LIMIT ?"
@@ -209,88 +839,584 @@ def get_prints_with_filament(limit: int | None = None, offset: int | None = None
 
     cursor.execute(query, params)
     prints = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return prints, total_count
+    return prints, count_prints()
+
+def encode_print_cursor(print_row) -> str:
+    """
+    Returns the pagination cursor for a print row: its ``print_date`` and ``id``.
+    """
+    return f"{print_row['print_date']}|{print_row['id']}"
+
+def decode_print_cursor(cursor: str | None) -> tuple[str, int] | None:
+    """
+    Parses a cursor from encode_print_cursor, returning None if it is malformed.
+    """
+    try:
+        print_date, print_id = cursor.rsplit("|", 1)
+        return print_date, int(print_id)
+    except (AttributeError, ValueError):
+        return None
+
+# Keys accepted in the ``filters`` of get_prints_page and get_print_facets
+SEARCH_FILTERS = ("query", "material", "color", "spool_id", "status", "date_from", "date_to")
+
+def _has_fts() -> bool:
+    row = get_connection().execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'prints_fts'"
+    ).fetchone()
+    return row is not None
+
+def _filter_conditions(filters: dict | None, exclude: str | None = None) -> tuple[list[str], list]:
+    """
+    Builds the WHERE conditions (on ``prints p``) and parameters for the search filters.
+
+    ``query`` matches words at the start of file name tokens; material, color and
+    spool must match the same filament entry; dates are inclusive YYYY-MM-DD days.
+    ``exclude`` skips one filter, for facet counts.
+    """
+    filters = {key: value for key, value in (filters or {}).items() if value not in (None, "") and key != exclude}
+    conditions: list[str] = []
+    params: list = []
+
+    if "query" in filters:
+        terms = re.findall(r"\w+", str(filters["query"]))
+        if terms and _has_fts():
+            conditions.append("p.id IN (SELECT rowid FROM prints_fts WHERE prints_fts MATCH ?)")
+            params.append(" ".join(f'"{term}"*' for term in terms))
+        elif terms:
+            for term in terms:
+                conditions.append("p.file_name LIKE ? ESCAPE '\\'")
+                params.append("%" + re.sub(r"([\\%_])", r"\\\1", term) + "%")
+
+    usage_conditions = []
+    if "material" in filters:
+        usage_conditions.append("f.filament_type = ?")
+    if "color" in filters:
+        usage_conditions.append("f.color = ? COLLATE NOCASE")
+    if "spool_id" in filters:
+        usage_conditions.append("f.spool_id = ?")
+    if usage_conditions:
+        conditions.append(
+            f"p.id IN (SELECT f.print_id FROM filament_usage f WHERE {' AND '.join(usage_conditions)})"
+        )
+        params.extend(filters[key] for key in ("material", "color", "spool_id") if key in filters)
+
+    if "status" in filters:
+        conditions.append("p.id IN (SELECT print_id FROM print_layer_tracking WHERE status = ?)")
+        params.append(str(filters["status"]).upper())
+    if "date_from" in filters:
+        conditions.append("p.print_date >= ?")
+        params.append(filters["date_from"])
+    if "date_to" in filters:
+        conditions.append("p.print_date < date(?, '+1 day')")
+        params.append(filters["date_to"])
+    return conditions, params
+
+def count_matching_prints(filters: dict | None = None) -> int:
+    """
+    Returns the number of prints matching ``filters`` (all prints without filters).
+    """
+    conditions, params = _filter_conditions(filters)
+    if not conditions:
+        return count_prints()
+    row = get_connection().execute(
+        f"SELECT COUNT(*) FROM prints p WHERE {' AND '.join(conditions)}", params
+    ).fetchone()
+    return row[0]
+
+def get_print_facets(filters: dict | None = None) -> dict:
+    """
+    Returns the number of matching prints per material and per tracking status.
+
+    Each facet ignores its own filter, so the counts show what selecting another
+    material or status would return.
+    """
+    conn = get_connection()
+    conditions, params = _filter_conditions(filters, exclude="material")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    materials = conn.execute(f'''
+        SELECT f.filament_type, COUNT(DISTINCT f.print_id) AS print_count
+        FROM filament_usage f
+        WHERE f.print_id IN (SELECT p.id FROM prints p {where})
+        GROUP BY f.filament_type
+        ORDER BY print_count DESC, f.filament_type
+    ''', params).fetchall()
+
+    conditions, params = _filter_conditions(filters, exclude="status")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    statuses = conn.execute(f'''
+        SELECT t.status, COUNT(*) AS print_count
+        FROM print_layer_tracking t
+        WHERE t.print_id IN (SELECT p.id FROM prints p {where})
+        GROUP BY t.status
+        ORDER BY print_count DESC, t.status
+    ''', params).fetchall()
+
+    return {
+        "materials": [{"value": value, "count": count} for value, count in materials],
+        "statuses": [{"value": value, "count": count} for value, count in statuses],
+    }
+
+def get_prints_page(
+    limit: int,
+    before: str | None = None,
+    after: str | None = None,
+    filters: dict | None = None,
+) -> dict:
+    """
+    Retrieves one page of print jobs, newest first, using keyset pagination on (print_date, id).
+
+    ``before`` continues with the prints older than that cursor (the next page);
+    ``after`` returns the prints just newer than it (the previous page). Both
+    seek straight into the date index, so every page costs the same as the first.
+    ``filters`` narrows the history, see SEARCH_FILTERS.
+    Returns the ``prints``, the ``total_count`` of matching prints and the
+    ``next_cursor`` and ``prev_cursor`` (None when there is no older or newer page).
+    """
+    position = decode_print_cursor(after) if after else decode_print_cursor(before)
+    backwards = bool(after) and position is not None
+
+    conditions, params = _filter_conditions(filters)
+    order = "DESC"
+    if position is not None:
+        conditions.append(f"(p.print_date, p.id) {'>' if backwards else '<'} (?, ?)")
+        params.extend(position)
+        order = "ASC" if backwards else "DESC"
+
+    query = _PRINTS_WITH_FILAMENT_QUERY
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY p.print_date {order}, p.id {order} LIMIT ?"
+    params.append(limit + 1)  # One extra row tells whether another page follows
+
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    prints = [dict(row) for row in rows]
+
+    has_newer = has_more if backwards else position is not None
+    has_older = True if backwards else has_more
+    return {
+        "prints": prints,
+        "total_count": count_matching_prints(filters),
+        "next_cursor": encode_print_cursor(prints[-1]) if prints and has_older else None,
+        "prev_cursor": encode_print_cursor(prints[0]) if prints and has_newer else None,
+    }
+
+@_serialized_write
+def rebuild_usage_rollups() -> None:
+    """
+    Recomputes the per-spool, per-material and per-day rollups from the history.
+
+    The triggers keep them current; a rebuild is only needed after editing the
+    tables by hand or to clear accumulated floating point drift.
+    """
+    with transaction() as cursor:
+        _rebuild_usage_rollups(cursor)
+
+def get_spool_usage(spool_id: int) -> dict:
+    """
+    Returns the number of prints and total grams recorded for a spool.
+    """
+    row = get_connection().execute(
+        "SELECT print_count, grams_used FROM spool_usage_rollup WHERE spool_id = ?", (spool_id,)
+    ).fetchone()
+    print_count, grams_used = row if row else (0, 0.0)
+    return {"spool_id": spool_id, "print_count": print_count, "grams_used": grams_used}
+
+def get_material_usage() -> list[dict]:
+    """
+    Returns the number of filament entries and total grams per material, most used first.
+    """
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute('''
+        SELECT filament_type, usage_count, grams_used FROM material_usage_rollup
+        WHERE usage_count > 0
+        ORDER BY grams_used DESC
+    ''')
+    return [dict(row) for row in cursor.fetchall()]
+
+def get_daily_usage(start_day: str | None = None, end_day: str | None = None) -> list[dict]:
+    """
+    Returns prints and grams per day (YYYY-MM-DD), oldest first, optionally limited to a day range.
+    """
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute('''
+        SELECT day, print_count, grams_used FROM daily_usage_rollup
+        WHERE day >= coalesce(?, day) AND day <= coalesce(?, day)
+        ORDER BY day
+    ''', (start_day, end_day))
+    return [dict(row) for row in cursor.fetchall()]
+
+def get_usage_version() -> int:
+    """
+    Returns a counter that changes whenever prints or filament usage change.
+    """
+    row = get_connection().execute("SELECT version FROM state_versions WHERE name = 'usage'").fetchone()
+    return row[0] if row else 0
+
+def get_history_version() -> int:
+    """
+    Returns a counter that changes whenever anything stored about a print changes.
+    """
+    row = get_connection().execute("SELECT version FROM state_versions WHERE name = 'history'").fetchone()
+    return row[0] if row else 0
+
+def get_usage_by_spool() -> list[dict]:
+    """
+    Returns the number of prints and total grams for every spool with recorded usage.
+    """
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute('''
+        SELECT spool_id, print_count, grams_used FROM spool_usage_rollup
+        WHERE print_count > 0
+        ORDER BY spool_id
+    ''')
+    return [dict(row) for row in cursor.fetchall()]
+
+def _load_spool_prices(conn: sqlite3.Connection, spool_prices: dict[int, float]) -> None:
+    # Connection-local temp table, so cost can be summed in SQL without touching the history tables
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS spool_prices (spool_id INTEGER PRIMARY KEY, cost_per_gram REAL NOT NULL)")
+    conn.execute("SAVEPOINT spool_prices")
+    conn.execute("DELETE FROM temp.spool_prices")
+    conn.executemany("INSERT INTO temp.spool_prices (spool_id, cost_per_gram) VALUES (?, ?)", spool_prices.items())
+    conn.execute("RELEASE spool_prices")
+
+# Grams of entries with neither a stored cost nor a known price: their cost is unknown, not zero
+_UNPRICED_GRAMS = "TOTAL(CASE WHEN coalesce(f.cost, f.grams_used * sp.cost_per_gram) IS NULL THEN f.grams_used END)"
+
+def get_material_cost(spool_prices: dict[int, float]) -> list[dict]:
+    """
+    Returns filament entries, grams, cost and unpriced grams per material, most used first.
+
+    Stored costs are used where present; ``spool_prices`` (spool ID to cost per
+    gram) prices the remaining entries. Usage that neither prices is left out
+    of the cost and counted in ``unpriced_grams``.
+    """
+    conn = get_connection()
+    _load_spool_prices(conn, spool_prices)
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(f'''
+        SELECT f.filament_type, COUNT(*) AS usage_count, TOTAL(f.grams_used) AS grams_used,
+               TOTAL(coalesce(f.cost, f.grams_used * sp.cost_per_gram)) AS cost,
+               {_UNPRICED_GRAMS} AS unpriced_grams
+        FROM filament_usage f
+        LEFT JOIN temp.spool_prices sp ON sp.spool_id = f.spool_id
+        GROUP BY f.filament_type
+        ORDER BY grams_used DESC
+    ''')
+    return [dict(row) for row in cursor.fetchall()]
+
+def get_spool_cost(spool_prices: dict[int, float]) -> dict[int, dict]:
+    """
+    Returns the cost and unpriced grams recorded per spool.
+
+    Stored costs are used where present; ``spool_prices`` (spool ID to cost per
+    gram) prices the remaining entries.
+    """
+    conn = get_connection()
+    _load_spool_prices(conn, spool_prices)
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(f'''
+        SELECT f.spool_id, TOTAL(coalesce(f.cost, f.grams_used * sp.cost_per_gram)) AS cost,
+               {_UNPRICED_GRAMS} AS unpriced_grams
+        FROM filament_usage f
+        LEFT JOIN temp.spool_prices sp ON sp.spool_id = f.spool_id
+        WHERE f.spool_id IS NOT NULL
+        GROUP BY f.spool_id
+    ''')
+    return {row["spool_id"]: {"cost": row["cost"], "unpriced_grams": row["unpriced_grams"]} for row in cursor.fetchall()}
+
+def get_daily_cost(spool_prices: dict[int, float], start_day: str | None = None, end_day: str | None = None) -> list[dict]:
+    """
+    Returns prints, grams, cost and unpriced grams per day (YYYY-MM-DD), oldest
+    first, optionally limited to a day range.
+
+    Stored costs are used where present; ``spool_prices`` (spool ID to cost per
+    gram) prices the remaining entries. Usage that neither prices is left out
+    of the cost and counted in ``unpriced_grams``.
+    """
+    conn = get_connection()
+    _load_spool_prices(conn, spool_prices)
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(f'''
+        SELECT d.day, d.print_count, d.grams_used, coalesce(c.cost, 0) AS cost,
+               coalesce(c.unpriced_grams, 0) AS unpriced_grams
+        FROM daily_usage_rollup d
+        LEFT JOIN (
+            SELECT substr(p.print_date, 1, 10) AS day, TOTAL(coalesce(f.cost, f.grams_used * sp.cost_per_gram)) AS cost,
+                   {_UNPRICED_GRAMS} AS unpriced_grams
+            FROM prints p
+            JOIN filament_usage f ON f.print_id = p.id
+            LEFT JOIN temp.spool_prices sp ON sp.spool_id = f.spool_id
+            WHERE p.print_date >= coalesce(?1, '') AND p.print_date < date(coalesce(?2, '9999-12-30'), '+1 day')
+            GROUP BY day
+        ) c ON c.day = d.day
+        WHERE d.day >= coalesce(?1, d.day) AND d.day <= coalesce(?2, d.day) AND d.print_count > 0
+        ORDER BY d.day
+    ''', (start_day, end_day))
+    return [dict(row) for row in cursor.fetchall()]
 
 def get_prints_by_spool(spool_id: int):
     """
     Retrieves all print jobs that used a specific spool.
     """
-    conn = sqlite3.connect(db_config["db_path"])
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
     cursor.execute('''
         SELECT DISTINCT p.* FROM prints p
         JOIN filament_usage f ON p.id = f.print_id
         WHERE f.spool_id = ?
     ''', (spool_id,))
-    prints = cursor.fetchall()
-    conn.close()
-    return prints
+    return cursor.fetchall()
+
+def get_image_files() -> set[str]:
+    """
+    Returns the image file names referenced by any print.
+    """
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT DISTINCT image_file FROM prints WHERE image_file IS NOT NULL")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def get_referenced_image_files() -> set[str]:
+    """
+    Returns the image file names referenced by a print in either the live or
+    the archive database; only other files are safe to delete.
+    """
+    referenced = get_image_files()
+    with reading_archive():
+        referenced |= get_image_files()
+    return referenced
+
+
+ARCHIVE_BATCH_SIZE = 500
+VACUUM_STEP_PAGES = 256
+
+# Tables moved to the archive, with the column that refers to the print
+_ARCHIVED_TABLES = (("prints", "id"), ("filament_usage", "print_id"), ("print_layer_tracking", "print_id"))
+
+
+def _select_print_rows(table: str, key_column: str, print_ids: list[int]) -> tuple[list[str], list[tuple]]:
+    cursor = get_connection().execute(
+        f"SELECT * FROM {table} WHERE {key_column} IN (SELECT value FROM json_each(?))", (json.dumps(print_ids),)
+    )
+    return [column[0] for column in cursor.description], cursor.fetchall()
+
+
+@_serialized_write
+def _delete_prints(print_ids: list[int]) -> None:
+    with transaction() as cursor:
+        for table, key_column in reversed(_ARCHIVED_TABLES):
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {key_column} IN (SELECT value FROM json_each(?))", (json.dumps(print_ids),)
+            )
+
+
+def archive_prints(older_than_days: int, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Moves prints older than ``older_than_days``, with their filament usage and
+    layer tracking, to the archive database and returns how many were moved.
+
+    Each batch is copied to the archive first and then deleted from the live
+    database by the writer thread, so other writes only wait for one batch.
+    Copies are idempotent, which makes an interrupted run safe to repeat. The
+    usage rollups and the print count of each database cover its own prints.
+    """
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+    moved = 0
+    while True:
+        print_ids = [row[0] for row in get_connection().execute(
+            "SELECT id FROM prints WHERE print_date < ? ORDER BY print_date, id LIMIT ?", (cutoff, batch_size)
+        )]
+        if not print_ids:
+            return moved
+
+        batch = [(table, *_select_print_rows(table, key_column, print_ids)) for table, key_column in _ARCHIVED_TABLES]
+        with reading_archive(), transaction() as cursor:
+            for table, columns, rows in batch:
+                if rows:
+                    cursor.executemany(
+                        f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                        rows,
+                    )
+        _delete_prints(print_ids)
+        moved += len(print_ids)
+
+
+def compact_database(step_pages: int = VACUUM_STEP_PAGES) -> int:
+    """
+    Returns unused pages of the live database to the file system and returns
+    how many pages were released.
+
+    Free pages are released ``step_pages`` at a time so concurrent writers
+    only wait for one step. create_database() switched the database to
+    incremental auto-vacuum at startup; without it nothing is released.
+    """
+    conn = get_connection()
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    released = 0
+    while free_pages:
+        conn.execute(f"PRAGMA incremental_vacuum({step_pages})").fetchall()
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free_pages:
+            break
+        released += free_pages - remaining
+        free_pages = remaining
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return released
+
+
+EXPORT_BATCH_SIZE = 1000
+HISTORY_TABLES = tuple(table for table, _ in _ARCHIVED_TABLES)
+
+
+def table_columns(table: str) -> list[str]:
+    """Returns the column names of a print history table."""
+    if table not in HISTORY_TABLES:
+        raise ValueError(f"Unknown print history table: {table}")
+    return [row[1] for row in get_connection().execute(f"PRAGMA table_info({table})")]
+
+
+def iter_table_rows(table: str, after_id: int = 0, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+    """
+    Yields the rows of a print history table as dicts in id order.
+
+    Rows are fetched in batches of ``batch_size`` after the last id seen, so
+    memory use does not grow with the table and no read transaction stays open
+    while the caller consumes the rows.
+    """
+    columns = table_columns(table)
+    id_index = columns.index("id")
+    conn = get_connection()
+    while True:
+        rows = conn.execute(
+            f"SELECT {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (after_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield dict(zip(columns, row))
+        after_id = rows[-1][id_index]
+
+
+@_serialized_write
+def _insert_rows(table: str, columns: list[str], rows: list[tuple]) -> int:
+    with transaction() as cursor:
+        cursor.executemany(
+            f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+        )
+        return cursor.rowcount
+
+
+def import_table_rows(table: str, rows: Iterable[dict], batch_size: int = EXPORT_BATCH_SIZE) -> dict:
+    """
+    Inserts exported rows into a print history table and returns how many
+    were imported and how many were skipped.
+
+    Rows keep their ids and ids that already exist are skipped, so rerunning an
+    interrupted import with the same file continues where it stopped. Each
+    batch of ``batch_size`` rows is committed on its own.
+    """
+    columns = table_columns(table)
+    counts = {"imported": 0, "skipped": 0}
+
+    def flush(batch):
+        inserted = _insert_rows(table, columns, batch)
+        counts["imported"] += inserted
+        counts["skipped"] += len(batch) - inserted
+
+    batch = []
+    for row in rows:
+        batch.append(tuple(row.get(column) for column in columns))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return counts
+
 
 def get_filament_for_slot(print_id: int, ams_slot: int):
-  conn = sqlite3.connect(db_config["db_path"])
-  conn.row_factory = sqlite3.Row  # Enable column name access
-  cursor = conn.cursor()
+  cursor = get_connection().cursor()
+  cursor.row_factory = sqlite3.Row  # Enable column name access
 
   cursor.execute('''
       SELECT * FROM filament_usage
       WHERE print_id = ? AND ams_slot = ?
   ''', (print_id, ams_slot))
 
-  results = cursor.fetchone()
-  conn.close()
-  return results
-
-def _ensure_layer_tracking_entry(print_id: int):
-  conn = sqlite3.connect(db_config["db_path"])
-  cursor = conn.cursor()
-  cursor.execute('''
-      INSERT OR IGNORE INTO print_layer_tracking (print_id)
-      VALUES (?)
-  ''', (print_id,))
-  conn.commit()
-  conn.close()
+  return cursor.fetchone()
 
-def update_layer_tracking(print_id: int, **fields):
-  if not fields:
-    return
+LAYER_TRACKING_COLUMNS = {
+    "total_layers",
+    "layers_printed",
+    "filament_grams_billed",
+    "filament_grams_total",
+    "status",
+    "predicted_end_time",
+    "actual_end_time",
+}
 
-  allowed_columns = {
-      "total_layers",
-      "layers_printed",
-      "filament_grams_billed",
-      "filament_grams_total",
-      "status",
-      "predicted_end_time",
-      "actual_end_time",
-  }
-
-  sanitized = {key: value for key, value in fields.items() if key in allowed_columns}
+def _write_layer_tracking(cursor: sqlite3.Cursor, print_id: int, fields: dict) -> None:
+  sanitized = {key: value for key, value in fields.items() if key in LAYER_TRACKING_COLUMNS}
   if not sanitized:
     return
 
-  _ensure_layer_tracking_entry(print_id)
+  cursor.execute('''
+      INSERT OR IGNORE INTO print_layer_tracking (print_id)
+      VALUES (?)
+  ''', (print_id,))
 
   set_clause = ", ".join(f"{key} = ?" for key in sanitized)
   params = list(sanitized.values()) + [print_id]
-
-  conn = sqlite3.connect(db_config["db_path"])
-  cursor = conn.cursor()
   cursor.execute(f'''
       UPDATE print_layer_tracking
       SET {set_clause}
       WHERE print_id = ?
   ''', params)
-  conn.commit()
-  conn.close()
+
+@_serialized_write
+def update_layer_tracking(print_id: int, **fields):
+  if not fields:
+    return
+
+  with transaction() as cursor:
+    _write_layer_tracking(cursor, print_id, fields)
+
+@_serialized_write
+def flush_layer_tracking(print_id: int, filament_updates: dict[int, dict], layer_fields: dict) -> None:
+  """
+  Persist buffered layer-tracker progress for a print in a single transaction.
+
+  ``filament_updates`` maps an ams_slot to the ``spool_id``, ``grams_used`` and/or
+  ``cost_per_gram`` to store; ``layer_fields`` are print_layer_tracking columns.
+  """
+  if not filament_updates and not layer_fields:
+    return
+
+  with transaction() as cursor:
+    for ams_slot, values in filament_updates.items():
+      _update_filament_usage(cursor, print_id, ams_slot, values)
+    if layer_fields:
+      _write_layer_tracking(cursor, print_id, layer_fields)
 
 def get_layer_tracking_for_prints(print_ids: list[int]):
   if not print_ids:
     return {}
 
-  conn = sqlite3.connect(db_config["db_path"])
-  conn.row_factory = sqlite3.Row
-  cursor = conn.cursor()
+  cursor = get_connection().cursor()
+  cursor.row_factory = sqlite3.Row
   placeholders = ",".join("?" for _ in print_ids)
   cursor.execute(f'''
       SELECT print_id, total_layers, layers_printed, filament_grams_billed, filament_grams_total, status, predicted_end_time, actual_end_time
@@ -298,7 +1424,6 @@ def get_layer_tracking_for_prints(print_ids: list[int]):
       WHERE print_id IN ({placeholders})
   ''', print_ids)
   rows = cursor.fetchall()
-  conn.close()
   return {row["print_id"]: dict(row) for row in rows}
 
 def get_all_filament_usage_for_print(print_id: int):
@@ -306,18 +1431,15 @@ def get_all_filament_usage_for_print(print_id: int):
   Retrieves all filament usage entries for a specific print.
   Returns a dict mapping ams_slot to grams_used.
   """
-  conn = sqlite3.connect(db_config["db_path"])
-  conn.row_factory = sqlite3.Row
-  cursor = conn.cursor()
+  cursor = get_connection().cursor()
+  cursor.row_factory = sqlite3.Row
 
   cursor.execute('''
       SELECT ams_slot, grams_used FROM filament_usage
       WHERE print_id = ?
   ''', (print_id,))
 
-  results = {row["ams_slot"]: row["grams_used"] for row in cursor.fetchall()}
-  conn.close()
-  return results
+  return {row["ams_slot"]: row["grams_used"] for row in cursor.fetchall()}
 
 # Example for creating the database if it does not exist
 create_database()
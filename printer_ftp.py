@@ -0,0 +1,186 @@
+import posixpath
+import threading
+import time
+import urllib.parse
+from io import BytesIO
+
+import pycurl
+
+from config import PRINTER_CODE, PRINTER_IP
+
+FTP_USER = "bblp"
+DOWNLOAD_ATTEMPTS = 4
+CONNECT_TIMEOUT = 10
+# Abort a transfer that stays below 1 KiB/s for 20s so it can be resumed instead of hanging.
+LOW_SPEED_LIMIT = 1024
+LOW_SPEED_TIME = 20
+RETRY_DELAY_SECONDS = 1.0
+
+
+def parse_ftp_listing(line):
+  """Parse a line from an FTP LIST command."""
+  parts = line.split(maxsplit=8)
+  if len(parts) < 9:
+    return None
+  return {
+    'permissions': parts[0],
+    'links': int(parts[1]),
+    'owner': parts[2],
+    'group': parts[3],
+    'size': int(parts[4]),
+    'month': parts[5],
+    'day': int(parts[6]),
+    'time_or_year': parts[7],
+    'name': parts[8]
+  }
+
+
+class FtpTransferError(Exception):
+  """A printer FTPS transfer failed or produced an incomplete file."""
+
+
+class PrinterFtpSession:
+  """
+  FTPS session to one printer.
+
+  A single curl handle is reused for every listing and download, so libcurl
+  keeps the control connection and TLS session alive between requests instead
+  of redoing the handshake each time. Requests are serialized by a lock.
+  """
+
+  def __init__(self, host: str, password: str, user: str = FTP_USER, curl_factory=pycurl.Curl):
+    self.host = host
+    self.user = user
+    self.password = password
+    self._curl_factory = curl_factory
+    self._curl = None
+    self._lock = threading.Lock()
+
+  def _handle(self):
+    if self._curl is None:
+      c = self._curl_factory()
+      c.setopt(pycurl.USERPWD, f"{self.user}:{self.password}")
+      # The printer uses a self-signed certificate.
+      c.setopt(pycurl.SSL_VERIFYPEER, 0)
+      c.setopt(pycurl.SSL_VERIFYHOST, 0)
+      c.setopt(pycurl.FTP_SSL, pycurl.FTPSSL_ALL)
+      c.setopt(pycurl.FTPSSLAUTH, pycurl.FTPAUTH_TLS)
+      c.setopt(pycurl.CONNECTTIMEOUT, CONNECT_TIMEOUT)
+      c.setopt(pycurl.LOW_SPEED_LIMIT, LOW_SPEED_LIMIT)
+      c.setopt(pycurl.LOW_SPEED_TIME, LOW_SPEED_TIME)
+      self._curl = c
+    return self._curl
+
+  def _reset_handle(self) -> None:
+    # After a failed transfer the connection state is unknown; start over with a fresh handle.
+    if self._curl is not None:
+      self._curl.close()
+      self._curl = None
+
+  def _url(self, remote_path: str) -> str:
+    return f"ftps://{self.host}{urllib.parse.quote(remote_path)}"
+
+  def close(self) -> None:
+    with self._lock:
+      self._reset_handle()
+
+  def list(self, directory: str = "/cache/") -> list[dict]:
+    """Return the parsed LIST entries of ``directory``."""
+    if not directory.endswith("/"):
+      directory += "/"
+    buffer = BytesIO()
+    with self._lock:
+      c = self._handle()
+      c.setopt(pycurl.URL, self._url(directory))
+      c.setopt(pycurl.WRITEFUNCTION, buffer.write)
+      c.setopt(pycurl.RESUME_FROM_LARGE, 0)
+      try:
+        c.perform()
+      except pycurl.error as exc:
+        self._reset_handle()
+        raise FtpTransferError(f"Listing {directory} failed: {exc}") from exc
+
+    entries = []
+    for line in buffer.getvalue().decode("utf-8", errors="replace").splitlines():
+      entry = parse_ftp_listing(line)
+      if entry is not None:
+        entries.append(entry)
+    return entries
+
+  def size(self, remote_path: str) -> int | None:
+    """Return the size of ``remote_path`` from its directory listing."""
+    directory, name = posixpath.split(remote_path)
+    for entry in self.list(directory):
+      if entry["name"] == name:
+        return entry["size"]
+    return None
+
+  def download(self, remote_path: str, dest, expected_size: int | None = None) -> dict:
+    """
+    Download ``remote_path`` into the binary file ``dest``.
+
+    The size is checked against the directory listing (or ``expected_size``).
+    An interrupted or stalled transfer is resumed from the bytes already
+    written, up to DOWNLOAD_ATTEMPTS times. Raises FtpTransferError if the file
+    cannot be fetched completely. Returns transfer statistics.
+    """
+    if expected_size is None:
+      expected_size = self.size(remote_path)
+      if expected_size is None:
+        raise FtpTransferError(f"{remote_path} not found on printer")
+
+    start_offset = dest.tell()
+    started = time.monotonic()
+    attempts = 0
+    with self._lock:
+      while True:
+        attempts += 1
+        received = dest.tell() - start_offset
+        c = self._handle()
+        c.setopt(pycurl.URL, self._url(remote_path))
+        c.setopt(pycurl.WRITEFUNCTION, dest.write)
+        c.setopt(pycurl.RESUME_FROM_LARGE, received)
+        if received:
+          print(f"[printer-ftp] Resuming {remote_path} at {received} of {expected_size} bytes")
+        try:
+          c.perform()
+          break
+        except pycurl.error as exc:
+          self._reset_handle()
+          if attempts >= DOWNLOAD_ATTEMPTS:
+            raise FtpTransferError(f"Download of {remote_path} failed after {attempts} attempts: {exc}") from exc
+          print(f"[printer-ftp] Transfer of {remote_path} interrupted ({exc}), retrying")
+          time.sleep(RETRY_DELAY_SECONDS)
+
+    received = dest.tell() - start_offset
+    if received != expected_size:
+      raise FtpTransferError(f"Downloaded {received} bytes of {remote_path}, expected {expected_size}")
+
+    elapsed = time.monotonic() - started
+    stats = {
+      "bytes": received,
+      "seconds": round(elapsed, 3),
+      "bytes_per_second": round(received / elapsed) if elapsed else None,
+      "attempts": attempts,
+    }
+    print(
+      f"[printer-ftp] Downloaded {remote_path}: {received} bytes in {stats['seconds']}s "
+      f"({(stats['bytes_per_second'] or 0) / 1024:.0f} KiB/s, {attempts} attempt(s))"
+    )
+    return stats
+
+
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def get_session(host: str | None = None, password: str | None = None) -> PrinterFtpSession:
+  """Return the shared FTPS session for a printer (the configured one by default)."""
+  host = host or PRINTER_IP
+  password = password or PRINTER_CODE
+  with _SESSIONS_LOCK:
+    session = _SESSIONS.get((host, password))
+    if session is None:
+      session = PrinterFtpSession(host, password)
+      _SESSIONS[(host, password)] = session
+    return session
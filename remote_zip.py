@@ -0,0 +1,244 @@
+import io
+import re
+import struct
+import zipfile
+
+import requests
+
+# The end-of-central-directory record and, for 3MFs, the whole central directory
+# normally sit in the last few KiB; one probe of this size usually covers both.
+PROBE_SIZE = 64 * 1024
+RANGE_BLOCK_SIZE = 256 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = 60
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+_ZIP32_LIMIT = 0xFFFFFFFF
+_FLAG_DATA_DESCRIPTOR = 0x08
+
+
+class RangeNotSupported(Exception):
+  """
+  The server did not answer a range request with a usable partial response.
+
+  ``response`` is set when the server is sending the full body instead, so a
+  caller can keep streaming it rather than requesting the file again.
+  """
+
+  def __init__(self, response=None):
+    super().__init__("Server does not support HTTP range requests")
+    self.response = response
+
+
+class HttpRangeFile(io.RawIOBase):
+  """
+  Read-only, seekable file over an HTTP URL backed by range requests.
+
+  The constructor issues a suffix range GET (signed S3 URLs reject HEAD), which
+  both reveals the archive size and prefetches the zip central directory.
+  Raises :class:`RangeNotSupported` carrying the open response when the server
+  answers with the full body instead.
+  """
+
+  def __init__(self, url, session=None, block_size=RANGE_BLOCK_SIZE, probe_size=PROBE_SIZE):
+    super().__init__()
+    self.url = url
+    self.block_size = block_size
+    self.requests = 0
+    self.bytes_fetched = 0
+    self._session = session or requests.Session()
+    self._pos = 0
+
+    response = self._get(f"bytes=-{probe_size}", stream=True)
+    if response.status_code == 200:
+      raise RangeNotSupported(response)
+    response.raise_for_status()
+    start, _, self.size = self._parse_content_range(response)
+    self._buffer_start = start
+    self._buffer = response.content
+    self.bytes_fetched += len(self._buffer)
+
+  def _get(self, byte_range, stream=False):
+    self.requests += 1
+    return self._session.get(
+      self.url,
+      headers={"Range": byte_range, "Accept-Encoding": "identity"},
+      stream=stream,
+      timeout=REQUEST_TIMEOUT,
+    )
+
+  def _parse_content_range(self, response):
+    match = _CONTENT_RANGE.fullmatch(response.headers.get("Content-Range", "").strip())
+    if response.status_code != 206 or match is None:
+      response.close()
+      raise RangeNotSupported()
+    return tuple(int(value) for value in match.groups())
+
+  def _fetch(self, start, end):
+    """Return bytes ``start``..``end`` (inclusive) from the server."""
+    response = self._get(f"bytes={start}-{end}")
+    response.raise_for_status()
+    self._parse_content_range(response)
+    data = response.content
+    self.bytes_fetched += len(data)
+    return data
+
+  def readable(self):
+    return True
+
+  def seekable(self):
+    return True
+
+  def tell(self):
+    return self._pos
+
+  def seek(self, offset, whence=io.SEEK_SET):
+    if whence == io.SEEK_SET:
+      position = offset
+    elif whence == io.SEEK_CUR:
+      position = self._pos + offset
+    elif whence == io.SEEK_END:
+      position = self.size + offset
+    else:
+      raise ValueError(f"Invalid whence {whence}")
+    if position < 0:
+      raise ValueError("Negative seek position")
+    self._pos = position
+    return position
+
+  def readinto(self, buffer):
+    length = min(len(buffer), self.size - self._pos)
+    if length <= 0:
+      return 0
+
+    offset = self._pos - self._buffer_start
+    if offset < 0 or offset + length > len(self._buffer):
+      end = min(self._pos + max(length, self.block_size), self.size) - 1
+      self._buffer_start = self._pos
+      self._buffer = self._fetch(self._pos, end)
+      offset = 0
+
+    buffer[:length] = self._buffer[offset:offset + length]
+    self._pos += length
+    return length
+
+  def iter_range(self, start, length, chunk_size=STREAM_CHUNK_SIZE):
+    """Stream ``length`` bytes from ``start`` without buffering them in memory."""
+    if length <= 0:
+      return
+    offset = start - self._buffer_start
+    if 0 <= offset and offset + length <= len(self._buffer):
+      yield self._buffer[offset:offset + length]
+      return
+
+    with self._get(f"bytes={start}-{start + length - 1}", stream=True) as response:
+      response.raise_for_status()
+      self._parse_content_range(response)
+      for chunk in response.iter_content(chunk_size=chunk_size):
+        self.bytes_fetched += len(chunk)
+        yield chunk
+
+
+def _dos_datetime(date_time):
+  year, month, day, hour, minute, second = date_time
+  return (
+    hour << 11 | minute << 5 | second // 2,
+    (year - 1980) << 9 | month << 5 | day,
+  )
+
+
+def write_zip_subset(source, members, dest):
+  """
+  Write ``members`` of the open zip ``source`` to ``dest`` as a new zip archive.
+
+  The compressed bytes of each member are copied as they are, so nothing is
+  re-compressed. Members that need zip64 records are not supported.
+  """
+  central_directory = []
+  offset = 0
+  for info in members:
+    if max(info.compress_size, info.file_size, offset) >= _ZIP32_LIMIT:
+      raise ValueError(f"{info.filename} needs zip64, which the subset writer does not support")
+
+    source.seek(info.header_offset)
+    local_header = source.read(zipfile.sizeFileHeader)
+    fields = struct.unpack(zipfile.structFileHeader, local_header)
+    if fields[0] != zipfile.stringFileHeader:
+      raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+    data_start = info.header_offset + zipfile.sizeFileHeader + fields[10] + fields[11]
+
+    name = info.filename.encode("utf-8")
+    flag_bits = (info.flag_bits & ~_FLAG_DATA_DESCRIPTOR) | 0x800
+    dos_time, dos_date = _dos_datetime(info.date_time)
+    dest.write(struct.pack(
+      zipfile.structFileHeader, zipfile.stringFileHeader, info.extract_version, info.reserved,
+      flag_bits, info.compress_type, dos_time, dos_date, info.CRC, info.compress_size,
+      info.file_size, len(name), 0,
+    ))
+    dest.write(name)
+    for chunk in source.iter_range(data_start, info.compress_size):
+      dest.write(chunk)
+
+    central_directory.append(struct.pack(
+      zipfile.structCentralDir, zipfile.stringCentralDir, info.create_version, info.create_system,
+      info.extract_version, info.reserved, flag_bits, info.compress_type, dos_time, dos_date,
+      info.CRC, info.compress_size, info.file_size, len(name), 0, 0, 0, 0, info.external_attr,
+      offset,
+    ) + name)
+    offset += zipfile.sizeFileHeader + len(name) + info.compress_size
+
+  directory = b"".join(central_directory)
+  dest.write(directory)
+  dest.write(struct.pack(
+    zipfile.structEndArchive, zipfile.stringEndArchive, 0, 0, len(members), len(members),
+    len(directory), offset, 0,
+  ))
+
+
+def download(url, dest, session=None, response=None):
+  """
+  Stream the complete body of ``url`` to ``dest`` chunk by chunk.
+
+  ``response`` may be an already open streamed response for ``url`` to reuse.
+  """
+  if response is None:
+    response = (session or requests).get(url, stream=True, timeout=REQUEST_TIMEOUT)
+  with response:
+    response.raise_for_status()
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+      dest.write(chunk)
+
+
+def fetch_zip_members(url, dest, select, session=None):
+  """
+  Write the members of the remote zip at ``url`` accepted by ``select(name)``
+  to ``dest`` as a standalone zip.
+
+  Falls back to streaming the complete archive into ``dest`` when the server
+  does not honour range requests or the archive cannot be subset. Returns True
+  when only the selected members were fetched.
+  """
+  session = session or requests.Session()
+  try:
+    remote = HttpRangeFile(url, session=session)
+  except RangeNotSupported as exc:
+    print("[remote-zip] Server ignored the range request, downloading the full archive")
+    download(url, dest, session=session, response=exc.response)
+    return False
+
+  try:
+    with zipfile.ZipFile(remote) as archive:
+      members = [info for info in archive.infolist() if select(info.filename)]
+      write_zip_subset(remote, members, dest)
+  except (zipfile.BadZipFile, ValueError, RangeNotSupported) as exc:
+    print(f"[remote-zip] Range read failed ({exc}), downloading the full archive")
+    dest.seek(0)
+    dest.truncate()
+    download(url, dest, session=session)
+    return False
+
+  print(
+    f"[remote-zip] Fetched {len(members)} members "
+    f"({remote.bytes_fetched} of {remote.size} bytes in {remote.requests} requests)"
+  )
+  return True
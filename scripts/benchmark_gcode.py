@@ -0,0 +1,305 @@
+"""Offline throughput benchmark for the G-code evaluation pipeline.
+
+Generates synthetic Bambu-style 3MF archives and measures
+``extract_gcode_from_3mf``, ``evaluate_gcode``, ``get_filament_order`` and the
+single-pass ``scan_3mf_gcode`` that replaces them at runtime.
+Each case runs in a fresh process so peak RSS is reported per case, and a
+checksum of every result makes runs comparable across commits:
+
+    python scripts/benchmark_gcode.py --preset large --json bench.json
+    python scripts/benchmark_gcode.py --preset large --compare bench.json
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+# Ensure repository root is importable when executed from the scripts directory
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+GCODE_MEMBER = "Metadata/plate_1.gcode"
+
+PRESETS = {
+    "small": {"layers": 200, "filaments": 1, "swap_every": 0, "target_mb": 5},
+    "multicolor": {"layers": 500, "filaments": 4, "swap_every": 1, "target_mb": 50},
+    "large": {"layers": 2000, "filaments": 8, "swap_every": 5, "target_mb": 300},
+}
+
+# A 1x1 transparent PNG so the archive carries a plate thumbnail like real prints.
+PLATE_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+@dataclass(frozen=True)
+class SyntheticPrint:
+    layers: int
+    filaments: int
+    swap_every: int
+    moves_per_layer: int
+    seed: int = 1
+
+
+def _estimate_moves_per_layer(layers: int, target_mb: float) -> int:
+    # A synthetic extrusion move averages ~36 bytes including the newline.
+    return max(1, int(target_mb * 1024 * 1024 / 36 / max(layers, 1)))
+
+
+def _write_gcode(handle, spec: SyntheticPrint) -> None:
+    rng = random.Random(spec.seed)
+    write = handle.write
+    write(b"; HEADER_BLOCK_START\n; generated by benchmark_gcode.py\n; HEADER_BLOCK_END\n")
+    write(b"M73 P0 R120\nG90\nM83\n")
+
+    active = 0
+    write(b"M620 S0A\nM621 S0A\n")
+    for layer in range(1, spec.layers + 1):
+        write(f"; CHANGE_LAYER\nM73 L{layer}\n".encode())
+        if spec.filaments > 1 and spec.swap_every and layer % spec.swap_every == 0:
+            active = (active + 1) % spec.filaments
+            write(b"M620 S255\n")
+            write(f"M620 S{active}A\nT{active}\nM621 S{active}A\n".encode())
+        lines = []
+        for _ in range(spec.moves_per_layer):
+            lines.append(
+                f"G1 X{rng.uniform(0, 256):.3f} Y{rng.uniform(0, 256):.3f} E{rng.uniform(0.01, 0.09):.5f}\n"
+            )
+        lines.append("G1 E-.8 F1800 ; retract\n")
+        write("".join(lines).encode())
+    write(b"M73 P100 R0\n")
+
+
+def generate_synthetic_3mf(path: Path, spec: SyntheticPrint) -> Path:
+    """Write a Bambu-style .gcode.3mf for ``spec`` to ``path``."""
+
+    filament_entries = "\n".join(
+        f'    <filament id="{index + 1}" tray_info_idx="GFL99" type="PLA" color="#{index * 30:02X}FF00" used_m="1.00" used_g="3.00" />'
+        for index in range(spec.filaments)
+    )
+    slice_info = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<config>\n  <plate>\n'
+        '    <metadata key="index" value="1"/>\n'
+        f"{filament_entries}\n  </plate>\n</config>\n"
+    )
+    model_settings = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<config>\n  <plate>\n'
+        f'    <metadata key="gcode_file" value="{GCODE_MEMBER}"/>\n  </plate>\n</config>\n'
+    )
+
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr("Metadata/slice_info.config", slice_info)
+        z.writestr("Metadata/model_settings.config", model_settings)
+        z.writestr("Metadata/plate_1.png", PLATE_PNG, compress_type=zipfile.ZIP_STORED)
+        with z.open(GCODE_MEMBER, "w", force_zip64=True) as handle:
+            _write_gcode(handle, spec)
+    return path
+
+
+def _checksum(value) -> str:
+    payload = json.dumps(value, sort_keys=True, default=str).encode()
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_case(case: str, model_path: str) -> dict:
+    from filament_usage_tracker import evaluate_gcode, extract_gcode_from_3mf
+    from tools_3mf import get_filament_order, scan_3mf_gcode
+
+    with zipfile.ZipFile(model_path) as z:
+        info = z.getinfo(GCODE_MEMBER)
+        gcode_bytes = info.file_size
+    gcode = extract_gcode_from_3mf(model_path, GCODE_MEMBER) if case == "evaluate_gcode" else None
+    line_count = gcode.count("\n") if gcode is not None else None
+    baseline_rss = _peak_rss_mb()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        if case == "extract_gcode_from_3mf":
+            result = extract_gcode_from_3mf(model_path, GCODE_MEMBER)
+            line_count = result.count("\n")
+            checksum = hashlib.sha256(result.encode()).hexdigest()[:16]
+        elif case == "evaluate_gcode":
+            result = evaluate_gcode(gcode)
+            checksum = _checksum({str(k): {str(f): round(v, 4) for f, v in u.items()} for k, u in result.items()})
+        elif case == "get_filament_order":
+            with zipfile.ZipFile(model_path) as z, z.open(GCODE_MEMBER) as handle:
+                counter = _LineCounter(handle)
+                result = get_filament_order(counter)
+            line_count = counter.lines
+            checksum = _checksum(result)
+        elif case == "scan_3mf_gcode":
+            result = scan_3mf_gcode(model_path, GCODE_MEMBER)
+            line_count = None
+            checksum = _checksum({
+                "order": result["filament_order"],
+                "usage": {str(k): {str(f): round(v, 4) for f, v in u.items()} for k, u in result["layer_usage"].items()},
+            })
+        else:
+            raise ValueError(f"Unknown case {case}")
+        elapsed = time.perf_counter() - start
+
+    return {
+        "case": case,
+        "seconds": round(elapsed, 4),
+        "lines": line_count,
+        "lines_per_second": round(line_count / elapsed) if elapsed and line_count is not None else None,
+        "mb_per_second": round(gcode_bytes / (1024 * 1024) / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "rss_before_mb": round(baseline_rss, 1),
+        "checksum": checksum,
+    }
+
+
+class _LineCounter:
+    """Iterate lines from a binary stream while counting them."""
+
+    def __init__(self, handle):
+        self._handle = handle
+        self.lines = 0
+
+    def __iter__(self):
+        for line in self._handle:
+            self.lines += 1
+            yield line
+
+
+def _case_worker(case: str, model_path: str, queue) -> None:
+    try:
+        queue.put(_run_case(case, model_path))
+    except Exception as exc:  # pragma: no cover - reported to the parent
+        queue.put({"case": case, "error": repr(exc)})
+
+
+def run_case_isolated(case: str, model_path: str) -> dict:
+    """Run one benchmark case in a fresh process so peak RSS is per case."""
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_case_worker, args=(case, model_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_results(results: list[dict], baseline: dict | None) -> None:
+    header = f"{'case':<24}{'seconds':>10}{'lines/s':>14}{'MB/s':>10}{'peak RSS':>11}  checksum"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        if "error" in result:
+            print(f"{result['case']:<24} ERROR {result['error']}")
+            continue
+        line = (
+            f"{result['case']:<24}{result['seconds']:>10.3f}{result['lines_per_second'] or 0:>14,}"
+            f"{result['mb_per_second'] or 0:>10.2f}{result['peak_rss_mb']:>9.1f}MB  {result['checksum']}"
+        )
+        previous = (baseline or {}).get(result["case"])
+        if previous and previous.get("seconds"):
+            speedup = previous["seconds"] / result["seconds"] if result["seconds"] else float("inf")
+            same = "same result" if previous.get("checksum") == result["checksum"] else "RESULT CHANGED"
+            line += f"  ({speedup:.2f}x vs baseline, {same})"
+        print(line)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark G-code extraction and evaluation on synthetic prints")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="multicolor", help="Synthetic print size preset")
+    parser.add_argument("--layers", type=int, help="Number of layers (overrides preset)")
+    parser.add_argument("--filaments", type=int, help="Number of filaments (overrides preset)")
+    parser.add_argument("--swap-every", type=int, help="Swap filament every N layers, 0 disables swaps (overrides preset)")
+    parser.add_argument("--target-mb", type=float, help="Approximate uncompressed G-code size in MB (overrides preset)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for move coordinates")
+    parser.add_argument(
+        "--cases",
+        default="extract_gcode_from_3mf,evaluate_gcode,get_filament_order,scan_3mf_gcode",
+        help="Comma-separated list of cases to run",
+    )
+    parser.add_argument("--model", type=Path, help="Benchmark an existing .gcode.3mf instead of generating one")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated 3MF and print its path")
+    parser.add_argument("--json", type=Path, help="Write results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="Compare against a previous --json result file")
+    args = parser.parse_args()
+
+    preset = dict(PRESETS[args.preset])
+    for key in ("layers", "filaments", "swap_every", "target_mb"):
+        value = getattr(args, key)
+        if value is not None:
+            preset[key] = value
+
+    spec = SyntheticPrint(
+        layers=preset["layers"],
+        filaments=preset["filaments"],
+        swap_every=preset["swap_every"],
+        moves_per_layer=_estimate_moves_per_layer(preset["layers"], preset["target_mb"]),
+        seed=args.seed,
+    )
+
+    temp_dir = None
+    if args.model:
+        model_path = args.model
+    else:
+        temp_dir = tempfile.mkdtemp(prefix="openspoolman-bench-")
+        model_path = Path(temp_dir) / "synthetic.gcode.3mf"
+        start = time.perf_counter()
+        generate_synthetic_3mf(model_path, spec)
+        print(f"Generated {model_path} ({model_path.stat().st_size / (1024 * 1024):.1f} MB compressed) "
+              f"in {time.perf_counter() - start:.1f}s: {asdict(spec)}")
+
+    try:
+        results = [run_case_isolated(case.strip(), str(model_path)) for case in args.cases.split(",") if case.strip()]
+    finally:
+        if temp_dir and not args.keep:
+            model_path.unlink(missing_ok=True)
+            os.rmdir(temp_dir)
+
+    baseline = None
+    if args.compare:
+        baseline = {entry["case"]: entry for entry in json.loads(args.compare.read_text()).get("results", [])}
+
+    _print_results(results, baseline)
+
+    if args.json:
+        args.json.write_text(json.dumps({
+            "revision": _git_revision(),
+            "spec": None if args.model else asdict(spec),
+            "model": str(args.model) if args.model else None,
+            "results": results,
+        }, indent=2))
+        print(f"Wrote results to {args.json}")
+
+    return 1 if any("error" in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,193 @@
+"""Query latency benchmark for the print history database.
+
+Fills throwaway databases with synthetic prints and times the queries the web
+UI and the MQTT thread run against ``print_history``. Latencies are reported
+per database size, so a query that scans instead of using an index shows up as
+a column that grows with the number of prints:
+
+    python scripts/benchmark_print_history.py --sizes 1000,10000,100000
+    python scripts/benchmark_print_history.py --without-indexes
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Ensure repository root is importable when executed from the scripts directory
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import analytics  # noqa: E402
+import print_history  # noqa: E402
+
+PAGE_SIZE = 50
+SPOOL_COUNT = 200
+FILAMENT_TYPES = ("PLA", "PETG", "ABS", "TPU")
+QUERY_INDEXES = ("idx_filament_usage_print_slot", "idx_filament_usage_spool", "idx_prints_date")
+
+
+def populate(print_count: int, seed: int = 1) -> None:
+    """Insert ``print_count`` synthetic prints with 1-4 filaments each into the configured database."""
+
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    prints = []
+    usage = []
+    tracking = []
+    for print_id in range(1, print_count + 1):
+        print_date = start + timedelta(minutes=print_id * 30 + rng.randint(0, 20))
+        prints.append((print_id, print_date.strftime("%Y-%m-%d %H:%M:%S"), f"model_{print_id}.3mf", "cloud", None))
+        for ams_slot in rng.sample(range(4), rng.randint(1, 4)):
+            grams = round(rng.uniform(1, 150), 2)
+            usage.append((
+                print_id, rng.randint(1, SPOOL_COUNT), rng.choice(FILAMENT_TYPES), "#FFFFFF", grams, ams_slot, grams,
+            ))
+        tracking.append((print_id, 100, 100, "COMPLETED"))
+
+    with print_history.transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO prints (id, print_date, file_name, print_type, image_file) VALUES (?, ?, ?, ?, ?)",
+            prints,
+        )
+        cursor.executemany(
+            "INSERT INTO filament_usage (print_id, spool_id, filament_type, color, grams_used, ams_slot, estimated_grams) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            usage,
+        )
+        cursor.executemany(
+            "INSERT INTO print_layer_tracking (print_id, total_layers, layers_printed, status) VALUES (?, ?, ?, ?)",
+            tracking,
+        )
+    print_history.get_connection().execute("ANALYZE")
+
+
+def _cases(print_count: int, rng: random.Random) -> dict:
+    def random_print():
+        return rng.randint(1, print_count)
+
+    # Cursor of the row just before the last page, as the "Next" link would carry it
+    last_page_row = print_history.get_connection().execute(
+        "SELECT print_date, id FROM prints ORDER BY print_date DESC, id DESC LIMIT 1 OFFSET ?",
+        (max(print_count - PAGE_SIZE - 1, 0),),
+    ).fetchone()
+    last_page_cursor = print_history.encode_print_cursor({"print_date": last_page_row[0], "id": last_page_row[1]})
+    spools = [
+        {"id": spool_id, "cost_per_gram": 0.02, "filament": {"name": "Basic", "material": "PLA", "vendor": {"name": "Vendor"}}}
+        for spool_id in range(1, SPOOL_COUNT + 1)
+    ]
+
+    def uncached(query):
+        analytics.clear_cache()
+        return query()
+
+    return {
+        "history_first_page": lambda: print_history.get_prints_page(PAGE_SIZE),
+        "history_last_page": lambda: print_history.get_prints_page(PAGE_SIZE, before=last_page_cursor),
+        "history_offset_last_page": lambda: print_history.get_prints_with_filament(
+            limit=PAGE_SIZE, offset=max(print_count - PAGE_SIZE, 0)
+        ),
+        "search_filtered_page": lambda: print_history.get_prints_page(PAGE_SIZE, filters={
+            "material": "PETG", "spool_id": rng.randint(1, SPOOL_COUNT), "date_from": "2021-01-01", "date_to": "2021-01-31",
+        }),
+        "search_text_page": lambda: print_history.get_prints_page(
+            PAGE_SIZE, filters={"query": f"model {rng.randint(1, print_count)}"}
+        ),
+        "search_facets": lambda: print_history.get_print_facets({"material": "PLA", "spool_id": rng.randint(1, SPOOL_COUNT)}),
+        "filament_for_slot": lambda: print_history.get_filament_for_slot(random_print(), rng.randint(0, 3)),
+        "usage_for_print": lambda: print_history.get_all_filament_usage_for_print(random_print()),
+        "update_filament_spool": lambda: print_history.update_filament_spool(
+            random_print(), rng.randint(0, 3), rng.randint(1, SPOOL_COUNT)
+        ),
+        "update_grams_used": lambda: print_history.update_filament_grams_used(
+            random_print(), rng.randint(0, 3), rng.uniform(1, 150)
+        ),
+        "prints_by_spool": lambda: print_history.get_prints_by_spool(rng.randint(1, SPOOL_COUNT)),
+        "spool_usage": lambda: print_history.get_spool_usage(rng.randint(1, SPOOL_COUNT)),
+        "material_usage": print_history.get_material_usage,
+        "analytics_year_by_day": lambda: uncached(lambda: analytics.usage_per_day(spools, "2021-01-01", "2021-12-31")),
+        "analytics_year_cached": lambda: analytics.usage_per_day(spools, "2021-01-01", "2021-12-31"),
+        "analytics_materials": lambda: uncached(lambda: analytics.usage_per_material(spools)),
+        "analytics_vendors": lambda: uncached(lambda: analytics.usage_per_vendor(spools)),
+        "layer_tracking_page": lambda: print_history.get_layer_tracking_for_prints(
+            [random_print() for _ in range(PAGE_SIZE)]
+        ),
+    }
+
+
+def run_benchmark(print_count: int, repeat: int = 20, without_indexes: bool = False, seed: int = 1) -> dict:
+    """Build a database with ``print_count`` prints and return the median latency (ms) of each query."""
+
+    with tempfile.TemporaryDirectory(prefix="openspoolman-history-bench-") as temp_dir:
+        previous_path = print_history.db_config["db_path"]
+        print_history.db_config["db_path"] = str(Path(temp_dir) / "history.db")
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                print_history.create_database()
+            if without_indexes:
+                with print_history.transaction() as cursor:
+                    for index in QUERY_INDEXES:
+                        cursor.execute(f"DROP INDEX IF EXISTS {index}")
+            populate(print_count, seed=seed)
+
+            results = {}
+            for case, query in _cases(print_count, random.Random(seed)).items():
+                query()  # warm the page cache
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    query()
+                    timings.append((time.perf_counter() - start) * 1000)
+                results[case] = round(statistics.median(timings), 3)
+            return results
+        finally:
+            print_history.close_connections()
+            print_history.db_config["db_path"] = previous_path
+
+
+def _print_results(sizes: list[int], results: dict[int, dict]) -> None:
+    cases = list(results[sizes[0]])
+    header = f"{'query (median ms)':<24}" + "".join(f"{size:>12,}" for size in sizes)
+    print(header)
+    print("-" * len(header))
+    for case in cases:
+        print(f"{case:<24}" + "".join(f"{results[size][case]:>12.3f}" for size in sizes))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark print history queries on synthetic databases")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated numbers of prints to test")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per query")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the synthetic data")
+    parser.add_argument("--without-indexes", action="store_true", help="Drop the query indexes for comparison")
+    parser.add_argument("--json", type=Path, help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = {}
+    for size in sizes:
+        start = time.perf_counter()
+        results[size] = run_benchmark(size, repeat=args.repeat, without_indexes=args.without_indexes, seed=args.seed)
+        print(f"Benchmarked {size:,} prints in {time.perf_counter() - start:.1f}s")
+
+    _print_results(sizes, results)
+
+    if args.json:
+        args.json.write_text(json.dumps({
+            "without_indexes": args.without_indexes,
+            "results": {str(size): result for size, result in results.items()},
+        }, indent=2))
+        print(f"Wrote results to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,125 @@
+"""Maintenance commands for the print history database.
+
+Point OPENSPOOLMAN_PRINT_HISTORY_DB at the database to work on:
+
+    python scripts/print_history_cli.py rebuild-rollups
+    python scripts/print_history_cli.py usage --spool 12
+    python scripts/print_history_cli.py archive --days 365
+    python scripts/print_history_cli.py export --output history.jsonl
+    python scripts/print_history_cli.py import history.jsonl
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Ensure repository root is importable when executed from the scripts directory
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import history_export  # noqa: E402
+import print_history  # noqa: E402
+
+
+def rebuild_rollups(_args) -> int:
+    print_history.rebuild_usage_rollups()
+    print(f"Rebuilt usage rollups in {print_history.db_config['db_path']}")
+    return 0
+
+
+def usage(args) -> int:
+    if args.spool is not None:
+        spool_usage = print_history.get_spool_usage(args.spool)
+        print(f"Spool {args.spool}: {spool_usage['print_count']} prints, {spool_usage['grams_used']:.2f} g")
+        return 0
+
+    for material in print_history.get_material_usage():
+        print(f"{material['filament_type']:<12}{material['usage_count']:>8} uses{material['grams_used']:>12.2f} g")
+    return 0
+
+
+def archive(args) -> int:
+    archived = print_history.archive_prints(args.days)
+    print(f"Moved {archived} prints older than {args.days} days to {print_history.archive_db_path()}")
+    if not args.no_compact:
+        compact(args)
+    return 0
+
+
+def compact(_args) -> int:
+    released = print_history.compact_database()
+    print(f"Released {released} pages from {print_history.db_config['db_path']}")
+    return 0
+
+
+def _format(explicit: str | None, path: Path | None) -> str:
+    if explicit:
+        return explicit
+    return "csv" if path and path.suffix.lower() == ".csv" else "jsonl"
+
+
+def export(args) -> int:
+    if _format(args.format, args.output) == "csv":
+        chunks = history_export.export_csv(args.table)
+    else:
+        chunks = history_export.export_jsonl()
+
+    if args.output is None:
+        sys.stdout.writelines(chunks)
+        return 0
+    with open(args.output, "w", newline="", encoding="utf-8") as output:
+        output.writelines(chunks)
+    print(f"Exported print history to {args.output}")
+    return 0
+
+
+def import_(args) -> int:
+    with open(args.path, newline="", encoding="utf-8") as source:
+        if _format(args.format, args.path) == "csv":
+            results = {args.table: history_export.import_csv(args.table, source)}
+        else:
+            results = history_export.import_jsonl(source)
+
+    for table, counts in results.items():
+        print(f"{table}: imported {counts['imported']}, skipped {counts['skipped']} existing rows")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Print history database maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_parser = commands.add_parser("rebuild-rollups", help="Recompute the per-spool, material and day rollups")
+    rebuild_parser.set_defaults(handler=rebuild_rollups)
+
+    usage_parser = commands.add_parser("usage", help="Show recorded usage per material or for one spool")
+    usage_parser.add_argument("--spool", type=int, help="Only show this spool")
+    usage_parser.set_defaults(handler=usage)
+
+    archive_parser = commands.add_parser("archive", help="Move old prints to the archive database")
+    archive_parser.add_argument("--days", type=int, required=True, help="Archive prints older than this many days")
+    archive_parser.add_argument("--no-compact", action="store_true", help="Do not compact the live database afterwards")
+    archive_parser.set_defaults(handler=archive)
+
+    compact_parser = commands.add_parser("compact", help="Return unused database pages to the file system")
+    compact_parser.set_defaults(handler=compact)
+
+    export_parser = commands.add_parser("export", help="Stream prints, filament usage and layer tracking to a file")
+    export_parser.add_argument("--output", type=Path, help="Destination file (default: stdout)")
+    export_parser.add_argument("--format", choices=history_export.EXPORT_FORMATS, help="Default: from the file suffix, else jsonl")
+    export_parser.add_argument("--table", choices=print_history.HISTORY_TABLES, default="prints", help="Table to write as CSV")
+    export_parser.set_defaults(handler=export)
+
+    import_parser = commands.add_parser("import", help="Import an export; rerun it to resume an interrupted import")
+    import_parser.add_argument("path", type=Path, help="File written by the export command")
+    import_parser.add_argument("--format", choices=history_export.EXPORT_FORMATS, help="Default: from the file suffix")
+    import_parser.add_argument("--table", choices=print_history.HISTORY_TABLES, default="prints", help="Table a CSV file belongs to")
+    import_parser.set_defaults(handler=import_)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,40 @@
+"""Delete content-hashed print thumbnails that no print in the history references.
+
+Images referenced by archived prints are kept as well. Legacy timestamped
+images are never touched. Point OPENSPOOLMAN_PRINT_HISTORY_DB at the database
+whose prints own the images in static/prints:
+
+    python scripts/prune_thumbnails.py --dry-run
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Ensure repository root is importable when executed from the scripts directory
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import print_history  # noqa: E402
+import thumbnails  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Prune print thumbnails no longer referenced by the print history")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many files would be deleted")
+    args = parser.parse_args()
+
+    referenced = print_history.get_referenced_image_files()
+    if args.dry_run:
+        orphans = thumbnails.find_orphan_thumbnails(referenced)
+        print(f"Would delete {len(orphans)} thumbnail files from {thumbnails.THUMBNAIL_DIR}")
+        return 0
+
+    removed = thumbnails.prune_thumbnails(referenced)
+    print(f"Deleted {removed} thumbnail files from {thumbnails.THUMBNAIL_DIR}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,123 @@
+import string
+import threading
+
+import spoolman_service
+from spoolman_service import COLOR_DISTANCE_TOLERANCE, color_distance, normalize_color_hex
+
+
+def hex_color(value) -> str:
+  """``RRGGBB`` for a hex color with or without ``#`` and alpha, otherwise an empty string."""
+  color = normalize_color_hex(value)
+  return color if color and all(char in string.hexdigits for char in color) else ""
+
+
+def _filament(spool) -> dict:
+  filament = spool.get("filament") if isinstance(spool, dict) else None
+  return filament if isinstance(filament, dict) else {}
+
+
+def _colors(filament) -> tuple:
+  hexes = filament.get("multi_color_hexes")
+  if isinstance(hexes, str):
+    hexes = hexes.split(",")
+  if not isinstance(hexes, (list, tuple)) or not hexes:
+    hexes = [filament.get("color_hex")]
+  return tuple(color for color in (hex_color(value) for value in hexes) if color)
+
+
+def _search_text(spool, filament) -> str:
+  vendor = filament.get("vendor") or {}
+  fields = (
+    f"#{spool.get('id')}",
+    filament.get("name"),
+    filament.get("material"),
+    vendor.get("name") if isinstance(vendor, dict) else None,
+    spool.get("location"),
+    spool.get("lot_nr"),
+    spool.get("comment"),
+    *_colors(filament),
+  )
+  return " ".join(str(field) for field in fields if field).lower()
+
+
+class SpoolIndex:
+  """
+  The spool inventory of one version, indexed for the spool pickers.
+
+  Materials and vendors map to the positions of their spools, so a filter only
+  looks at the spools it can match; search text and colors are prepared once.
+  """
+
+  def __init__(self, spools, version=None):
+    self.spools = list(spools)
+    self.version = version
+    self._by_material = {}
+    self._by_vendor = {}
+    self._text = []
+    self._colors = []
+    for position, spool in enumerate(self.spools):
+      filament = _filament(spool)
+      vendor = filament.get("vendor") or {}
+      if filament.get("material"):
+        self._by_material.setdefault(filament["material"], []).append(position)
+      if isinstance(vendor, dict) and vendor.get("name"):
+        self._by_vendor.setdefault(vendor["name"], []).append(position)
+      self._text.append(_search_text(spool, filament))
+      self._colors.append(_colors(filament))
+
+  @property
+  def materials(self) -> list[str]:
+    return sorted(self._by_material)
+
+  @property
+  def vendors(self) -> list[str]:
+    return sorted(self._by_vendor, key=str.lower)
+
+  def search(self, materials=(), vendor=None, text=None, color=None, max_distance=COLOR_DISTANCE_TOLERANCE) -> list:
+    """
+    Spools of any of ``materials`` from ``vendor`` whose details contain every
+    word of ``text``, in inventory order. With ``color``, only spools within
+    ``max_distance`` of it are kept, closest first.
+    """
+    positions = None
+    if materials:
+      positions = set()
+      for material in materials:
+        positions.update(self._by_material.get(material, ()))
+    if vendor:
+      vendor_positions = set(self._by_vendor.get(vendor, ()))
+      positions = vendor_positions if positions is None else positions & vendor_positions
+    positions = range(len(self.spools)) if positions is None else sorted(positions)
+
+    words = (text or "").lower().split()
+    if words:
+      positions = [position for position in positions if all(word in self._text[position] for word in words)]
+
+    color = hex_color(color)
+    if color:
+      distances = {}
+      for position in positions:
+        matches = [color_distance(color, spool_color) for spool_color in self._colors[position]]
+        if matches and min(matches) <= max_distance:
+          distances[position] = min(matches)
+      positions = sorted(distances, key=lambda position: (distances[position], position))
+
+    return [self.spools[position] for position in positions]
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def current(spools) -> SpoolIndex:
+  """The index for ``spools``, rebuilt when the inventory version changes."""
+  global _INDEX
+  version = spoolman_service.get_spools_version()
+  index = _INDEX
+  if index is not None and index.version == version:
+    return index
+
+  with _INDEX_LOCK:
+    if _INDEX is None or _INDEX.version != version:
+      _INDEX = SpoolIndex(spools, version)
+    return _INDEX
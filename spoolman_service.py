@@ -1,5 +1,6 @@
 import math
 import re
+import time
 from config import PRINTER_ID, EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID, DISABLE_MISMATCH_WARNING
 from datetime import datetime
 from zoneinfo import ZoneInfo
@@ -7,9 +8,14 @@ from pathlib import Path
 from print_history import update_filament_spool
 import json
 
+import fragment_cache
+import live_updates
 import spoolman_client
 
 SPOOLS = {}
+SPOOLS_FETCHED_AT = None
+SPOOLS_VERSION = 0  # Bumped whenever a fetch returns a different spool list
+SPOOLS_MAX_AGE_SECONDS = 30  # How long readers passing max_age use the cached list before asking SpoolMan again
 SPOOLMAN_SETTINGS = {}
 
 
@@ -23,6 +29,7 @@ def clear_active_spool_for_tray(ams_id: int, tray_id: int) -> None:
     if extras.get("active_tray") == target:
       spoolman_client.patchExtraTags(spool["id"], extras, {"active_tray": json.dumps("")})
       spool.setdefault("extra", {})["active_tray"] = json.dumps("")
+      spools_changed()
       break
 
 COLOR_DISTANCE_TOLERANCE = 80
@@ -357,10 +364,11 @@ def spendFilaments(printdata):
       for ams_tray in ams_usage:
         if active_tray == ams_tray["trayUid"]:
           used_grams += ams_tray["usedGrams"]
-          update_filament_spool(printdata["print_id"], ams_tray["id"], spool["id"])
+          update_filament_spool(printdata["print_id"], ams_tray["id"], spool["id"], spool.get("cost_per_gram"))
         
       if used_grams != 0:
         spoolman_client.consumeSpool(spool["id"], used_grams)
+        expire_spools()
         
 
 def setActiveTray(spool_id, spool_extra, ams_id, tray_id):
@@ -376,14 +384,18 @@ def setActiveTray(spool_id, spool_extra, ams_id, tray_id):
     for old_spool in fetchSpools(cached=True):
       if spool_id != old_spool["id"] and old_spool.get("extra") and old_spool["extra"].get("active_tray") and json.loads(old_spool["extra"]["active_tray"]) == trayUid(ams_id, tray_id):
         spoolman_client.patchExtraTags(old_spool["id"], old_spool["extra"], {"active_tray": json.dumps("")})
+    expire_spools()
   else:
     print("Skipping set active tray")
 
-# Fetch spools from spoolman
-def fetchSpools(cached=False):
-  global SPOOLS
-  if not cached or not SPOOLS:
+# Fetch spools from spoolman; with max_age, a cached list older than that many seconds is refetched
+def fetchSpools(cached=False, max_age=None):
+  global SPOOLS, SPOOLS_FETCHED_AT
+  expired = max_age is not None and (SPOOLS_FETCHED_AT is None or time.monotonic() - SPOOLS_FETCHED_AT > max_age)
+  if not cached or not SPOOLS or expired:
+    previous = SPOOLS
     SPOOLS = spoolman_client.fetchSpoolList()
+    SPOOLS_FETCHED_AT = time.monotonic()
     
     for spool in SPOOLS:
       initial_weight = 0
@@ -402,13 +414,32 @@ def fetchSpools(cached=False):
       if initial_weight > 0 and price > 0:
         spool["cost_per_gram"] = price / initial_weight
       else:
-        spool["cost_per_gram"] = 0
+        # Unknown, so print history stores no price instead of a zero cost
+        spool["cost_per_gram"] = None
 
       if "multi_color_hexes" in spool["filament"]:
         spool["filament"]["multi_color_hexes"] = spool["filament"]["multi_color_hexes"].split(',')
-        
+
+    if SPOOLS != previous:
+      spools_changed()
+
   return SPOOLS
 
+def get_spools_version():
+  return SPOOLS_VERSION
+
+def spools_changed():
+  """Bump the inventory version, so tray snapshots and versioned responses built from the spools are redone."""
+  global SPOOLS_VERSION
+  SPOOLS_VERSION += 1
+  fragment_cache.invalidate("fragments/list_spools.html")
+  live_updates.notify()
+
+def expire_spools():
+  """After changing spools in SpoolMan, make the next fetchSpools(max_age=...) load the list again."""
+  global SPOOLS_FETCHED_AT
+  SPOOLS_FETCHED_AT = None
+
 def getSettings(cached=False):
   global SPOOLMAN_SETTINGS
   if not cached or not SPOOLMAN_SETTINGS:
@@ -0,0 +1,47 @@
+// Keeps the home page in sync with the printer: the server pushes the HTML of
+// the tray, humidity and print progress fragments that changed and they are
+// swapped in place. A changed AMS/tray layout reloads the whole page.
+;(function () {
+  const container = document.querySelector('[data-live-layout]')
+  if (!container || !window.EventSource) {
+    return
+  }
+
+  // The standalone (home screen) navigation re-runs page scripts; keep a single stream
+  if (window.liveUpdatesSource) {
+    window.liveUpdatesSource.close()
+  }
+  const source = new EventSource(container.dataset.liveEvents)
+  window.liveUpdatesSource = source
+
+  source.addEventListener('update', function (event) {
+    if (!container.isConnected) {
+      source.close()
+      return
+    }
+
+    const update = JSON.parse(event.data)
+    if (update.layout !== container.dataset.liveLayout) {
+      source.close()
+      window.location.reload()
+      return
+    }
+
+    Object.entries(update.fragments).forEach(function ([liveId, html]) {
+      const element = document.querySelector(`[data-live-id="${liveId}"]`)
+      if (!element || element.innerHTML === html) {
+        return
+      }
+      element.querySelectorAll('[data-bs-toggle="popover"]').forEach(function (trigger) {
+        const popover = bootstrap.Popover.getInstance(trigger)
+        if (popover) {
+          popover.dispose()
+        }
+      })
+      element.innerHTML = html
+      if (window.initPopovers) {
+        window.initPopovers(element)
+      }
+    })
+  })
+})()
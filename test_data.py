@@ -12,7 +12,7 @@ from config import (
     EXTERNAL_SPOOL_AMS_ID,
     EXTERNAL_SPOOL_ID,
 )
-from spoolman_service import augmentTrayDataWithSpoolMan, trayUid
+from spoolman_service import augmentTrayDataWithSpoolMan, spools_changed, trayUid
 
 TEST_MODE_FLAG = os.getenv("OPENSPOOLMAN_TEST_DATA") == "1"
 SNAPSHOT_PATH = Path(os.getenv("OPENSPOOLMAN_TEST_SNAPSHOT") or Path("data") / "live_snapshot.json")
@@ -33,13 +33,25 @@ def _compute_cost_per_gram(spool: dict) -> dict:
         try:
             spool["cost_per_gram"] = float(price) / float(initial_weight)
         except (TypeError, ValueError, ZeroDivisionError):
-            spool["cost_per_gram"] = 0
+            spool["cost_per_gram"] = None
     else:
-        spool["cost_per_gram"] = 0
+        spool["cost_per_gram"] = None
 
     return spool
 
 
+def _with_filament_costs(print_job: dict, prices: dict) -> dict:
+    # Snapshots may predate stored costs; price them like backfill_filament_costs does
+    filaments = json.loads(print_job.get("filament_info") or "[]")
+    for filament in filaments:
+        price = prices.get(filament.get("spool_id"))
+        if price is not None and filament.get("cost_per_gram") is None:
+            filament["cost_per_gram"] = price
+            filament["cost"] = (filament.get("grams_used") or 0) * price
+    print_job["filament_info"] = json.dumps(filaments)
+    return print_job
+
+
 def _load_snapshot(path: str | Path):
     snapshot_path = Path(path)
 
@@ -52,12 +64,14 @@ def _load_snapshot(path: str | Path):
         return None
 
     spools = [_compute_cost_per_gram(spool) for spool in data.get("spools", [])]
+    prices = {spool["id"]: spool["cost_per_gram"] for spool in spools}
+    prints = [_with_filament_costs(print_job, prices) for print_job in data.get("prints", [])]
 
     snapshot = {
         "spools": spools,
         "last_ams_config": data.get("last_ams_config") or {},
         "settings": data.get("settings") or {},
-        "prints": data.get("prints", []),
+        "prints": prints,
         "printer": data.get("printer") or {},
     }
 
@@ -112,7 +126,7 @@ def getPrinterModel():
     return printer
 
 
-def fetchSpools():
+def fetchSpools(cached=False, max_age=None):
     return deepcopy(_ensure_dataset_loaded().get("spools", []))
 
 
@@ -139,6 +153,7 @@ def patchExtraTags(spool_id, _, new_tags):
     for spool in dataset.get("spools", []):
         if spool["id"] == int(spool_id):
             spool.setdefault("extra", {}).update(new_tags)
+            spools_changed()
             return spool
     return None
 
@@ -157,6 +172,7 @@ def setActiveTray(spool_id, spool_extra, ams_id, tray_id):
         if spool["id"] == int(spool_id):
             spool.setdefault("extra", {}).update(spool_extra or {})
             spool["extra"]["active_tray"] = active_tray
+            spools_changed()
             break
     return active_tray
 
@@ -166,6 +182,7 @@ def consumeSpool(spool_id, grams):
     for spool in dataset.get("spools", []):
         if spool["id"] == int(spool_id):
             spool["remaining_weight"] = max(spool.get("remaining_weight", 0) - grams, 0)
+            spools_changed()
             break
 
 
@@ -179,6 +196,65 @@ def get_prints_with_filament(limit=50, offset=0):
     return prints, len(dataset.get("prints", []))
 
 
+def _matches_filters(print_job, filters):
+    filters = {key: value for key, value in (filters or {}).items() if value not in (None, "")}
+    file_name = (print_job.get("file_name") or "").lower()
+    if any(term.lower() not in file_name for term in str(filters.get("query", "")).split()):
+        return False
+    print_date = print_job.get("print_date") or ""
+    if "date_from" in filters and print_date < filters["date_from"]:
+        return False
+    if "date_to" in filters and print_date[:10] > filters["date_to"]:
+        return False
+    filaments = json.loads(print_job.get("filament_info", "[]"))
+    return any(
+        ("material" not in filters or filament.get("filament_type") == filters["material"])
+        and ("color" not in filters or (filament.get("color") or "").lower() == str(filters["color"]).lower())
+        and ("spool_id" not in filters or filament.get("spool_id") == filters["spool_id"])
+        for filament in filaments
+    ) if {"material", "color", "spool_id"} & set(filters) else True
+
+
+def get_prints_page(limit=50, before=None, after=None, filters=None):
+    dataset = _ensure_dataset_loaded()
+    prints = sorted(
+        (deepcopy(print_job) for print_job in dataset.get("prints", []) if _matches_filters(print_job, filters)),
+        key=lambda print_job: (print_job.get("print_date") or "", int(print_job.get("id"))),
+        reverse=True,
+    )
+    keys = [f"{print_job.get('print_date')}|{print_job.get('id')}" for print_job in prints]
+
+    start = 0
+    if after in keys:
+        start = max(keys.index(after) - limit, 0)
+    elif before in keys:
+        start = keys.index(before) + 1
+    page = prints[start:start + limit]
+    end = start + len(page)
+    return {
+        "prints": page,
+        "total_count": len(prints),
+        "next_cursor": keys[end - 1] if page and end < len(prints) else None,
+        "prev_cursor": keys[start] if page and start > 0 else None,
+    }
+
+
+def get_print_facets(filters=None):
+    dataset = _ensure_dataset_loaded()
+    filters = dict(filters or {}, material=None)
+    counts = {}
+    for print_job in dataset.get("prints", []):
+        if not _matches_filters(print_job, filters):
+            continue
+        for material in {filament.get("filament_type") for filament in json.loads(print_job.get("filament_info", "[]"))}:
+            counts[material] = counts.get(material, 0) + 1
+    materials = sorted(counts.items(), key=lambda item: (-item[1], item[0] or ""))
+    return {
+        "materials": [{"value": value, "count": count} for value, count in materials],
+        "statuses": [],
+    }
+
+
 def get_filament_for_slot(print_id, ams_slot):
     dataset = _ensure_dataset_loaded()
     for print_job in dataset.get("prints", []):
@@ -190,7 +266,7 @@ def get_filament_for_slot(print_id, ams_slot):
     return None
 
 
-def update_filament_spool(print_id, ams_slot, spool_id):
+def update_filament_spool(print_id, ams_slot, spool_id, cost_per_gram=None):
     dataset = _ensure_dataset_loaded()
     for print_job in dataset.get("prints", []):
         if int(print_job.get("id")) != int(print_id):
@@ -199,6 +275,8 @@ def update_filament_spool(print_id, ams_slot, spool_id):
         for filament in filaments:
             if int(filament.get("ams_slot")) == int(ams_slot):
                 filament["spool_id"] = int(spool_id)
+                filament["cost_per_gram"] = cost_per_gram
+                filament["cost"] = None if cost_per_gram is None else (filament.get("grams_used") or 0) * cost_per_gram
         print_job["filament_info"] = json.dumps(filaments)
     return True
 
@@ -221,6 +299,8 @@ _PATCH_TARGETS = {
     "spoolman_client.consumeSpool": consumeSpool,
     "spoolman_client.patchExtraTags": patchExtraTags,
     "print_history.get_prints_with_filament": get_prints_with_filament,
+    "print_history.get_prints_page": get_prints_page,
+    "print_history.get_print_facets": get_print_facets,
     "print_history.get_filament_for_slot": get_filament_for_slot,
     "print_history.update_filament_spool": update_filament_spool,
     "spoolman_service.fetchSpools": fetchSpools,
@@ -233,6 +313,22 @@ _PATCH_TARGETS = {
 }
 
 
+_ORIGINALS = {}
+
+
+def _remember_original(target):
+    if target not in _ORIGINALS:
+        module_name, attr = target.rsplit(".", 1)
+        _ORIGINALS[target] = getattr(importlib.import_module(module_name), attr)
+
+
+def unpatched(target):
+    """Return the production implementation of a patch target, even while the test-data patches are active."""
+
+    _remember_original(target)
+    return _ORIGINALS[target]
+
+
 def test_data_active():
     """Return True when the test-data patches or flag are enabled."""
 
@@ -262,6 +358,7 @@ def patched_test_data():
 
     with ExitStack() as stack:
         for target, replacement in _PATCH_TARGETS.items():
+            _remember_original(target)
             stack.enter_context(patch(target, replacement))
         try:
             yield
@@ -285,6 +382,7 @@ def apply_test_overrides(monkeypatch=None):
         global _PATCH_ACTIVE
         _PATCH_ACTIVE = True
         for target, replacement in _PATCH_TARGETS.items():
+            _remember_original(target)
             module_name, attr = target.rsplit(".", 1)
             module = importlib.import_module(module_name)
             monkeypatch.setattr(module, attr, replacement)
@@ -0,0 +1,73 @@
+import pytest
+
+import analytics
+import app as app_module
+import mqtt_bambulab
+import print_history
+from conftest import record_print
+
+SPOOLS = [
+    {"id": 1, "cost_per_gram": 0.02, "filament": {"name": "Basic", "material": "PLA", "vendor": {"name": "Bambu"}}},
+    {"id": 2, "cost_per_gram": 0.05, "filament": {"name": "HF", "material": "PETG", "vendor": {"name": "Bambu"}}},
+    {"id": 3, "cost_per_gram": 0, "filament": {"name": "Gift", "material": "PLA"}},
+]
+
+
+pytestmark = pytest.mark.history_db(unpatched=("update_filament_spool",))
+
+
+@pytest.fixture(autouse=True)
+def analytics_cache():
+    analytics.clear_cache()
+    yield
+    analytics.clear_cache()
+
+
+def test_usage_is_aggregated_per_day_material_vendor_and_spool(history_db):
+    record_print("2024-05-01 10:00:00", ("PLA", 100.0, 1), ("PETG", 10.0, 2))
+    record_print("2024-05-01 18:00:00", ("PLA", 50.0, 3))
+    record_print("2024-05-03 09:00:00", ("PLA", 20.0, None))
+
+    # Usage without a spool or on a spool without a price has an unknown cost, reported as unpriced grams
+    assert analytics.usage_per_day(SPOOLS) == [
+        {"day": "2024-05-01", "print_count": 2, "grams_used": 160.0, "cost": 2.5, "unpriced_grams": 50.0},
+        {"day": "2024-05-03", "print_count": 1, "grams_used": 20.0, "cost": 0.0, "unpriced_grams": 20.0},
+    ]
+    assert analytics.usage_per_day(SPOOLS, "2024-05-02", "2024-05-31") == [
+        {"day": "2024-05-03", "print_count": 1, "grams_used": 20.0, "cost": 0.0, "unpriced_grams": 20.0},
+    ]
+    assert analytics.usage_per_material(SPOOLS) == [
+        {"material": "PLA", "usage_count": 3, "grams_used": 170.0, "cost": 2.0, "unpriced_grams": 70.0},
+        {"material": "PETG", "usage_count": 1, "grams_used": 10.0, "cost": 0.5, "unpriced_grams": 0.0},
+    ]
+    assert analytics.usage_per_vendor(SPOOLS) == [
+        {"vendor": "Bambu", "spool_count": 2, "grams_used": 110.0, "cost": 2.5, "unpriced_grams": 0.0},
+        {"vendor": analytics.UNKNOWN_VENDOR, "spool_count": 1, "grams_used": 50.0, "cost": 0.0, "unpriced_grams": 50.0},
+    ]
+    assert [(spool["spool_id"], spool["cost"], spool["unpriced_grams"]) for spool in analytics.usage_per_spool(SPOOLS)] == [
+        (1, 2.0, 0.0), (3, 0.0, 50.0), (2, 0.5, 0.0),
+    ]
+
+
+def test_cached_results_follow_new_usage_and_price_changes(history_db):
+    record_print("2024-05-01 10:00:00", ("PLA", 100.0, 1))
+    assert analytics.usage_per_material(SPOOLS)[0]["grams_used"] == 100.0
+
+    version = print_history.get_usage_version()
+    record_print("2024-05-02 10:00:00", ("PLA", 25.0, 1))
+    assert print_history.get_usage_version() > version
+    assert analytics.usage_per_material(SPOOLS)[0]["grams_used"] == 125.0
+
+    repriced = [dict(SPOOLS[0], cost_per_gram=0.04)]
+    assert analytics.usage_per_material(repriced)[0]["cost"] == 5.0
+
+
+def test_analytics_routes(history_db, monkeypatch):
+    monkeypatch.setattr(mqtt_bambulab, "fetchSpools", lambda cached=False: SPOOLS)
+    record_print("2024-05-01 10:00:00", ("PLA", 100.0, 1))
+    client = app_module.app.test_client()
+
+    assert client.get("/api/analytics/daily?from=2024-05-01&to=2024-05-01").get_json()["days"][0]["cost"] == 2.0
+    assert client.get("/api/analytics/materials").get_json()["materials"][0]["material"] == "PLA"
+    assert client.get("/api/analytics/vendors").get_json()["vendors"][0]["vendor"] == "Bambu"
+    assert client.get("/api/analytics/spools").get_json()["spools"][0]["spool_id"] == 1
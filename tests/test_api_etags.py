@@ -0,0 +1,98 @@
+import pytest
+
+import app as app_module
+import live_updates
+import mqtt_bambulab
+import print_history
+import spoolman_client
+import spoolman_service
+import test_data
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(print_history.db_config, "db_path", str(tmp_path / "history.db"))
+    monkeypatch.setattr(print_history, "get_prints_page", test_data.unpatched("print_history.get_prints_page"))
+    monkeypatch.setattr(live_updates, "LIVE_UPDATES", live_updates.LiveUpdates())
+    print_history.create_database()
+    yield app_module.app.test_client()
+    print_history.close_connections()
+
+
+def _revalidate(client, url, etag):
+    return client.get(url, headers={"If-None-Match": etag})
+
+
+def test_trays_and_printer_follow_the_live_version(client):
+    for url in ("/api/trays", "/api/printer"):
+        response = client.get(url)
+        etag = response.headers["ETag"]
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == "no-cache"
+
+        not_modified = _revalidate(client, url, etag)
+        assert not_modified.status_code == 304
+        assert not_modified.headers["ETag"] == etag
+
+        live_updates.notify()
+        assert _revalidate(client, url, etag).status_code == 200
+
+    trays = client.get("/api/trays").get_json()["trays"]
+    assert (trays[0]["ams_id"], trays[0]["tray_id"]) == (app_module.EXTERNAL_SPOOL_AMS_ID, app_module.EXTERNAL_SPOOL_ID)
+
+
+def test_trays_and_printer_follow_changes_made_in_spoolman(client, monkeypatch):
+    inventory = [{"id": 1, "remaining_weight": 800.0, "filament": {"name": "Basic"}}]
+    monkeypatch.setattr(spoolman_client, "fetchSpoolList", lambda: [dict(spool) for spool in inventory])
+    monkeypatch.setattr(mqtt_bambulab, "fetchSpools", test_data.unpatched("spoolman_service.fetchSpools"))
+    monkeypatch.setattr(spoolman_service, "SPOOLS", {})
+    monkeypatch.setattr(spoolman_service, "SPOOLS_MAX_AGE_SECONDS", 0)
+
+    for url in ("/api/trays", "/api/printer"):
+        etag = client.get(url).headers["ETag"]
+        assert _revalidate(client, url, etag).status_code == 304
+
+        # Only SpoolMan knows about this edit; no MQTT report or other route fetches the spools
+        inventory[0] = dict(inventory[0], remaining_weight=inventory[0]["remaining_weight"] - 100)
+        assert _revalidate(client, url, etag).status_code == 200
+
+
+def test_prints_change_with_the_history(client):
+    print_id, _ = print_history.record_print_start(
+        {"file_name": "benchy.3mf", "print_type": "cloud", "print_date": "2024-05-01 10:00:00"},
+        [{"filament_type": "PLA", "color": "#FFFFFF", "grams_used": 12.0, "ams_slot": 0}],
+    )
+    response = client.get("/api/prints?q=benchy&limit=10")
+    etag = response.headers["ETag"]
+    entry = response.get_json()["prints"][0]
+    assert entry["filament_usage"][0]["grams_used"] == 12.0
+    assert entry["layer_tracking"] is None
+
+    assert _revalidate(client, "/api/prints?q=benchy&limit=10", etag).status_code == 304
+
+    print_history.update_layer_tracking(print_id, total_layers=10, layers_printed=4, status="RUNNING")
+    response = _revalidate(client, "/api/prints?q=benchy&limit=10", etag)
+    assert response.status_code == 200
+    assert response.get_json()["prints"][0]["layer_tracking"]["layers_printed"] == 4
+
+    assert client.get("/api/prints?limit=many").status_code == 400
+
+
+def test_spools_only_change_when_spoolman_returns_a_different_list(client, monkeypatch):
+    inventory = [{"id": 1, "filament": {"name": "Basic"}}]
+    monkeypatch.setattr(spoolman_client, "fetchSpoolList", lambda: [dict(spool) for spool in inventory])
+    monkeypatch.setattr(mqtt_bambulab, "fetchSpools", test_data.unpatched("spoolman_service.fetchSpools"))
+    monkeypatch.setattr(spoolman_service, "SPOOLS", {})
+    monkeypatch.setattr(spoolman_service, "SPOOLS_MAX_AGE_SECONDS", 0)
+
+    response = client.get("/api/spools")
+    etag = response.headers["ETag"]
+    # Without a price the cost is unknown rather than zero
+    assert response.get_json()["spools"][0]["cost_per_gram"] is None
+
+    assert _revalidate(client, "/api/spools", etag).status_code == 304
+
+    inventory.append({"id": 2, "filament": {"name": "Matte"}})
+    response = _revalidate(client, "/api/spools", etag)
+    assert response.status_code == 200
+    assert len(response.get_json()["spools"]) == 2
@@ -0,0 +1,33 @@
+import zipfile
+
+from filament_usage_tracker import evaluate_gcode, extract_gcode_from_3mf
+from scripts.benchmark_gcode import GCODE_MEMBER, SyntheticPrint, generate_synthetic_3mf
+from tools_3mf import get_filament_order, scan_3mf_gcode
+
+
+def test_synthetic_print_is_evaluated_like_a_real_one(tmp_path):
+    spec = SyntheticPrint(layers=6, filaments=2, swap_every=2, moves_per_layer=3)
+    model = generate_synthetic_3mf(tmp_path / "synthetic.gcode.3mf", spec)
+
+    gcode = extract_gcode_from_3mf(str(model), None)
+    assert gcode == extract_gcode_from_3mf(str(model), GCODE_MEMBER)
+
+    usage = evaluate_gcode(gcode)
+    assert sorted(usage) == [1, 2, 3, 4, 5, 6]
+    assert set(usage[1]) == {0}
+    assert set(usage[2]) == {1}
+    assert set(usage[4]) == {0}
+
+
+def test_scan_3mf_gcode_matches_evaluate_gcode_and_filament_order(tmp_path):
+    spec = SyntheticPrint(layers=9, filaments=3, swap_every=2, moves_per_layer=4)
+    model = generate_synthetic_3mf(tmp_path / "synthetic.gcode.3mf", spec)
+
+    scan = scan_3mf_gcode(str(model))
+    assert scan["layer_usage"] == evaluate_gcode(extract_gcode_from_3mf(str(model), None))
+    with zipfile.ZipFile(model) as z, z.open(GCODE_MEMBER) as handle:
+        assert scan["filament_order"] == get_filament_order(handle)
+    assert scan["filament_order"] == {0: 0, 1: 2, 2: 4}
+    assert scan["swaps"] == [0, 1, 2, 0, 1]
+    assert scan["total_layers"] == 9
+    assert scan_3mf_gcode(str(model)) is scan
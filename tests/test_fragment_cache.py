@@ -0,0 +1,75 @@
+import app as app_module
+import fragment_cache
+import mqtt_bambulab
+import spoolman_service
+from fragment_cache import FragmentCache
+from tray_views import TrayViews
+
+from test_tray_views import SPOOLS, printer  # noqa: F401  (fixture)
+
+
+def test_each_key_keeps_one_version_and_memory_stays_bounded():
+    cache = FragmentCache(max_chars=10)
+    renders = []
+
+    def render(html):
+        def _render():
+            renders.append(html)
+            return html
+        return _render
+
+    assert cache.get(("a.html", 1), 1, render("aaaa")) == "aaaa"
+    assert cache.get(("a.html", 1), 1, render("ignored")) == "aaaa"
+    assert cache.get(("a.html", 1), 2, render("AAAA")) == "AAAA"
+    assert (len(cache), cache.size) == (1, 4)
+
+    cache.get(("b.html",), 1, render("bbbb"))
+    cache.get(("a.html", 1), 2, render("ignored"))
+    # Over the bound, the least recently used fragment goes first
+    cache.get(("c.html",), 1, render("cccc"))
+    assert (len(cache), cache.size) == (2, 8)
+    assert cache.get(("a.html", 1), 2, render("again")) == "AAAA"
+    assert renders == ["aaaa", "AAAA", "bbbb", "cccc"]
+
+    cache.invalidate("a.html")
+    assert (len(cache), cache.size) == (1, 4)
+    cache.invalidate()
+    assert (len(cache), cache.size) == (0, 0)
+
+
+def test_tray_fragments_are_reused_across_humidity_changes(printer, monkeypatch):  # noqa: F811
+    monkeypatch.setattr(fragment_cache, "FRAGMENT_CACHE", FragmentCache())
+    renders = []
+    render_template = app_module.render_template
+    monkeypatch.setattr(app_module, "render_template", lambda name, **context: renders.append(name) or render_template(name, **context))
+    views = TrayViews()
+
+    with app_module.app.test_request_context():
+        first = app_module.tray_fragment(views.current(), 0, 1)
+        assert "PLA Basic" in first
+
+        printer["ams"][0]["humidity"] = "4"
+        monkeypatch.setattr(mqtt_bambulab, "TRAY_VERSION", mqtt_bambulab.TRAY_VERSION + 1)
+        trays = views.current()
+        assert app_module.tray_fragment(trays, 0, 1) is first
+        assert renders == ["fragments/tray.html"]
+
+        printer["ams"][0]["tray"][1]["tray_type"] = "PETG"
+        monkeypatch.setattr(mqtt_bambulab, "TRAY_VERSION", mqtt_bambulab.TRAY_VERSION + 1)
+        assert app_module.tray_fragment(views.current(), 0, 1) is not first
+        assert renders == ["fragments/tray.html"] * 2
+
+
+def test_spool_lists_are_rendered_again_when_the_inventory_changes(monkeypatch):
+    monkeypatch.setattr(fragment_cache, "FRAGMENT_CACHE", FragmentCache())
+    spools = [dict(SPOOLS[0], id=7)]
+    spoolman_service.spools_changed()
+
+    with app_module.app.test_request_context("/assign_tag"):
+        html = app_module.spool_list_fragment(app_module.spool_picker(spools), action_assign=True)
+        assert "#7" in html
+        assert app_module.spool_list_fragment(app_module.spool_picker(spools), action_assign=True) is html
+
+        spools.append(dict(SPOOLS[0], id=8))
+        spoolman_service.spools_changed()
+        assert "#8" in app_module.spool_list_fragment(app_module.spool_picker(spools), action_assign=True)
@@ -0,0 +1,139 @@
+import json
+import sqlite3
+
+import filament_usage_tracker
+import print_history
+from config import EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID
+from filament_usage_tracker import FilamentUsageTracker
+from spoolman_service import trayUid
+
+
+def test_flush_layer_tracking_writes_all_updates(tmp_path, monkeypatch):
+    monkeypatch.setitem(print_history.db_config, "db_path", str(tmp_path / "history.db"))
+    print_history.create_database()
+    print_id = print_history.insert_print("cube.3mf", "cloud")
+    print_history.insert_filament_usage(print_id, "PLA", "#FFFFFF", 0.0, 1)
+    print_history.insert_filament_usage(print_id, "PLA", "#000000", 0.0, 2)
+
+    print_history.flush_layer_tracking(
+        print_id,
+        {1: {"spool_id": 7, "grams_used": 1.5}, 2: {"grams_used": 0.25}},
+        {"layers_printed": 3, "status": "RUNNING"},
+    )
+
+    conn = sqlite3.connect(print_history.db_config["db_path"])
+    rows = conn.execute(
+        "SELECT ams_slot, spool_id, grams_used FROM filament_usage ORDER BY ams_slot"
+    ).fetchall()
+    tracking = conn.execute(
+        "SELECT layers_printed, status FROM print_layer_tracking WHERE print_id = ?", (print_id,)
+    ).fetchone()
+    conn.close()
+
+    assert rows == [(1, 7, 1.5), (2, None, 0.25)]
+    assert tracking == (3, "RUNNING")
+
+
+def test_tracker_buffers_progress_between_flushes(monkeypatch):
+    flushes = []
+    monkeypatch.setattr(
+        filament_usage_tracker,
+        "flush_layer_tracking",
+        lambda print_id, filaments, fields: flushes.append((print_id, dict(filaments), dict(fields))),
+    )
+    monkeypatch.setattr(filament_usage_tracker, "LAYER_TRACKING_FLUSH_SECONDS", 3600)
+
+    tracker = FilamentUsageTracker()
+    tracker.print_id = 42
+    for layer in range(1, 6):
+        tracker.spent_layers.add(layer)
+        tracker._stage_filament_update(1, grams_used=float(layer))
+        tracker._update_layer_tracking_progress()
+
+    assert len(flushes) == 1
+
+    tracker._flush_history(force=True)
+
+    assert len(flushes) == 2
+    print_id, filaments, fields = flushes[-1]
+    assert print_id == 42
+    assert filaments == {1: {"grams_used": 5.0}}
+    assert fields["layers_printed"] == 5
+
+
+def test_resume_after_unflushed_progress_keeps_charged_grams(tmp_path, monkeypatch):
+    layers = {layer: {0: 100.0} for layer in range(4)}
+    stored = {}
+    charged = []
+    monkeypatch.setattr(filament_usage_tracker, "CHECKPOINT_DIR", tmp_path / "checkpoint")
+    monkeypatch.setattr(filament_usage_tracker, "TRACK_LAYER_USAGE", True)
+    monkeypatch.setattr(filament_usage_tracker, "LAYER_TRACKING_FLUSH_SECONDS", 3600)
+    monkeypatch.setattr(
+        filament_usage_tracker,
+        "scan_3mf_gcode",
+        lambda model_path, gcode_file: {"layer_usage": layers, "total_layers": len(layers)},
+    )
+    monkeypatch.setattr(
+        filament_usage_tracker,
+        "fetchSpools",
+        lambda: [{
+            "id": 7,
+            "extra": {"active_tray": json.dumps(trayUid(EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID))},
+            "filament": {"diameter": 1.75, "density": 1.24},
+        }],
+    )
+    monkeypatch.setattr(filament_usage_tracker, "consumeSpool", lambda spool_id, use_length: charged.append(use_length))
+    monkeypatch.setattr(
+        filament_usage_tracker,
+        "flush_layer_tracking",
+        lambda print_id, filaments, fields: stored.update(
+            {slot: values["grams_used"] for slot, values in filaments.items() if "grams_used" in values}
+        ),
+    )
+    monkeypatch.setattr(filament_usage_tracker, "get_all_filament_usage_for_print", lambda print_id: dict(stored))
+    model_path = tmp_path / "cube.3mf"
+    model_path.write_bytes(b"model")
+
+    tracker = FilamentUsageTracker()
+    tracker.print_id = 42
+    tracker._start_layer_tracking_for_model(
+        model_path=str(model_path),
+        gcode_file_name="Metadata/plate_1.gcode",
+        use_ams=False,
+        ams_mapping=None,
+        task_id="task",
+        subtask_id="subtask",
+    )
+    tracker._handle_layer_change(1)
+    tracker._handle_layer_change(2)
+    charged_grams = tracker.cumulative_grams_used[1]
+    # Spoolman was charged for three layers that never reached the database
+    assert len(charged) == 3
+    assert stored.get(1, 0.0) < charged_grams
+
+    resumed = FilamentUsageTracker()
+    resumed.print_id = 42
+    resumed.on_message({"print": {"gcode_state": "RUNNING", "task_id": "task", "subtask_id": "subtask"}})
+
+    assert len(charged) == 3
+    assert resumed.cumulative_grams_used[1] == charged_grams
+    assert stored[1] == round(charged_grams, 2)
+
+    resumed.on_message({"print": {"command": "push_status", "gcode_state": "RUNNING", "layer_num": 3}})
+
+    assert charged == [100.0] * 4
+    assert resumed.cumulative_grams_used[1] == charged_grams * 4 / 3
+
+
+def test_total_layers_come_from_the_gcode_scan(monkeypatch):
+    # The last layers only travel, so no filament usage is recorded for them
+    scan = {"layer_usage": {0: {0: 10.0}, 5: {0: 4.0}}, "total_layers": 9}
+    monkeypatch.setattr(filament_usage_tracker, "scan_3mf_gcode", lambda model_path, gcode_file: scan)
+
+    tracker = FilamentUsageTracker()
+    tracker._load_model("cube.3mf", None)
+    assert tracker._infer_total_layers() == 9
+
+    scan["total_layers"] = 0
+    tracker._load_model("cube.3mf", None)
+    assert tracker._infer_total_layers() == 6
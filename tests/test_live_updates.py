@@ -0,0 +1,81 @@
+import html
+import json
+import re
+import threading
+
+import app as app_module
+import live_updates
+import mqtt_bambulab
+from live_updates import LiveUpdates
+
+
+def _events(chunks):
+    return [json.loads(chunk.split("data: ", 1)[1]) for chunk in chunks if chunk.startswith("id: ")]
+
+
+def test_stream_sends_changed_fragments_and_renders_once_per_version():
+    live = LiveUpdates()
+    state = {"layout": "a", "fragments": {"tray-0-0": "PLA", "tray-0-1": "PETG"}}
+    renders = []
+
+    def render():
+        renders.append(live.version)
+        return {"layout": state["layout"], "fragments": dict(state["fragments"])}
+
+    first, second = live.stream(render, keepalive=0.01), live.stream(render, keepalive=0.01)
+    assert next(first).startswith("retry: ")
+    next(second)
+    assert _events([next(first), next(second)]) == [{"layout": "a", "fragments": state["fragments"]}] * 2
+
+    assert next(first) == ": keepalive\n\n"
+
+    state["fragments"]["tray-0-1"] = "ABS"
+    live.notify()
+    assert _events([next(first), next(second)]) == [{"layout": "a", "fragments": {"tray-0-1": "ABS"}}] * 2
+    assert renders == [0, 1]
+
+    # A change that leaves the fragments as they were is not sent
+    live.notify()
+    assert next(first) == ": keepalive\n\n"
+
+
+def test_wait_wakes_up_on_notify():
+    live = LiveUpdates()
+    timer = threading.Timer(0.05, live.notify)
+    timer.start()
+
+    assert live.wait(0, timeout=5) == 1
+    assert live.wait(1, timeout=0.01) == 1
+
+
+def test_mqtt_reports_only_notify_on_dashboard_changes(monkeypatch):
+    monkeypatch.setattr(mqtt_bambulab, "LIVE_STATE", {})
+    report = {"mc_percent": 10, "layer_num": 3, "wifi_signal": "-40dBm"}
+
+    assert mqtt_bambulab._changed_live_fields(report) == {"mc_percent", "layer_num"}
+    assert mqtt_bambulab._changed_live_fields(dict(report, wifi_signal="-42dBm")) == set()
+    assert mqtt_bambulab._changed_live_fields(dict(report, layer_num=4)) == {"layer_num"}
+    assert mqtt_bambulab.getPrintProgress()["layer_num"] == 4
+
+
+def test_events_route_streams_home_fragments_and_limits_clients(monkeypatch):
+    monkeypatch.setattr(live_updates, "LIVE_UPDATES", LiveUpdates(max_clients=1))
+    client = app_module.app.test_client()
+
+    response = client.get("/events", buffered=False)
+    chunks = response.response
+    assert response.mimetype == "text/event-stream"
+    assert next(chunks).startswith(b"retry: ")
+    update = _events([next(chunks).decode()])[0]
+    assert "print-progress" in update["fragments"]
+    assert any(key.startswith("tray-") for key in update["fragments"])
+
+    assert client.get("/events").status_code == 204
+    response.close()
+    released = client.get("/events", buffered=False)
+    assert released.status_code == 200
+    released.close()
+
+    # The page and the stream agree on the layout, so the client does not reload
+    page = client.get("/").get_data(as_text=True)
+    assert html.unescape(re.search(r'data-live-layout="([^"]*)"', page).group(1)) == update["layout"]
@@ -0,0 +1,78 @@
+import zipfile
+
+import tools_3mf
+from model_cache import ModelCache
+
+
+def _write(content):
+    def fetch(dest):
+        dest.write(content)
+    return fetch
+
+
+def test_second_fetch_is_served_from_cache(tmp_path):
+    cache = ModelCache(tmp_path, max_bytes=1024 * 1024)
+    calls = []
+
+    def fetch(dest):
+        calls.append(1)
+        dest.write(b"model")
+
+    first = cache.get("https://host/model.3mf", fetch)
+    second = cache.get("https://host/model.3mf", fetch)
+
+    assert first == second
+    assert len(calls) == 1
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    cache = ModelCache(tmp_path, max_bytes=1024 * 1024)
+
+    first = cache.get("ftp:a.3mf", _write(b"same"))
+    second = cache.get("ftp:b.3mf", _write(b"same"))
+
+    assert first == second
+    assert len(list(tmp_path.glob("*.3mf"))) == 1
+
+
+def test_refresh_downloads_again(tmp_path):
+    cache = ModelCache(tmp_path, max_bytes=1024 * 1024)
+
+    first = cache.get("ftp:a.3mf", _write(b"old"))
+    second = cache.get("ftp:a.3mf", _write(b"new"), refresh=True)
+
+    assert first != second
+    with open(second, "rb") as f:
+        assert f.read() == b"new"
+
+
+def test_least_recently_used_models_are_evicted(tmp_path):
+    cache = ModelCache(tmp_path, max_bytes=10)
+
+    old = cache.get("ftp:old.3mf", _write(b"x" * 6))
+    new = cache.get("ftp:new.3mf", _write(b"y" * 6))
+
+    assert cache.lookup("ftp:old.3mf") is None
+    assert cache.lookup("ftp:new.3mf") == new
+    assert old != new
+
+
+def test_metadata_and_tracker_share_one_download(tmp_path, monkeypatch):
+    model = tmp_path / "source.3mf"
+    with zipfile.ZipFile(model, "w") as z:
+        z.writestr("Metadata/slice_info.config", "<config/>")
+
+    downloads = []
+
+    def fake_download(url, dest):
+        downloads.append(url)
+        dest.write(model.read_bytes())
+
+    monkeypatch.setattr(tools_3mf, "MODEL_CACHE", ModelCache(tmp_path / "cache", max_bytes=1024 * 1024))
+    monkeypatch.setattr(tools_3mf, "fetch3mfMetadataFromCloud", fake_download)
+
+    first = tools_3mf.fetch_model("https://cloud/models/1.3mf?X-Amz-Signature=a")
+    second = tools_3mf.fetch_model("https://cloud/models/1.3mf?X-Amz-Signature=b")
+
+    assert first == second
+    assert len(downloads) == 1
@@ -0,0 +1,60 @@
+import printer_ftp
+import tools_3mf
+from model_cache import ModelCache
+from model_prefetch import ModelPrefetcher
+from scripts.benchmark_gcode import SyntheticPrint, generate_synthetic_3mf
+
+
+class FakePrinterSession:
+    def __init__(self, files):
+        self.files = files
+        self.downloads = []
+
+    def list(self, directory="/cache/"):
+        return [
+            {"name": name, "size": len(data), "month": "Oct", "day": 19, "time_or_year": "10:00"}
+            for name, data in self.files.items()
+        ]
+
+    def download(self, remote_path, dest, expected_size=None):
+        self.downloads.append(remote_path)
+        dest.write(self.files[remote_path.rsplit("/", 1)[1]])
+
+
+def test_prefetched_model_is_reused_at_print_start(tmp_path, monkeypatch):
+    model = generate_synthetic_3mf(
+        tmp_path / "source.3mf", SyntheticPrint(layers=4, filaments=2, swap_every=2, moves_per_layer=3)
+    )
+    session = FakePrinterSession({"old.3mf": b"already there"})
+    monkeypatch.setattr(printer_ftp, "get_session", lambda *args: session)
+    monkeypatch.setattr(tools_3mf, "MODEL_CACHE", ModelCache(tmp_path / "cache", max_bytes=10 * 1024 * 1024))
+    prefetcher = ModelPrefetcher(session=session)
+
+    assert prefetcher.poll_once() == []
+
+    # Still uploading: the size changes between polls, so nothing is fetched yet.
+    session.files["cube.3mf"] = b"partial"
+    assert prefetcher.poll_once() == []
+    session.files["cube.3mf"] = model.read_bytes()
+    assert prefetcher.poll_once() == []
+    assert prefetcher.poll_once() == ["cube.3mf"]
+    assert session.downloads == ["/cache/cube.3mf"]
+
+    path = tools_3mf.fetch_model("cube.3mf")
+    assert session.downloads == ["/cache/cube.3mf"]
+    assert tools_3mf.scan_3mf_gcode(path)["total_layers"] == 4
+    assert prefetcher.poll_once() == []
+
+
+def test_replaced_printer_file_is_downloaded_again(tmp_path, monkeypatch):
+    session = FakePrinterSession({"cube.3mf": b"first"})
+    monkeypatch.setattr(printer_ftp, "get_session", lambda *args: session)
+    monkeypatch.setattr(tools_3mf, "MODEL_CACHE", ModelCache(tmp_path / "cache", max_bytes=1024 * 1024))
+
+    first = tools_3mf.fetch_model("cube.3mf")
+    assert tools_3mf.fetch_model("cube.3mf") == first
+    session.files["cube.3mf"] = b"second upload"
+    second = tools_3mf.fetch_model("cube.3mf")
+
+    assert first != second
+    assert len(session.downloads) == 2
@@ -9,6 +9,7 @@ from pathlib import Path
 import pytest
 
 import mqtt_bambulab
+import print_history
 from filament_usage_tracker import FilamentUsageTracker
 import tools_3mf
 import spoolman_client
@@ -90,13 +91,22 @@ def _stub_spoolman(monkeypatch):
   monkeypatch.setattr(spoolman_client, "fetchSpoolList", lambda *args, **kwargs: copy.deepcopy(MOCK_SPOOLS))
 
 
-def _stub_history(monkeypatch):
-  # Keep DB untouched.
+def _stub_history(monkeypatch, tmp_path):
+  # Keep DB untouched. The modules import these functions by name, so they are patched where they are used;
+  # anything still reaching the history writes to a throwaway database.
+  monkeypatch.setitem(print_history.db_config, "db_path", str(tmp_path / "history.db"))
   monkeypatch.setattr("print_history.insert_print", lambda *args, **kwargs: 1)
   monkeypatch.setattr("print_history.insert_filament_usage", lambda *args, **kwargs: None)
+  monkeypatch.setattr("print_history.record_print_start", lambda *args, **kwargs: (1, []))
   monkeypatch.setattr("print_history.update_filament_spool", lambda *args, **kwargs: None)
   monkeypatch.setattr("print_history.update_filament_grams_used", lambda *args, **kwargs: None)
   monkeypatch.setattr("print_history.update_layer_tracking", lambda *args, **kwargs: None)
+  monkeypatch.setattr("print_history.flush_layer_tracking", lambda *args, **kwargs: None)
+  monkeypatch.setattr("mqtt_bambulab.record_print_start", lambda *args, **kwargs: (1, []))
+  monkeypatch.setattr("spoolman_service.update_filament_spool", lambda *args, **kwargs: None)
+  monkeypatch.setattr("filament_usage_tracker.get_all_filament_usage_for_print", lambda *args, **kwargs: {})
+  monkeypatch.setattr("filament_usage_tracker.update_layer_tracking", lambda *args, **kwargs: None)
+  monkeypatch.setattr("filament_usage_tracker.flush_layer_tracking", lambda *args, **kwargs: None)
 
 
 def _build_fake_get_meta(model_path: Path):
@@ -109,7 +119,7 @@ def _build_fake_get_meta(model_path: Path):
 
 
 @pytest.mark.parametrize("log_path", _iter_log_files(), ids=lambda p: p.name)
-def test_mqtt_log_tray_detection(log_path, monkeypatch, caplog):
+def test_mqtt_log_tray_detection(log_path, monkeypatch, caplog, tmp_path):
   expected = _load_expected(log_path)
   expected_assignments_raw = expected.get("expected_assignments") or {}
   expected_assignments = {str(k): str(v) for k, v in expected_assignments_raw.items()}
@@ -125,7 +135,7 @@ def test_mqtt_log_tray_detection(log_path, monkeypatch, caplog):
   shutil.copy2(model_path, temp_model_path)
 
   _stub_spoolman(monkeypatch)
-  _stub_history(monkeypatch)
+  _stub_history(monkeypatch, tmp_path)
 
   monkeypatch.setattr("mqtt_bambulab.getMetaDataFrom3mf", _build_fake_get_meta(temp_model_path))
 
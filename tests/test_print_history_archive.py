@@ -0,0 +1,93 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import print_history
+import thumbnails
+from conftest import record_print
+from history_archive import HistoryArchiver
+from scripts import prune_thumbnails
+
+pytestmark = pytest.mark.history_db(archive=True, unpatched=("get_prints_page", "update_filament_spool"))
+
+
+def _record(days_ago, file_name="model.3mf", image_file=None):
+    print_date = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%d %H:%M:%S")
+    return record_print(print_date, ("PLA", 4.0, 3), file_name=file_name, image_file=image_file, status="COMPLETED")
+
+
+def test_old_prints_move_to_the_archive(history_db):
+    old = [_record(400, file_name=f"old_{n}.3mf") for n in range(5)]
+    recent = _record(10, file_name="recent.3mf")
+
+    assert print_history.archive_prints(365, batch_size=2) == 5
+
+    assert [row["id"] for row in print_history.get_prints_page(50)["prints"]] == [recent]
+    assert print_history.count_prints() == 1
+    assert print_history.get_spool_usage(3) == {"spool_id": 3, "print_count": 1, "grams_used": 4.0}
+    assert print_history.get_layer_tracking_for_prints(old) == {}
+
+    with print_history.reading_archive():
+        page = print_history.get_prints_page(50, filters={"query": "old"})
+        assert sorted(row["id"] for row in page["prints"]) == old
+        assert page["total_count"] == 5
+        assert print_history.get_all_filament_usage_for_print(old[0]) == {0: 4.0}
+        assert set(print_history.get_layer_tracking_for_prints(old)) == set(old)
+        assert print_history.get_spool_usage(3) == {"spool_id": 3, "print_count": 5, "grams_used": 20.0}
+
+    # Nothing left to move; reads are back on the live database
+    assert print_history.archive_prints(365) == 0
+    assert print_history.count_prints() == 1
+
+
+def test_compaction_releases_free_pages(history_db):
+    for n in range(300):
+        _record(400, file_name=f"{'x' * 200}_{n}.3mf")
+    print_history.archive_prints(365)
+
+    conn = print_history.get_connection()
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == print_history.AUTO_VACUUM_INCREMENTAL
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] > 0
+
+    assert print_history.compact_database(step_pages=4) > 0
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+def test_archiver_keeps_thumbnails_referenced_by_either_database(history_db):
+    thumbnail_dir = history_db / "prints"
+    thumbnail_dir.mkdir()
+    archived, live, orphan, pending = ("a" * 20 + ".png", "b" * 20 + ".png", "c" * 20 + ".png", "d" * 20 + ".png")
+    stored_long_ago = time.time() - 2 * 24 * 60 * 60
+    for name in (archived, live, orphan):
+        (thumbnail_dir / name).write_bytes(b"png")
+        os.utime(thumbnail_dir / name, (stored_long_ago, stored_long_ago))
+    # Stored at PREPARE, before the print row that references it is written
+    (thumbnail_dir / pending).write_bytes(b"png")
+    _record(400, image_file=archived)
+    _record(1, image_file=live)
+
+    stats = HistoryArchiver(older_than_days=365, thumbnail_dir=thumbnail_dir).run_once()
+
+    assert stats["archived"] == 1
+    assert stats["removed_thumbnails"] == 1
+    assert sorted(path.name for path in thumbnail_dir.iterdir()) == [archived, live, pending]
+
+
+def test_prune_script_keeps_thumbnails_of_archived_prints(history_db, monkeypatch):
+    thumbnail_dir = history_db / "prints"
+    thumbnail_dir.mkdir()
+    monkeypatch.setattr(thumbnails, "THUMBNAIL_DIR", thumbnail_dir)
+    monkeypatch.setattr("sys.argv", ["prune_thumbnails.py"])
+    archived, orphan = ("a" * 20 + ".png", "c" * 20 + ".png")
+    stored_long_ago = time.time() - 2 * 24 * 60 * 60
+    for name in (archived, orphan):
+        (thumbnail_dir / name).write_bytes(b"png")
+        os.utime(thumbnail_dir / name, (stored_long_ago, stored_long_ago))
+    _record(400, image_file=archived)
+    assert print_history.archive_prints(365) == 1
+
+    assert prune_thumbnails.main() == 0
+
+    assert [path.name for path in thumbnail_dir.iterdir()] == [archived]
@@ -0,0 +1,75 @@
+import sqlite3
+import threading
+
+import pytest
+
+import print_history
+
+
+def test_connection_is_reused_per_thread_and_uses_wal(history_db):
+    conn = print_history.get_connection()
+
+    assert print_history.get_connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == print_history.BUSY_TIMEOUT_MS
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(print_history.get_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_transaction_rolls_back_on_error(history_db):
+    print_id = print_history.insert_print("cube.3mf", "local")
+
+    with pytest.raises(RuntimeError):
+        with print_history.transaction() as cursor:
+            print_history.insert_filament_usage(print_id, "PLA", "#FFFFFF", 1.0, 0)
+            cursor.execute("UPDATE prints SET file_name = 'changed.3mf' WHERE id = ?", (print_id,))
+            raise RuntimeError("abort")
+
+    assert print_history.get_all_filament_usage_for_print(print_id) == {}
+    file_names = print_history.get_connection().execute("SELECT file_name FROM prints").fetchall()
+    assert file_names == [("cube.3mf",)]
+    assert not print_history.get_connection().in_transaction
+
+
+def test_writes_are_visible_to_other_threads(history_db):
+    print_id = print_history.insert_print("cube.3mf", "cloud")
+    print_history.insert_filament_usage(print_id, "PLA", "#000000", 2.5, 1)
+
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(print_history.get_all_filament_usage_for_print(print_id)))
+    thread.start()
+    thread.join()
+
+    assert seen == [{1: 2.5}]
+
+
+def test_record_print_start_writes_print_and_filaments_together(history_db):
+    print_id, filament_ids = print_history.record_print_start(
+        {"file_name": "cube.3mf", "print_type": "cloud", "image_file": "cube.png"},
+        [
+            {"filament_type": "PLA", "color": "#FFFFFF", "grams_used": 0.0, "ams_slot": 0, "estimated_grams": 3.5},
+            {"filament_type": "PETG", "color": "#000000", "grams_used": 1.0, "ams_slot": 2},
+        ],
+    )
+
+    assert len(filament_ids) == 2
+    assert print_history.get_all_filament_usage_for_print(print_id) == {0: 0.0, 2: 1.0}
+
+
+def test_record_print_start_stores_nothing_when_a_filament_fails(history_db):
+    with pytest.raises(sqlite3.IntegrityError):
+        print_history.record_print_start(
+            {"file_name": "cube.3mf", "print_type": "cloud"},
+            [
+                {"filament_type": "PLA", "color": "#FFFFFF", "grams_used": 0.0, "ams_slot": 0},
+                {"filament_type": "PLA", "color": None, "grams_used": 0.0, "ams_slot": 1},
+            ],
+        )
+
+    conn = print_history.get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM prints").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM filament_usage").fetchone()[0] == 0
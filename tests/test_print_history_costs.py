@@ -0,0 +1,67 @@
+import pytest
+
+import print_history
+from conftest import record_print
+
+pytestmark = pytest.mark.history_db(archive=True, unpatched=("update_filament_spool", "get_prints_with_filament"))
+
+
+def _record(grams=10.0, print_date="2024-05-01 10:00:00"):
+    return record_print(print_date, ("PLA", grams))
+
+
+def _cost_row(print_id):
+    return print_history.get_connection().execute(
+        "SELECT spool_id, cost_per_gram, cost FROM filament_usage WHERE print_id = ?", (print_id,)
+    ).fetchone()
+
+
+def test_cost_follows_spool_assignment_and_billed_grams(history_db):
+    print_id = _record()
+
+    print_history.update_filament_spool(print_id, 0, 4, 0.02)
+    assert _cost_row(print_id) == (4, 0.02, pytest.approx(0.2))
+
+    print_history.update_filament_grams_used(print_id, 0, 25.0)
+    assert _cost_row(print_id) == (4, 0.02, pytest.approx(0.5))
+
+    print_history.flush_layer_tracking(print_id, {0: {"spool_id": 5, "grams_used": 30.0, "cost_per_gram": 0.05}}, {})
+    assert _cost_row(print_id) == (5, 0.05, pytest.approx(1.5))
+
+    filament_info = print_history.get_prints_with_filament(limit=1)[0][0]["filament_info"]
+    assert '"cost":1.5' in filament_info.replace(" ", "")
+
+
+def test_backfill_prices_entries_recorded_without_cost(history_db):
+    priced = _record(10.0)
+    legacy = _record(20.0)
+    unknown = _record(5.0)
+    unassigned = _record(1.0)
+    print_history.update_filament_spool(priced, 0, 1, 0.03)
+    print_history.update_filament_spool(legacy, 0, 1)
+    print_history.update_filament_spool(unknown, 0, 99)
+
+    assert print_history.has_filament_costs_missing()
+    assert print_history.backfill_filament_costs({1: 0.02}) == 1
+
+    assert _cost_row(priced) == (1, 0.03, pytest.approx(0.3))
+    assert _cost_row(legacy) == (1, 0.02, pytest.approx(0.4))
+    assert _cost_row(unassigned) == (None, None, None)
+    # Without a known price the cost stays unknown, so a later run can still price it
+    assert _cost_row(unknown) == (99, None, None)
+    assert print_history.has_filament_costs_missing()
+
+    assert print_history.backfill_filament_costs({99: 0.01}) == 1
+    assert _cost_row(unknown) == (99, 0.01, pytest.approx(0.05))
+    assert not print_history.has_filament_costs_missing()
+
+
+def test_backfill_prices_archived_entries(history_db):
+    archived = _record(10.0, print_date="2020-01-01 10:00:00")
+    print_history.update_filament_spool(archived, 0, 1)
+    assert print_history.archive_prints(365) == 1
+
+    assert print_history.backfill_filament_costs({1: 0.02}) == 1
+    with print_history.reading_archive():
+        assert _cost_row(archived) == (1, 0.02, pytest.approx(0.2))
+        assert not print_history.has_filament_costs_missing()
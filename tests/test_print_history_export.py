@@ -0,0 +1,86 @@
+import io
+import json
+
+import pytest
+
+import app as app_module
+import history_export
+import print_history
+from conftest import record_print
+
+
+@pytest.fixture
+def target_db(history_db, monkeypatch):
+    """Switches the history to an empty database next to the one ``history_db`` created."""
+    def use():
+        print_history.close_connections()
+        monkeypatch.setitem(print_history.db_config, "db_path", str(history_db / "target.db"))
+        print_history.create_database()
+
+    return use
+
+
+def _populate(count):
+    for n in range(count):
+        print_id = record_print(f"2024-05-{n % 28 + 1:02d} 10:00:00", ("PLA", 1.5), file_name=f"model_{n}.3mf")
+        print_history.update_layer_tracking(print_id, total_layers=10, layers_printed=10, status="COMPLETED")
+
+
+def _dump():
+    return {table: list(print_history.iter_table_rows(table)) for table in print_history.HISTORY_TABLES}
+
+
+def test_iter_table_rows_walks_the_table_in_batches(history_db):
+    _populate(7)
+
+    rows = list(print_history.iter_table_rows("prints", batch_size=3))
+
+    assert [row["id"] for row in rows] == list(range(1, 8))
+    assert rows[0]["file_name"] == "model_0.3mf"
+    assert [row["id"] for row in print_history.iter_table_rows("prints", after_id=5)] == [6, 7]
+    with pytest.raises(ValueError):
+        list(print_history.iter_table_rows("sqlite_master"))
+
+
+def test_jsonl_round_trip_and_resume(target_db):
+    _populate(5)
+    exported = _dump()
+    lines = list(history_export.export_jsonl())
+
+    target_db()
+    # An import interrupted after the first two prints is simply run again
+    history_export.import_jsonl(lines[:2])
+    results = history_export.import_jsonl(lines)
+
+    assert results["prints"] == {"imported": 3, "skipped": 2}
+    assert results["filament_usage"] == {"imported": 5, "skipped": 0}
+    assert _dump() == exported
+    assert print_history.count_prints() == 5
+    assert print_history.get_material_usage()[0]["grams_used"] == pytest.approx(7.5)
+
+
+def test_csv_round_trip(target_db):
+    _populate(3)
+    exported = _dump()
+    files = {table: "".join(history_export.export_csv(table)) for table in print_history.HISTORY_TABLES}
+
+    target_db()
+    for table, text in files.items():
+        assert history_export.import_csv(table, io.StringIO(text))["imported"] == 3
+
+    assert _dump() == exported
+
+
+def test_export_route_streams_the_history(history_db):
+    _populate(2)
+    client = app_module.app.test_client()
+
+    response = client.get("/print_history/export?format=jsonl")
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert response.headers["Content-Disposition"] == 'attachment; filename="print_history.jsonl"'
+    assert [record["table"] for record in records] == ["prints"] * 2 + ["filament_usage"] * 2 + ["print_layer_tracking"] * 2
+
+    response = client.get("/print_history/export?format=csv&table=filament_usage")
+    assert response.mimetype == "text/csv"
+    assert response.get_data(as_text=True).splitlines()[0].startswith("id,print_id,")
+    assert client.get("/print_history/export?format=csv&table=sqlite_master").status_code == 400
@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+import print_history
+from scripts.benchmark_print_history import populate, run_benchmark
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "history.db"
+    monkeypatch.setitem(print_history.db_config, "db_path", str(path))
+    yield path
+    print_history.close_connections()
+
+
+def _index_names(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_unversioned_database_is_upgraded(db_path):
+    legacy = sqlite3.connect(db_path)
+    legacy.executescript('''
+        CREATE TABLE prints (id INTEGER PRIMARY KEY AUTOINCREMENT, print_date TEXT NOT NULL,
+                             file_name TEXT NOT NULL, print_type TEXT NOT NULL, image_file TEXT);
+        CREATE TABLE filament_usage (id INTEGER PRIMARY KEY AUTOINCREMENT, print_id INTEGER NOT NULL,
+                                     spool_id INTEGER, filament_type TEXT NOT NULL, color TEXT NOT NULL,
+                                     grams_used REAL NOT NULL, ams_slot INTEGER NOT NULL);
+        INSERT INTO prints (print_date, file_name, print_type) VALUES ('2024-01-01 10:00:00', 'old.3mf', 'local');
+        INSERT INTO filament_usage (print_id, filament_type, color, grams_used, ams_slot) VALUES (1, 'PLA', '#FFF', 4.0, 2);
+    ''')
+    legacy.close()
+
+    print_history.create_database()
+
+    conn = print_history.get_connection()
+    assert print_history.get_schema_version() == print_history.SCHEMA_VERSION
+    assert "estimated_grams" in {row[1] for row in conn.execute("PRAGMA table_info(filament_usage)")}
+    assert {"idx_filament_usage_print_slot", "idx_filament_usage_spool", "idx_prints_date"} <= _index_names(conn)
+    assert print_history.get_all_filament_usage_for_print(1) == {2: 4.0}
+    # Converted at startup, so the archiver only runs incremental steps
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == print_history.AUTO_VACUUM_INCREMENTAL
+
+    # Running again is a no-op
+    print_history.create_database()
+    assert print_history.get_schema_version() == print_history.SCHEMA_VERSION
+
+
+def test_slot_lookups_use_the_index(db_path):
+    print_history.create_database()
+    populate(50)
+
+    plan = print_history.get_connection().execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM filament_usage WHERE print_id = ? AND ams_slot = ?", (1, 0)
+    ).fetchall()
+    assert any("idx_filament_usage_print_slot" in row[-1] for row in plan)
+
+
+def test_benchmark_runs_on_a_small_database(db_path):
+    results = run_benchmark(100, repeat=1)
+
+    assert set(results) >= {"history_first_page", "filament_for_slot", "prints_by_spool"}
+    assert print_history.db_config["db_path"] == str(db_path)
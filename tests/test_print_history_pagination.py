@@ -0,0 +1,54 @@
+import pytest
+
+import print_history
+
+# Query the real database even when the seeded test-data patches are active
+pytestmark = pytest.mark.history_db(unpatched=("get_prints_page", "get_prints_with_filament"))
+
+
+def _ids(page):
+    return [print_row["id"] for print_row in page["prints"]]
+
+
+def test_pages_walk_forward_and_back(history_db):
+    # Two prints share a timestamp so the id has to break the tie
+    dates = ["2024-01-01 10:00:00", "2024-01-02 10:00:00", "2024-01-02 10:00:00", "2024-01-03 10:00:00", "2024-01-04 10:00:00"]
+    ids = [print_history.insert_print(f"model_{index}.3mf", "local", print_date=date) for index, date in enumerate(dates)]
+    newest_first = ids[::-1]
+
+    first = print_history.get_prints_page(2)
+    assert _ids(first) == newest_first[:2]
+    assert first["total_count"] == 5
+    assert first["prev_cursor"] is None
+
+    second = print_history.get_prints_page(2, before=first["next_cursor"])
+    assert _ids(second) == newest_first[2:4]
+
+    last = print_history.get_prints_page(2, before=second["next_cursor"])
+    assert _ids(last) == newest_first[4:]
+    assert last["next_cursor"] is None
+
+    back = print_history.get_prints_page(2, after=last["prev_cursor"])
+    assert _ids(back) == newest_first[2:4]
+    assert back["next_cursor"] == second["next_cursor"]
+
+    back = print_history.get_prints_page(2, after=back["prev_cursor"])
+    assert _ids(back) == newest_first[:2]
+    assert back["prev_cursor"] is None
+
+
+def test_malformed_cursor_returns_first_page(history_db):
+    print_id = print_history.insert_print("cube.3mf", "local")
+
+    assert _ids(print_history.get_prints_page(10, before="not-a-cursor")) == [print_id]
+
+
+def test_print_count_follows_inserts_and_deletes(history_db):
+    for index in range(3):
+        print_history.insert_print(f"model_{index}.3mf", "local")
+    assert print_history.count_prints() == 3
+
+    with print_history.transaction() as cursor:
+        cursor.execute("DELETE FROM prints WHERE id = 1")
+    assert print_history.count_prints() == 2
+    assert print_history.get_prints_with_filament()[1] == 2
@@ -0,0 +1,61 @@
+import pytest
+
+import print_history
+from conftest import record_print
+
+pytestmark = pytest.mark.history_db(unpatched=("update_filament_spool",))
+
+
+def _snapshot():
+    conn = print_history.get_connection()
+    return {
+        table: sorted(conn.execute(f"SELECT * FROM {table}").fetchall())
+        for table in ("spool_usage_rollup", "material_usage_rollup", "daily_usage_rollup")
+    }
+
+
+def test_rollups_follow_history_writes(history_db):
+    first = record_print("2024-05-01 10:00:00", ("PLA", 10.0), ("PETG", 5.0))
+    second = record_print("2024-05-01 18:00:00", ("PLA", 2.0), ("PLA", 3.0))
+    record_print("2024-05-02 09:00:00", ("PLA", 1.0))
+
+    print_history.update_filament_spool(first, 0, 7)
+    print_history.update_filament_spool(second, 0, 7)
+    print_history.update_filament_spool(second, 1, 7)
+    print_history.update_filament_grams_used(second, 1, 4.0)
+
+    assert print_history.get_spool_usage(7) == {"spool_id": 7, "print_count": 2, "grams_used": 16.0}
+    assert print_history.get_spool_usage(99) == {"spool_id": 99, "print_count": 0, "grams_used": 0.0}
+    assert print_history.get_material_usage() == [
+        {"filament_type": "PLA", "usage_count": 4, "grams_used": 17.0},
+        {"filament_type": "PETG", "usage_count": 1, "grams_used": 5.0},
+    ]
+    assert print_history.get_daily_usage() == [
+        {"day": "2024-05-01", "print_count": 2, "grams_used": 21.0},
+        {"day": "2024-05-02", "print_count": 1, "grams_used": 1.0},
+    ]
+    assert print_history.get_daily_usage(start_day="2024-05-02") == [
+        {"day": "2024-05-02", "print_count": 1, "grams_used": 1.0},
+    ]
+
+    # Moving one of two slots off the spool keeps the print counted
+    print_history.update_filament_spool(second, 0, 8)
+    assert print_history.get_spool_usage(7)["print_count"] == 2
+    assert print_history.get_spool_usage(8)["print_count"] == 1
+
+    maintained = _snapshot()
+    print_history.rebuild_usage_rollups()
+    assert _snapshot() == maintained
+
+
+def test_rollups_drop_deleted_history(history_db):
+    print_id = record_print("2024-05-01 10:00:00", ("PLA", 10.0))
+    print_history.update_filament_spool(print_id, 0, 3)
+
+    with print_history.transaction() as cursor:
+        cursor.execute("DELETE FROM filament_usage WHERE print_id = ?", (print_id,))
+        cursor.execute("DELETE FROM prints WHERE id = ?", (print_id,))
+
+    assert print_history.get_spool_usage(3)["print_count"] == 0
+    assert print_history.get_material_usage() == []
+    assert print_history.get_daily_usage() == [{"day": "2024-05-01", "print_count": 0, "grams_used": 0.0}]
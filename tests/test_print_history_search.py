@@ -0,0 +1,53 @@
+import pytest
+
+import print_history
+from conftest import record_print
+
+pytestmark = pytest.mark.history_db(unpatched=("get_prints_page", "get_print_facets", "update_filament_spool"))
+
+
+@pytest.fixture
+def history(history_db):
+    return {
+        "benchy": record_print(
+            "2024-04-10 10:00:00", ("PETG", 1.0, 42, "#FF0000"), file_name="Benchy_PETG.3mf", status="COMPLETED"
+        ),
+        "benchy_pla": record_print(
+            "2024-04-20 10:00:00", ("PLA", 1.0, 42, "#FFFFFF"), file_name="benchy-pla.3mf", status="FAILED"
+        ),
+        "bracket": record_print(
+            "2024-05-02 08:00:00", ("PETG", 1.0, 7, "#000000"), ("PLA", 1.0, None, "#FFFFFF"), file_name="wall bracket.3mf"
+        ),
+        "old": record_print("2024-03-01 10:00:00", ("PETG", 1.0, 42, "#FF0000"), file_name="Benchy_PETG.3mf"),
+    }
+
+
+def _ids(filters, **kwargs):
+    return [row["id"] for row in print_history.get_prints_page(10, filters=filters, **kwargs)["prints"]]
+
+
+def test_search_combines_text_and_filters(history):
+    assert _ids({"query": "bench"}) == [history["benchy_pla"], history["benchy"], history["old"]]
+    assert _ids({"query": "bracket WALL"}) == [history["bracket"]]
+    assert _ids({"material": "PETG", "spool_id": 42, "date_from": "2024-04-01", "date_to": "2024-04-30"}) == [history["benchy"]]
+    assert _ids({"material": "PLA", "color": "#ffffff"}) == [history["bracket"], history["benchy_pla"]]
+    assert _ids({"status": "failed"}) == [history["benchy_pla"]]
+    assert _ids({"date_to": "2024-05-02"})[0] == history["bracket"]
+
+    page = print_history.get_prints_page(1, filters={"query": "benchy"})
+    assert page["total_count"] == 3
+    assert _ids({"query": "benchy"}, before=page["next_cursor"]) == [history["benchy"], history["old"]]
+
+
+def test_facets_ignore_their_own_filter(history):
+    facets = print_history.get_print_facets({"material": "PLA", "spool_id": 42})
+
+    assert facets["materials"] == [{"value": "PETG", "count": 2}, {"value": "PLA", "count": 1}]
+    assert facets["statuses"] == [{"value": "FAILED", "count": 1}]
+
+
+def test_search_falls_back_to_like_without_fts(history, monkeypatch):
+    monkeypatch.setattr(print_history, "_has_fts", lambda: False)
+
+    assert _ids({"query": "bench"}) == [history["benchy_pla"], history["benchy"], history["old"]]
+    assert _ids({"query": "100%"}) == []
@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+
+import pytest
+
+import print_history
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    monkeypatch.setitem(print_history.db_config, "db_path", str(tmp_path / "history.db"))
+    print_history.create_database()
+    writer = print_history.HistoryWriter()
+    yield writer
+    writer.stop()
+    print_history.close_connections()
+
+
+def _insert(file_name):
+    print_history.get_connection().execute(
+        "INSERT INTO prints (print_date, file_name, print_type) VALUES ('2024-01-01 10:00:00', ?, 'local')",
+        (file_name,),
+    )
+    return file_name
+
+
+def _hold(writer):
+    """Occupy the writer until the returned event is set."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def wait():
+        started.set()
+        return release.wait(5)
+
+    future = writer.submit(wait)
+    assert started.wait(5)
+    return release, future
+
+
+def _file_names():
+    rows = print_history.get_connection().execute("SELECT file_name FROM prints ORDER BY id").fetchall()
+    return [row[0] for row in rows]
+
+
+def test_queued_writes_commit_in_one_batch(writer):
+    release, blocker = _hold(writer)
+    futures = [writer.submit(_insert, f"model_{index}.3mf") for index in range(20)]
+    release.set()
+
+    assert [future.result(timeout=5) for future in futures] == [f"model_{index}.3mf" for index in range(20)]
+    assert blocker.result(timeout=5) is True
+    assert writer.commands == 21
+    assert writer.batches == 2
+    assert _file_names() == [f"model_{index}.3mf" for index in range(20)]
+
+
+def test_failing_command_is_rolled_back_alone(writer):
+    def fail():
+        _insert("partial.3mf")
+        raise sqlite3.IntegrityError("broken row")
+
+    release, _ = _hold(writer)
+    first = writer.submit(_insert, "first.3mf")
+    failing = writer.submit(fail)
+    last = writer.submit(_insert, "last.3mf")
+    release.set()
+
+    assert first.result(timeout=5) == "first.3mf"
+    with pytest.raises(sqlite3.IntegrityError):
+        failing.result(timeout=5)
+    assert last.result(timeout=5) == "last.3mf"
+    assert _file_names() == ["first.3mf", "last.3mf"]
+
+
+def test_public_writes_go_through_the_writer_thread(tmp_path, monkeypatch):
+    monkeypatch.setitem(print_history.db_config, "db_path", str(tmp_path / "history.db"))
+    print_history.create_database()
+    results = []
+
+    def worker(index):
+        results.append(print_history.insert_print(f"model_{index}.3mf", "local"))
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    assert sorted(results) == list(range(1, 9))
+    assert print_history.get_writer()._thread.name == "print-history-writer"
+
+
+def test_writes_inside_a_transaction_run_inline(writer):
+    with print_history.transaction():
+        assert writer.call(_insert, "inline.3mf") == "inline.3mf"
+        assert writer.commands == 0
+
+    assert _file_names() == ["inline.3mf"]
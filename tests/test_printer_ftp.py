@@ -0,0 +1,83 @@
+import io
+
+import pycurl
+import pytest
+
+import printer_ftp
+from printer_ftp import FtpTransferError, PrinterFtpSession
+
+LISTING = (
+    b"-rw-rw-rw- 1 root root 10 Oct 19 10:00 cube.gcode.3mf\r\n"
+    b"-rw-rw-rw- 1 root root 99 Oct 18 09:00 other.3mf\r\n"
+)
+
+
+class FakeCurl:
+    """Serves a fixed listing and file, dropping the connection after ``drop_after`` bytes once."""
+
+    instances = []
+
+    def __init__(self, payload, drop_after=None):
+        self.payload = payload
+        self.drop_after = drop_after
+        self.options = {}
+        self.resume_offsets = []
+        self.closed = False
+        FakeCurl.instances.append(self)
+
+    def setopt(self, option, value):
+        self.options[option] = value
+
+    def perform(self):
+        write = self.options[pycurl.WRITEFUNCTION]
+        if self.options[pycurl.URL].endswith("/"):
+            write(LISTING)
+            return
+        offset = self.options.get(pycurl.RESUME_FROM_LARGE, 0)
+        self.resume_offsets.append(offset)
+        data = self.payload[offset:]
+        if self.drop_after is not None:
+            write(data[:self.drop_after])
+            self.drop_after = None
+            raise pycurl.error(pycurl.E_OPERATION_TIMEDOUT, "Operation too slow")
+        write(data)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def _no_retry_delay(monkeypatch):
+    monkeypatch.setattr(printer_ftp, "RETRY_DELAY_SECONDS", 0)
+    FakeCurl.instances = []
+
+
+def test_interrupted_download_resumes_from_written_bytes():
+    payload = b"0123456789"
+    handles = iter([FakeCurl(payload, drop_after=4), FakeCurl(payload)])
+    session = PrinterFtpSession("printer", "code", curl_factory=lambda: next(handles))
+    dest = io.BytesIO()
+
+    stats = session.download("/cache/cube.gcode.3mf", dest)
+
+    assert dest.getvalue() == payload
+    assert stats["attempts"] == 2
+    assert FakeCurl.instances[0].closed
+    assert FakeCurl.instances[1].resume_offsets == [4]
+
+
+def test_listing_and_downloads_reuse_one_handle():
+    session = PrinterFtpSession("printer", "code", curl_factory=lambda: FakeCurl(b"0123456789"))
+
+    assert [entry["name"] for entry in session.list("/cache")] == ["cube.gcode.3mf", "other.3mf"]
+    session.download("/cache/cube.gcode.3mf", io.BytesIO())
+    session.download("/cache/cube.gcode.3mf", io.BytesIO())
+
+    assert len(FakeCurl.instances) == 1
+
+
+def test_size_mismatch_raises():
+    session = PrinterFtpSession("printer", "code", curl_factory=lambda: FakeCurl(b"short"))
+
+    with pytest.raises(FtpTransferError):
+        session.download("/cache/cube.gcode.3mf", io.BytesIO())
@@ -0,0 +1,92 @@
+import http.server
+import io
+import os
+import re
+import threading
+import zipfile
+
+import pytest
+
+import remote_zip
+
+
+class _ArchiveHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        body = server.payload
+        server.requests.append(self.headers.get("Range"))
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range") or "")
+        if not server.ranges or match is None:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last or len(body) - 1), len(body) - 1)
+        else:
+            start, end = max(len(body) - int(last), 0), len(body) - 1
+        server.served += end - start + 1
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(body[start:end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def archive_server(unused_tcp_port_factory):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", unused_tcp_port_factory()), _ArchiveHandler)
+    server.requests = []
+    server.served = 0
+    server.ranges = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _sample_3mf():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr("3D/3dmodel.model", os.urandom(2 * 1024 * 1024), compress_type=zipfile.ZIP_STORED)
+        z.writestr("Metadata/slice_info.config", "<config><plate/></config>")
+        z.writestr("Metadata/plate_1.png", b"\x89PNG" + os.urandom(4096), compress_type=zipfile.ZIP_STORED)
+        z.writestr("Metadata/plate_1.gcode", "M620 S0A\nG1 X1 E0.5\n" * 20000)
+    return buffer.getvalue()
+
+
+def test_fetches_only_selected_members_with_ranges(archive_server, tmp_path):
+    archive_server.payload = _sample_3mf()
+    url = f"http://127.0.0.1:{archive_server.server_port}/model.3mf"
+    dest_path = tmp_path / "slim.3mf"
+
+    with open(dest_path, "wb") as dest:
+        assert remote_zip.fetch_zip_members(url, dest, lambda name: name.startswith("Metadata/"))
+
+    with zipfile.ZipFile(dest_path) as slim, zipfile.ZipFile(io.BytesIO(archive_server.payload)) as full:
+        assert slim.testzip() is None
+        assert slim.namelist() == ["Metadata/slice_info.config", "Metadata/plate_1.png", "Metadata/plate_1.gcode"]
+        for name in slim.namelist():
+            assert slim.read(name) == full.read(name)
+    assert archive_server.requests[0].startswith("bytes=-")
+    assert archive_server.served < len(archive_server.payload) / 2
+
+
+def test_falls_back_to_full_download_without_range_support(archive_server, tmp_path):
+    archive_server.payload = _sample_3mf()
+    archive_server.ranges = False
+    url = f"http://127.0.0.1:{archive_server.server_port}/model.3mf"
+    dest_path = tmp_path / "full.3mf"
+
+    with open(dest_path, "wb") as dest:
+        assert not remote_zip.fetch_zip_members(url, dest, lambda name: name.startswith("Metadata/"))
+
+    assert dest_path.read_bytes() == archive_server.payload
+    assert len(archive_server.requests) == 1
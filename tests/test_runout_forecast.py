@@ -0,0 +1,48 @@
+import filament_usage_tracker
+from filament_usage_tracker import FilamentUsageTracker
+
+
+def _tracker_with_model(monkeypatch, remaining_weight):
+    monkeypatch.setattr(filament_usage_tracker, "TRACK_LAYER_USAGE", False)
+    tracker = FilamentUsageTracker()
+    # Filament 0 prints every layer, filament 1 only the even ones; both come from spool 7.
+    tracker.active_model = {
+        layer: ({0: 100.0, 1: 50.0} if layer % 2 == 0 else {0: 100.0}) for layer in range(10)
+    }
+    tracker._layer_tracking_total_layers = 10
+    tracker._filament_spool_id_map = {0: 7, 1: 7}
+    tracker._spool_data_cache = {
+        7: {"id": 7, "remaining_weight": remaining_weight, "filament": {"diameter": 1.75, "density": 1.24}},
+    }
+    return tracker
+
+
+def test_forecast_reports_runout_layer_and_shortfall(monkeypatch):
+    tracker = _tracker_with_model(monkeypatch, remaining_weight=2.0)
+    grams_per_mm = tracker._mm_to_grams(1.0, 1.75, 1.24)
+
+    tracker._update_runout_forecast()
+    [entry] = tracker.get_runout_forecast()
+
+    total_grams = (10 * 100.0 + 5 * 50.0) * grams_per_mm
+    assert entry["spool_id"] == 7
+    assert entry["filaments"] == [1, 2]
+    assert entry["remaining_grams"] == 2.0
+    assert entry["remaining_at_end_grams"] == round(2.0 - total_grams, 2)
+    # Layers 0-4 use 650mm (1.94g); layer 5 pushes past the 2g left on the spool.
+    assert entry["runout_layer"] == 5
+
+
+def test_forecast_advances_with_spent_layers(monkeypatch):
+    tracker = _tracker_with_model(monkeypatch, remaining_weight=100.0)
+    grams_per_mm = tracker._mm_to_grams(1.0, 1.75, 1.24)
+    tracker._update_runout_forecast()
+
+    for layer in range(4):
+        tracker._spend_filament_for_layer(layer)
+
+    [entry] = tracker.get_runout_forecast()
+    assert entry["runout_layer"] is None
+    assert entry["current_layer"] == 3
+    assert entry["remaining_grams"] == round(100.0 - 500.0 * grams_per_mm, 2)
+    assert entry["remaining_at_end_grams"] == round(100.0 - 1250.0 * grams_per_mm, 2)
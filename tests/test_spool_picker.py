@@ -0,0 +1,95 @@
+import re
+from urllib.parse import parse_qs, urlsplit
+
+import app as app_module
+import mqtt_bambulab
+import spoolman_service
+from spool_index import SpoolIndex
+
+
+def _spool(spool_id, material, vendor, color, name="Basic", **extra):
+    return {
+        "id": spool_id,
+        "remaining_weight": 500,
+        "filament": {"name": name, "material": material, "vendor": {"name": vendor}, "color_hex": color},
+        "extra": {},
+        **extra,
+    }
+
+
+SPOOLS = [
+    _spool(1, "PLA", "Bambu Lab", "FFFFFF"),
+    _spool(2, "PETG", "Polymaker", "F0F0F0", location="Shelf B"),
+    _spool(3, "PLA", "Polymaker", "000000", name="Matte Charcoal"),
+    _spool(4, "PLA", "Bambu Lab", "FF0000"),
+]
+
+
+def test_index_filters_by_material_vendor_text_and_color():
+    index = SpoolIndex(SPOOLS)
+
+    assert index.materials == ["PETG", "PLA"]
+    assert index.vendors == ["Bambu Lab", "Polymaker"]
+    assert [spool["id"] for spool in index.search(materials=["PLA"])] == [1, 3, 4]
+    assert [spool["id"] for spool in index.search(materials=["PLA", "PETG"], vendor="Polymaker")] == [2, 3]
+    assert [spool["id"] for spool in index.search(text="matte polymaker")] == [3]
+    assert [spool["id"] for spool in index.search(text="shelf b")] == [2]
+    assert [spool["id"] for spool in index.search(text="#4")] == [4]
+
+    # Within the tolerance only, the closest color first
+    assert [spool["id"] for spool in index.search(color="#F2F2F2")] == [2, 1]
+    assert [spool["id"] for spool in index.search(materials=["PLA"], color="#F2F2F2")] == [1]
+    assert index.search(color="not a color") == index.spools
+
+
+def _test_data_spools():
+    return mqtt_bambulab.fetchSpools()
+
+
+def _ids(page):
+    return [int(spool_id) for spool_id in re.findall(r"#(\d+)\s*</span>", page)]
+
+
+def _more(page):
+    match = re.search(r'href="([^"]*)" class="btn btn-outline-primary" id="spool-list-more"', page)
+    return match.group(1).replace("&amp;", "&") if match else None
+
+
+def test_pickers_render_one_page_and_link_the_next(monkeypatch):
+    monkeypatch.setattr(app_module, "SPOOL_PICKER_PAGE_SIZE", 10)
+    spoolman_service.spools_changed()
+    client = app_module.app.test_client()
+
+    first = client.get("/assign_tag").get_data(as_text=True)
+    assert len(_ids(first)) == 10
+    more = _more(first)
+    assert parse_qs(urlsplit(more).query)["offset"] == ["10"]
+
+    second = client.get(more).get_data(as_text=True)
+    assert len(_ids(second)) == 10
+    assert not set(_ids(first)) & set(_ids(second))
+
+    vendor = re.search(r'<option value="([^"]+)"', first).group(1)
+    filtered = client.get("/assign_tag", query_string={"vendor": vendor}).get_data(as_text=True)
+    vendor_spools = [spool for spool in _test_data_spools() if spool["filament"]["vendor"]["name"] == vendor]
+    assert re.search(r"(\d+) of \d+ spools", filtered).group(1) == str(len(vendor_spools))
+
+
+def test_page_arguments_are_kept_and_the_default_material_can_be_cleared(monkeypatch):
+    monkeypatch.setattr(app_module, "SPOOL_PICKER_PAGE_SIZE", 2)
+    spoolman_service.spools_changed()
+
+    with app_module.app.test_request_context("/fill?ams=0&tray=1&q=pla"):
+        picker = app_module.spool_picker(SPOOLS, ["PLA"])
+        assert picker["selected_materials"] == ["PLA"]
+        assert [spool["id"] for spool in picker["spools"]] == [1, 3]
+        assert picker["page_args"] == [("ams", "0"), ("tray", "1")]
+        assert parse_qs(urlsplit(picker["more_url"]).query) == {
+            "ams": ["0"], "tray": ["1"], "q": ["pla"], "material": ["PLA"], "offset": ["2"],
+        }
+
+    spoolman_service.spools_changed()
+    with app_module.app.test_request_context("/fill?ams=0&tray=1&material="):
+        picker = app_module.spool_picker(SPOOLS, ["PLA"])
+        assert picker["selected_materials"] == []
+        assert picker["total"] == len(SPOOLS)
@@ -0,0 +1,67 @@
+import io
+import os
+import time
+
+import pytest
+
+import app as app_module
+import thumbnails
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _png(width, height, color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_identical_plates_share_one_file_and_get_variants(tmp_path):
+    plate = _png(512, 512, "red")
+
+    first = thumbnails.store_thumbnail(plate, tmp_path)
+    second = thumbnails.store_thumbnail(plate, tmp_path)
+
+    assert first == second
+    variants = thumbnails.thumbnail_variants(first, tmp_path)
+    assert set(variants) == {"original", "webp", "png"}
+    with Image.open(tmp_path / variants["webp"]) as small:
+        assert small.width == thumbnails.THUMBNAIL_WIDTH
+    assert len(list(tmp_path.iterdir())) == 3
+
+
+def test_prune_keeps_referenced_and_legacy_images(tmp_path):
+    kept = thumbnails.store_thumbnail(_png(64, 64, "red"), tmp_path)
+    dropped = thumbnails.store_thumbnail(_png(64, 64, "blue"), tmp_path)
+    (tmp_path / "20250320185236.png").write_bytes(b"legacy")
+
+    removed = thumbnails.prune_thumbnails({kept, None}, tmp_path, min_age=0)
+
+    remaining = {path.name for path in tmp_path.iterdir()}
+    assert removed == 3
+    assert kept in remaining and "20250320185236.png" in remaining
+    assert not any(name.startswith(dropped[:20]) for name in remaining)
+
+
+def test_prune_spares_recently_stored_images(tmp_path):
+    pending = thumbnails.store_thumbnail(_png(64, 64, "red"), tmp_path)
+    assert thumbnails.prune_thumbnails(set(), tmp_path) == 0
+
+    # Storing the same plate again restarts the grace period of files about to expire
+    expired = time.time() - thumbnails.ORPHAN_GRACE_SECONDS - 60
+    for path in tmp_path.iterdir():
+        os.utime(path, (expired, expired))
+    thumbnails.store_thumbnail(_png(64, 64, "red"), tmp_path)
+    assert thumbnails.prune_thumbnails(set(), tmp_path) == 0
+    assert (tmp_path / pending).exists()
+
+
+def test_thumbnail_route_serves_immutable_hashed_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, "THUMBNAIL_DIR", tmp_path)
+    name = thumbnails.store_thumbnail(_png(32, 32, "green"), tmp_path)
+    client = app_module.app.test_client()
+
+    response = client.get(f"/thumbnails/{name}")
+    assert response.status_code == 200
+    assert "immutable" in response.headers["Cache-Control"]
+    assert client.get("/thumbnails/20250320185236.png").status_code == 404
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import mqtt_bambulab
+import spoolman_service
+from config import EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID
+from tray_views import TrayViews
+
+
+SPOOLS = [
+    {
+        "id": 3,
+        "remaining_weight": 640,
+        "filament": {"name": "PLA Basic", "vendor": {"name": "Bambu"}, "material": "PLA", "color_hex": "FFFFFF"},
+        "extra": {"active_tray": json.dumps(spoolman_service.trayUid(0, 1))},
+    },
+]
+
+
+@pytest.fixture
+def printer(monkeypatch):
+    config = {
+        "vt_tray": {"id": str(EXTERNAL_SPOOL_ID), "tray_type": ""},
+        "ams": [{"id": "0", "humidity": "3", "temp": "24.1", "tray": [
+            {"id": "0", "tray_type": ""},
+            {"id": "1", "tray_type": "PLA", "tray_color": "FFFFFFFF", "tray_sub_brands": "PLA Basic", "tray_uuid": "0" * 32},
+        ]}],
+    }
+    monkeypatch.setattr(mqtt_bambulab, "getLastAMSConfig", lambda: config)
+    monkeypatch.setattr(mqtt_bambulab, "fetchSpools", lambda cached=False, max_age=None: SPOOLS)
+    monkeypatch.setattr(mqtt_bambulab, "TRAY_VERSION", 0)
+    return config
+
+
+def test_snapshot_is_built_once_per_tray_and_inventory_version(printer):
+    views = TrayViews()
+
+    snapshot = views.current()
+    assert views.current() is snapshot
+    assert snapshot.tray(0, 1)["spool_id"] == 3
+    assert snapshot.tray(EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID)["spool_id"] is None
+    assert snapshot.tray(0, 7) is None
+
+    printer["ams"] = [dict(printer["ams"][0], humidity="5")]
+    assert views.current() is snapshot
+    mqtt_bambulab.TRAY_VERSION += 1
+    rebuilt = views.current()
+    assert rebuilt is not snapshot
+    assert rebuilt.ams[0]["humidity"] == "5"
+
+    spoolman_service.spools_changed()
+    assert views.current() is not rebuilt
+
+
+def test_snapshot_is_read_only_and_leaves_the_mqtt_state_alone(printer):
+    snapshot = TrayViews().current()
+
+    with pytest.raises(TypeError):
+        snapshot.tray(0, 1)["spool_id"] = 4
+    assert isinstance(snapshot.ams[0]["tray"], tuple)
+    assert "spool_id" not in printer["ams"][0]["tray"][1]
@@ -0,0 +1,124 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+try:
+  from PIL import Image
+except ImportError:  # Without Pillow only the original plate image is stored
+  Image = None
+
+THUMBNAIL_DIR = Path(__file__).resolve().parent / "static" / "prints"
+THUMBNAIL_WIDTH = 384
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+# Plate images are stored when a print is prepared, before its history row references them
+ORPHAN_GRACE_SECONDS = 6 * 60 * 60
+
+# <content hash>.png for the original plate image, <content hash>-<width>.<ext> for variants.
+HASHED_NAME = re.compile(r"^(?P<digest>[0-9a-f]{20})(?:-(?P<width>\d+))?\.(?P<ext>png|webp)$")
+
+
+def _digest(data: bytes) -> str:
+  return hashlib.sha256(data).hexdigest()[:20]
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+  with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".part", delete=False) as tmp_file:
+    tmp_file.write(data)
+  os.replace(tmp_file.name, path)
+
+
+def _render_variants(data: bytes, digest: str, directory: Path) -> None:
+  if Image is None:
+    return
+  try:
+    with Image.open(io.BytesIO(data)) as image:
+      image.load()
+      if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+      if image.width > THUMBNAIL_WIDTH:
+        height = max(1, round(image.height * THUMBNAIL_WIDTH / image.width))
+        image = image.resize((THUMBNAIL_WIDTH, height), Image.LANCZOS)
+      for ext, options in (("webp", {"quality": 80, "method": 4}), ("png", {"optimize": True})):
+        buffer = io.BytesIO()
+        image.save(buffer, format=ext.upper(), **options)
+        _write_atomic(directory / f"{digest}-{THUMBNAIL_WIDTH}.{ext}", buffer.getvalue())
+  except Exception as exc:
+    print(f"[thumbnails] Could not render variants for {digest}: {exc}")
+
+
+def store_thumbnail(data: bytes, directory: Path | None = None) -> str:
+  """
+  Store a plate image by content hash and return its file name.
+
+  Identical plates (e.g. reprints) map to the same file. Resized WebP and PNG
+  variants are rendered once, when the image is first stored.
+  """
+  directory = Path(directory or THUMBNAIL_DIR)
+  directory.mkdir(parents=True, exist_ok=True)
+  digest = _digest(data)
+  name = f"{digest}.png"
+  path = directory / name
+  if not path.exists():
+    _write_atomic(path, data)
+    _render_variants(data, digest, directory)
+  else:
+    # A reprint reuses the files; restart their grace period in case nothing references them yet
+    for stored in directory.glob(f"{digest}*"):
+      os.utime(stored)
+  return name
+
+
+def thumbnail_variants(image_file: str | None, directory: Path | None = None) -> dict:
+  """
+  Return the stored files for ``image_file``: ``original`` plus the resized
+  ``webp`` and ``png`` variants when they exist. Legacy (non-hashed) images
+  only have an original.
+  """
+  if not image_file:
+    return {}
+  match = HASHED_NAME.match(image_file)
+  if match is None or match.group("width"):
+    return {"original": image_file}
+
+  directory = Path(directory or THUMBNAIL_DIR)
+  variants = {"original": image_file}
+  for ext in ("webp", "png"):
+    name = f"{match.group('digest')}-{THUMBNAIL_WIDTH}.{ext}"
+    if (directory / name).exists():
+      variants[ext] = name
+  return variants
+
+
+def find_orphan_thumbnails(
+  referenced: set[str], directory: Path | None = None, min_age: float = ORPHAN_GRACE_SECONDS
+) -> list[Path]:
+  """
+  Return content-hashed images (and their variants) that no print references
+  and that were stored more than ``min_age`` seconds ago.
+
+  Only files matching the hashed naming scheme are considered, so legacy
+  timestamped images are never returned.
+  """
+  directory = Path(directory or THUMBNAIL_DIR)
+  if not directory.exists():
+    return []
+  keep = {match.group("digest") for match in map(HASHED_NAME.match, filter(None, referenced)) if match}
+  stored_before = time.time() - min_age
+  return [
+    path for path in directory.iterdir()
+    if (match := HASHED_NAME.match(path.name))
+    and match.group("digest") not in keep
+    and path.stat().st_mtime < stored_before
+  ]
+
+
+def prune_thumbnails(referenced: set[str], directory: Path | None = None, min_age: float = ORPHAN_GRACE_SECONDS) -> int:
+  """Delete the images :func:`find_orphan_thumbnails` reports and return how many were removed."""
+  orphans = find_orphan_thumbnails(referenced, directory, min_age)
+  for path in orphans:
+    path.unlink(missing_ok=True)
+  return len(orphans)
@@ -1,109 +1,244 @@
+import io
 import requests
+import threading
 import zipfile
-import tempfile
 import xml.etree.ElementTree as ET
-import pycurl
-import urllib.parse
 import os
 import re
-import time
-from datetime import datetime
-from config import PRINTER_CODE, PRINTER_IP
+from collections import OrderedDict
+from pathlib import Path
+from config import MODEL_CACHE_MAX_MB
+from model_cache import ModelCache
+import printer_ftp
+import remote_zip
+import thumbnails
 from urllib.parse import urlparse
 
-def parse_ftp_listing(line):
-    """Parse a line from an FTP LIST command."""
-    parts = line.split(maxsplit=8)
-    if len(parts) < 9:
-        return None
-    return {
-        'permissions': parts[0],
-        'links': int(parts[1]),
-        'owner': parts[2],
-        'group': parts[3],
-        'size': int(parts[4]),
-        'month': parts[5],
-        'day': int(parts[6]),
-        'time_or_year': parts[7],
-        'name': parts[8]
-    }
+MODEL_CACHE = ModelCache(
+  Path(__file__).resolve().parent / "data" / "model_cache",
+  max_bytes=MODEL_CACHE_MAX_MB * 1024 * 1024,
+)
 
 def get_base_name(filename):
     return filename.rsplit('.', 1)[0]
 
-def parse_date(item):
-    """Parse the date and time from the FTP listing item."""
-    try:
-        date_str = f"{item['month']} {item['day']} {item['time_or_year']}"
-        return datetime.strptime(date_str, "%b %d %H:%M")
-    except ValueError:
-        return None
+_EXTRUSION_OPERATIONS = {"G0", "G1", "G2", "G3"}
+_SCAN_CACHE = OrderedDict()
+_SCAN_CACHE_SIZE = 4
+_SCAN_CACHE_LOCK = threading.Lock()
+
+def _last_param(tokens, key):
+  value = None
+  for token in tokens[1:]:
+    if token[0] == key:
+      value = token[1:]
+  return value
+
+def scan_gcode(lines):
+  """
+  Scan plate G-code once and collect what metadata parsing and layer tracking need.
+
+  Args:
+      lines: iterable of G-code lines (str).
+
+  Returns:
+      dict: ``filament_order`` (filament -> swap index of first use),
+      ``swaps`` (filaments in load order), ``layer_usage`` (layer -> filament ->
+      extruded mm) and ``total_layers`` (highest ``M73 L`` layer).
+  """
+  filament_order = {}
+  swaps = []
+  switch_count = 0
+  layer_usage = {}
+  current_layer = 0
+  current_extrusion = {}
+  active_filament = None
+  total_layers = 0
+
+  for line in lines:
+    line = line.strip()
+    if not line:
+      continue
+    first = line[0]
+
+    if first == "G":
+      # Cheap reject before tokenizing: most G lines are travel moves.
+      if active_filament is None or "E" not in line:
+        continue
+      tokens = line.split(";", 1)[0].split()
+      if not tokens or tokens[0] not in _EXTRUSION_OPERATIONS:
+        continue
+      extrusion = _last_param(tokens, "E")
+      if not extrusion:
+        continue
+      current_extrusion[active_filament] = current_extrusion.get(active_filament, 0) + float(extrusion)
+
+    elif first == "M" and (line.startswith("M73") or line.startswith("M620")):
+      tokens = line.split(";", 1)[0].split()
+      operation = tokens[0]
+
+      if operation == "M73":
+        next_layer = _last_param(tokens, "L")
+        if next_layer is None:
+          continue
+        if current_extrusion:
+          layer_usage[current_layer] = current_extrusion
+          current_extrusion = {}
+        current_layer = int(next_layer)
+        total_layers = max(total_layers, current_layer)
+
+      elif operation == "M620":
+        value = _last_param(tokens, "S")
+        digits = re.match(r"\d+", value or "")
+        if digits is None:
+          continue
+        filament = int(digits.group())
+        if filament != 255 and filament not in filament_order:
+          filament_order[filament] = switch_count
+        switch_count += 1
+        if filament == 255:
+          active_filament = None
+        else:
+          active_filament = filament
+          swaps.append(filament)
+
+  if current_extrusion:
+    layer_usage[current_layer] = current_extrusion
+
+  if len(filament_order) == 0:
+    filament_order = {1: 0}
+
+  return {
+    "filament_order": filament_order,
+    "swaps": swaps,
+    "layer_usage": layer_usage,
+    "total_layers": total_layers,
+  }
 
 def get_filament_order(file):
-    filament_order = {} 
-    switch_count = 0 
+  return scan_gcode(line.decode("utf-8") for line in file)["filament_order"]
 
-    for line in file:
-        match_filament = re.match(r"^M620 S(\d+)[^;\r\n]*", line.decode("utf-8").strip())
-        if match_filament:
-            filament = int(match_filament.group(1))
-            if filament not in filament_order and int(filament) != 255:
-                filament_order[int(filament)] = switch_count
-            switch_count += 1
+def resolve_gcode_path(z, gcode_path):
+  """Return the plate G-code member of an open 3MF, reading model_settings.config when not given."""
+  if gcode_path is None:
+    config_path = "Metadata/model_settings.config"
+    if config_path not in z.namelist():
+      return None
+    root = ET.parse(z.open(config_path)).getroot()
+    plate = root[0]
+    for item in plate:
+      if item.attrib.get("key") == "gcode_file":
+        gcode_path = item.attrib.get("value")
+        break
+    if gcode_path is None:
+      return None
+  if gcode_path not in z.namelist():
+    return None
+  return gcode_path
 
-    if len(filament_order) == 0:
-       filament_order = {1:0}
+def scan_3mf_gcode(path, gcode_path=None):
+  """
+  Run :func:`scan_gcode` over the plate G-code inside a 3MF.
+
+  Results are memoized per file version, so metadata extraction and the layer
+  tracker share a single pass over the same cached model. Returns None when the
+  archive has no G-code.
+  """
+  stat = os.stat(path)
+  with zipfile.ZipFile(path, "r") as z:
+    member = resolve_gcode_path(z, gcode_path)
+    if member is None:
+      return None
+    key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns, member)
+    with _SCAN_CACHE_LOCK:
+      if key in _SCAN_CACHE:
+        _SCAN_CACHE.move_to_end(key)
+        return _SCAN_CACHE[key]
+    with z.open(member) as gcode_file:
+      result = scan_gcode(io.TextIOWrapper(gcode_file, encoding="utf-8", errors="replace"))
 
-    return filament_order
+  with _SCAN_CACHE_LOCK:
+    _SCAN_CACHE[key] = result
+    while len(_SCAN_CACHE) > _SCAN_CACHE_SIZE:
+      _SCAN_CACHE.popitem(last=False)
+  return result
 
 def download3mfFromCloud(url, destFile):
   print("Downloading 3MF file from cloud...")
-  # Download the file and save it to the temporary file
-  response = requests.get(url)
-  response.raise_for_status()
-  destFile.write(response.content)
+  # Stream the file to disk instead of holding the whole archive in memory
+  remote_zip.download(url, destFile)
 
-def download3mfFromFTP(filename, destFile):
+def _is_metadata_member(name):
+  # Everything OpenSpoolMan reads (slice info, plate G-code and thumbnails) lives
+  # under Metadata/; the meshes in 3D/ are usually the bulk of the archive.
+  return name.startswith("Metadata/")
+
+def fetch3mfMetadataFromCloud(url, destFile):
+  """Fetch only the Metadata/ members of a cloud 3MF, falling back to a full download."""
+  print("Fetching 3MF metadata from cloud...")
+  remote_zip.fetch_zip_members(url, destFile, _is_metadata_member)
+
+def download3mfFromFTP(filename, destFile, expected_size=None):
   print("Downloading 3MF file from FTP...")
-  ftp_host = PRINTER_IP
-  ftp_user = "bblp"
-  ftp_pass = PRINTER_CODE
-  remote_path = "/cache/" + filename
-  local_path = destFile.name  # 🔹 Download into the current directory
-  encoded_remote_path = urllib.parse.quote(remote_path)
-  with open(local_path, "wb") as f:
-    c = pycurl.Curl()
-    url = f"ftps://{ftp_host}{encoded_remote_path}"
-
-    # 🔹 Setup explicit FTPS connection (like FileZilla)
-    c.setopt(c.URL, url)
-    c.setopt(c.USERPWD, f"{ftp_user}:{ftp_pass}")
-    c.setopt(c.WRITEDATA, f)
-    
-    # 🔹 Enable SSL/TLS
-    c.setopt(c.SSL_VERIFYPEER, 0)  # Disable SSL verification
-    c.setopt(c.SSL_VERIFYHOST, 0)
-    
-    # 🔹 Enable passive mode (like FileZilla)
-    c.setopt(c.FTP_SSL, c.FTPSSL_ALL)
-    
-    # 🔹 Enable proper TLS authentication
-    c.setopt(c.FTPSSLAUTH, c.FTPAUTH_TLS)
-
-    print("[DEBUG] Starting file download...")
-
-    try:
-        c.perform()
-        print("[DEBUG] File successfully downloaded!")
-    except pycurl.error as e:
-        print(f"[ERROR] cURL error: {e}")
-
-    c.close()
+  printer_ftp.get_session().download("/cache/" + filename, destFile, expected_size=expected_size)
 
 def download3mfFromLocalFilesystem(path, destFile):
   with open(path, "rb") as src_file:
     destFile.write(src_file.read())
 
+def _model_cache_key(url):
+  uri = urlparse(url)
+  if uri.scheme in ("http", "https"):
+    # Signed cloud URLs carry a fresh query string per request; the path identifies the model.
+    return f"{uri.scheme}://{uri.netloc}{uri.path}"
+  return "ftp:" + _ftp_file_name(url)
+
+def _ftp_file_name(url):
+  return url.replace("ftp://", "").replace(".gcode", "")
+
+def ftp_validator(entry):
+  """Identify one version of a printer /cache file by its listed size and date."""
+  return f"{entry['size']}:{entry['month']} {entry['day']} {entry['time_or_year']}"
+
+def _find_ftp_entry(filename):
+  try:
+    for entry in printer_ftp.get_session().list("/cache/"):
+      if entry["name"] == filename:
+        return entry
+  except printer_ftp.FtpTransferError as exc:
+    print(f"Could not list printer cache: {exc}")
+  return None
+
+def fetch_model(url, refresh=False, listing_entry=None):
+  """
+  Return a local path to the 3MF behind ``url``, downloading it at most once.
+
+  Cloud and printer (FTP) models are kept in the shared model cache so metadata
+  extraction, G-code evaluation and checkpointing all read the same file.
+  Printer files are re-downloaded only when their size or date in the /cache
+  listing (or ``listing_entry``, when the caller already has it) changes.
+  ``local:`` URLs are returned as-is.
+  """
+  if url.startswith("local:"):
+    return url.replace("local:", "")
+
+  validator = None
+  if url.startswith("http"):
+    fetch = lambda dest: fetch3mfMetadataFromCloud(url, dest)
+  else:
+    filename = _ftp_file_name(url)
+    entry = listing_entry or _find_ftp_entry(filename)
+    expected_size = None
+    if entry is None:
+      # Without a listing the cached copy cannot be validated.
+      refresh = True
+    else:
+      validator = ftp_validator(entry)
+      expected_size = entry["size"]
+    fetch = lambda dest: download3mfFromFTP(filename, dest, expected_size=expected_size)
+
+  return MODEL_CACHE.get(_model_cache_key(url), fetch, refresh=refresh, validator=validator)
+
 def getMetaDataFrom3mf(url):
   """
   Download a 3MF file from a URL, unzip it, and parse filament usage.
@@ -117,119 +252,109 @@ def getMetaDataFrom3mf(url):
   try:
     metadata = {}
 
-    # Create a temporary file
-    with tempfile.NamedTemporaryFile(delete_on_close=False,delete=True, suffix=".3mf") as temp_file:
-      temp_file_name = temp_file.name
-      
-      if url.startswith("http"):
-        download3mfFromCloud(url, temp_file)
-      elif url.startswith("local:"):
-        download3mfFromLocalFilesystem(url.replace("local:", ""), temp_file)
+    # Printer cache files are validated against their /cache listing, so a model
+    # the prefetcher already downloaded is reused without another transfer.
+    model_path = fetch_model(url)
+    metadata["model_path"] = url
+
+    parsed_url = urlparse(url)
+    metadata["file"] = os.path.basename(parsed_url.path)
+
+    print(f"3MF file available at {model_path}.")
+
+    # Unzip the 3MF file
+    with zipfile.ZipFile(model_path, 'r') as z:
+      # Check for the Metadata/slice_info.config file
+      slice_info_path = "Metadata/slice_info.config"
+      if slice_info_path in z.namelist():
+        with z.open(slice_info_path) as slice_info_file:
+          # Parse the XML content of the file
+          tree = ET.parse(slice_info_file)
+          root = tree.getroot()
+
+          # Extract id and used_g from each filament
+          """
+          <?xml version="1.0" encoding="UTF-8"?>
+          <config>
+            <header>
+              <header_item key="X-BBL-Client-Type" value="slicer"/>
+              <header_item key="X-BBL-Client-Version" value="01.10.01.50"/>
+            </header>
+            <plate>
+              <metadata key="index" value="1"/>
+              <metadata key="printer_model_id" value="N2S"/>
+              <metadata key="nozzle_diameters" value="0.4"/>
+              <metadata key="timelapse_type" value="0"/>
+              <metadata key="prediction" value="5450"/>
+              <metadata key="weight" value="26.91"/>
+              <metadata key="outside" value="false"/>
+              <metadata key="support_used" value="false"/>
+              <metadata key="label_object_enabled" value="true"/>
+              <object identify_id="930" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="1030" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="1130" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="1230" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="1330" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="1430" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="1530" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="1630" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="1730" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="1830" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="1930" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="2030" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="2130" name="FILENAME.3mf" skipped="false" />
+              <object identify_id="2230" name="FILENAME.3mf" skipped="false" />
+              <filament id="1" tray_info_idx="GFL99" type="PLA" color="#0DFF00" used_m="6.79" used_g="20.26" />
+              <filament id="2" tray_info_idx="GFL99" type="PLA" color="#000000" used_m="0.72" used_g="2.15" />
+              <filament id="6" tray_info_idx="GFL99" type="PLA" color="#0DFF00" used_m="1.20" used_g="3.58" />
+              <filament id="7" tray_info_idx="GFL99" type="PLA" color="#000000" used_m="0.31" used_g="0.92" />
+              <warning msg="bed_temperature_too_high_than_filament" level="1" error_code ="1000C001"  />
+            </plate>
+          </config>
+          """
+          
+          for meta in root.findall(".//plate/metadata"):
+            if meta.attrib.get("key") == "index":
+                metadata["plateID"] = meta.attrib.get("value", "")
+
+          usage = {}
+          filaments= {}
+          filamentId = 1
+          for plate in root.findall(".//plate"):
+            for filament in plate.findall(".//filament"):
+              used_g = filament.attrib.get("used_g")
+              #filamentId = int(filament.attrib.get("id"))
+              
+              usage[filamentId] = used_g
+              filaments[filamentId] = {"id": filamentId,
+                                       "tray_info_idx": filament.attrib.get("tray_info_idx"), 
+                                       "type":filament.attrib.get("type"), 
+                                       "color": filament.attrib.get("color"), 
+                                       "used_g": used_g, 
+                                       "used_m":filament.attrib.get("used_m")}
+              filamentId += 1
+
+          metadata["filaments"] = filaments
+          metadata["usage"] = usage
       else:
-        download3mfFromFTP(url.replace("ftp://", "").replace(".gcode",""), temp_file)
-      
-      temp_file.close()
-      metadata["model_path"] = url
-
-      parsed_url = urlparse(url)
-      metadata["file"] = os.path.basename(parsed_url.path)
-
-      print(f"3MF file downloaded and saved as {temp_file_name}.")
-
-      # Unzip the 3MF file
-      with zipfile.ZipFile(temp_file_name, 'r') as z:
-        # Check for the Metadata/slice_info.config file
-        slice_info_path = "Metadata/slice_info.config"
-        if slice_info_path in z.namelist():
-          with z.open(slice_info_path) as slice_info_file:
-            # Parse the XML content of the file
-            tree = ET.parse(slice_info_file)
-            root = tree.getroot()
-
-            # Extract id and used_g from each filament
-            """
-            <?xml version="1.0" encoding="UTF-8"?>
-            <config>
-              <header>
-                <header_item key="X-BBL-Client-Type" value="slicer"/>
-                <header_item key="X-BBL-Client-Version" value="01.10.01.50"/>
-              </header>
-              <plate>
-                <metadata key="index" value="1"/>
-                <metadata key="printer_model_id" value="N2S"/>
-                <metadata key="nozzle_diameters" value="0.4"/>
-                <metadata key="timelapse_type" value="0"/>
-                <metadata key="prediction" value="5450"/>
-                <metadata key="weight" value="26.91"/>
-                <metadata key="outside" value="false"/>
-                <metadata key="support_used" value="false"/>
-                <metadata key="label_object_enabled" value="true"/>
-                <object identify_id="930" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="1030" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="1130" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="1230" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="1330" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="1430" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="1530" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="1630" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="1730" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="1830" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="1930" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="2030" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="2130" name="FILENAME.3mf" skipped="false" />
-                <object identify_id="2230" name="FILENAME.3mf" skipped="false" />
-                <filament id="1" tray_info_idx="GFL99" type="PLA" color="#0DFF00" used_m="6.79" used_g="20.26" />
-                <filament id="2" tray_info_idx="GFL99" type="PLA" color="#000000" used_m="0.72" used_g="2.15" />
-                <filament id="6" tray_info_idx="GFL99" type="PLA" color="#0DFF00" used_m="1.20" used_g="3.58" />
-                <filament id="7" tray_info_idx="GFL99" type="PLA" color="#000000" used_m="0.31" used_g="0.92" />
-                <warning msg="bed_temperature_too_high_than_filament" level="1" error_code ="1000C001"  />
-              </plate>
-            </config>
-            """
-            
-            for meta in root.findall(".//plate/metadata"):
-              if meta.attrib.get("key") == "index":
-                  metadata["plateID"] = meta.attrib.get("value", "")
-
-            usage = {}
-            filaments= {}
-            filamentId = 1
-            for plate in root.findall(".//plate"):
-              for filament in plate.findall(".//filament"):
-                used_g = filament.attrib.get("used_g")
-                #filamentId = int(filament.attrib.get("id"))
-                
-                usage[filamentId] = used_g
-                filaments[filamentId] = {"id": filamentId,
-                                         "tray_info_idx": filament.attrib.get("tray_info_idx"), 
-                                         "type":filament.attrib.get("type"), 
-                                         "color": filament.attrib.get("color"), 
-                                         "used_g": used_g, 
-                                         "used_m":filament.attrib.get("used_m")}
-                filamentId += 1
-
-            metadata["filaments"] = filaments
-            metadata["usage"] = usage
-        else:
-          print(f"File '{slice_info_path}' not found in the archive.")
-          return {}
+        print(f"File '{slice_info_path}' not found in the archive.")
+        return {}
 
-        metadata["image"] = time.strftime('%Y%m%d%H%M%S') + ".png"
+      with z.open("Metadata/plate_"+metadata["plateID"]+".png") as source_file:
+        metadata["image"] = thumbnails.store_thumbnail(source_file.read())
 
-        with z.open("Metadata/plate_"+metadata["plateID"]+".png") as source_file:
-          with open(os.path.join(os.getcwd(), 'static', 'prints', metadata["image"]), 'wb') as target_file:
-              target_file.write(source_file.read())
+      gcode_path = "Metadata/plate_"+metadata["plateID"]+".gcode"
+      metadata["gcode_path"] = gcode_path
 
-        # Check for the Metadata/slice_info.config file
-        gcode_path = "Metadata/plate_"+metadata["plateID"]+".gcode"
-        metadata["gcode_path"] = gcode_path
-        if gcode_path in z.namelist():
-          with z.open(gcode_path) as gcode_file:
-            metadata["filamentOrder"] =  get_filament_order(gcode_file)
+    # One pass over the G-code; the layer tracker reuses the memoized result.
+    gcode_scan = scan_3mf_gcode(model_path, gcode_path)
+    if gcode_scan is not None:
+      metadata["filamentOrder"] = gcode_scan["filament_order"]
+      metadata["total_layers"] = gcode_scan["total_layers"]
 
-        print(metadata)
+    print(metadata)
 
-        return metadata
+    return metadata
 
   except requests.exceptions.RequestException as e:
     print(f"Error downloading file: {e}")
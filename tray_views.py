@@ -0,0 +1,137 @@
+import copy
+import itertools
+import threading
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
+import mqtt_bambulab
+import spoolman_service
+from config import CLEAR_ASSIGNMENT_WHEN_EMPTY, EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID
+
+
+def freeze(value):
+  """Read-only deep copy: dicts become mapping proxies and lists tuples."""
+  if isinstance(value, Mapping):
+    return MappingProxyType({key: freeze(item) for key, item in value.items()})
+  if isinstance(value, (list, tuple)):
+    return tuple(freeze(item) for item in value)
+  return value
+
+
+def thaw(value):
+  """Plain dicts and lists again, e.g. for JSON responses."""
+  if isinstance(value, Mapping):
+    return {key: thaw(item) for key, item in value.items()}
+  if isinstance(value, tuple):
+    return [thaw(item) for item in value]
+  return value
+
+
+def augment_tray(spool_list, tray_data, ams_id, tray_id):
+  spoolman_service.augmentTrayDataWithSpoolMan(spool_list, tray_data, ams_id, tray_id)
+  if tray_data.get("unmapped_bambu_tag"):
+    spoolman_service.clear_active_spool_for_tray(ams_id, tray_id)
+    spoolman_service.augmentTrayDataWithSpoolMan(spool_list, tray_data, ams_id, tray_id)
+  empty_condition = (
+      CLEAR_ASSIGNMENT_WHEN_EMPTY
+      and not tray_data.get("spool_material")
+      and not tray_data.get("unmapped_bambu_tag")
+  )
+  if empty_condition:
+    spoolman_service.clear_active_spool_for_tray(ams_id, tray_id)
+    mqtt_bambulab.clear_ams_tray_assignment(ams_id, tray_id)
+
+
+class TraySnapshot(NamedTuple):
+  """The AMS units and external tray matched against SpoolMan, as read-only mappings."""
+
+  version: tuple
+  vt_tray: Mapping
+  ams: tuple
+  issue: bool
+  # Per tray, and per AMS for its readings: a number that only changes with that part's data
+  revisions: Mapping
+
+  def revision(self, ams_id, tray_id=None) -> int | None:
+    if str(ams_id) == str(EXTERNAL_SPOOL_AMS_ID):
+      tray_id = EXTERNAL_SPOOL_ID
+    return self.revisions.get((str(ams_id), None if tray_id is None else str(tray_id)))
+
+  def tray(self, ams_id, tray_id) -> Mapping | None:
+    if str(ams_id) == str(EXTERNAL_SPOOL_AMS_ID):
+      return self.vt_tray or None
+    for ams in self.ams:
+      if str(ams["id"]) == str(ams_id):
+        for tray in ams.get("tray", ()):
+          if str(tray["id"]) == str(tray_id):
+            return tray
+    return None
+
+
+class TrayViews:
+  """
+  Builds a TraySnapshot when the reported trays or the spool inventory change
+  and hands out the same immutable snapshot to every request until then.
+
+  The MQTT dicts are copied before they are matched, so requests never write
+  to the printer state shared with the MQTT thread.
+  """
+
+  def __init__(self):
+    self._snapshot = None
+    self._lock = threading.Lock()
+    self._parts = {}
+    self._revisions = itertools.count(1)
+
+  def current(self) -> TraySnapshot:
+    # Refetches the spool list once it is older than the max age; a different list bumps its version
+    spool_list = mqtt_bambulab.fetchSpools(cached=True, max_age=spoolman_service.SPOOLS_MAX_AGE_SECONDS)
+    version = (mqtt_bambulab.getTrayVersion(), spoolman_service.get_spools_version())
+    snapshot = self._snapshot
+    if snapshot is not None and snapshot.version == version:
+      return snapshot
+
+    with self._lock:
+      if self._snapshot is None or self._snapshot.version != version:
+        self._snapshot = self._build(version, spool_list)
+      return self._snapshot
+
+  def clear(self) -> None:
+    with self._lock:
+      self._snapshot = None
+      self._parts = {}
+
+  def _build(self, version, spool_list) -> TraySnapshot:
+    last_ams_config = mqtt_bambulab.getLastAMSConfig()
+    ams_data = copy.deepcopy(last_ams_config.get("ams", []))
+    vt_tray_data = copy.deepcopy(last_ams_config.get("vt_tray", {}))
+
+    issue = False
+    #TODO: Fix issue when external spool info is reset via bambulab interface
+    augment_tray(spool_list, vt_tray_data, EXTERNAL_SPOOL_AMS_ID, EXTERNAL_SPOOL_ID)
+    issue |= vt_tray_data["issue"]
+
+    for ams in ams_data:
+      for tray in ams["tray"]:
+        augment_tray(spool_list, tray, ams["id"], tray["id"])
+        issue |= tray["issue"]
+
+    vt_tray, ams_units = freeze(vt_tray_data), freeze(ams_data)
+    parts = {(str(EXTERNAL_SPOOL_AMS_ID), str(EXTERNAL_SPOOL_ID)): vt_tray}
+    for ams in ams_units:
+      parts[(str(ams["id"]), None)] = {key: value for key, value in ams.items() if key != "tray"}
+      for tray in ams["tray"]:
+        parts[(str(ams["id"]), str(tray["id"]))] = tray
+    return TraySnapshot(version, vt_tray, ams_units, issue, MappingProxyType(self._revise(parts)))
+
+  def _revise(self, parts) -> dict:
+    # A humidity change rebuilds the snapshot but keeps the revision of every unchanged tray
+    revisions = {}
+    for key, value in parts.items():
+      previous = self._parts.get(key)
+      revisions[key] = previous[0] if previous is not None and previous[1] == value else next(self._revisions)
+    self._parts = {key: (revisions[key], value) for key, value in parts.items()}
+    return revisions
+
+
+TRAY_VIEWS = TrayViews()